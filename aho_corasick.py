@@ -0,0 +1,65 @@
+"""
+Aho-Corasick multi-pattern substring search.
+
+Builds one automaton from a list of patterns; a single left-to-right pass
+over a text then reports every pattern that occurs in it, however many
+patterns there are and however they overlap. Used by KeywordMatcher for
+multi-word plain keywords, which match as substrings of the page text.
+"""
+
+from collections import deque
+
+
+class AhoCorasick:
+    """Automaton over a fixed list of patterns. search() returns the indices of the patterns found."""
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._goto = [{}] # node -> {char: node}
+        self._fail = [0]
+        self._out = [()] # node -> indices of the patterns ending here (including via fail links)
+
+        for index, pattern in enumerate(self.patterns):
+            if not pattern:
+                continue
+            node = 0
+            for char in pattern:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                    self._goto[node][char] = next_node
+                node = next_node
+            self._out[node] += (index,)
+
+        # Breadth-first: a node's fail link is the longest proper suffix that is also a trie path
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] += self._out[self._fail[child]]
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def search(self, text):
+        """Set of indices of the patterns that occur in `text` (one pass)."""
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        node = 0
+        for char in text:
+            next_node = goto[node].get(char)
+            while next_node is None and node:
+                node = fail[node]
+                next_node = goto[node].get(char)
+            node = next_node or 0
+            if out[node]:
+                found.update(out[node])
+        return found
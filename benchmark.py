@@ -0,0 +1,529 @@
+"""
+Stand-alone micro-benchmarks for the scraper's hot paths.
+
+Usage:
+    python benchmark.py fetch [--requests N] [--concurrency N] [--proxy URL] [--url URL]
+    python benchmark.py parse [--corpus DIR] [--repeat N] [--max-text-chars N]
+    python benchmark.py keywords [--sizes 10,100,...] [--text-kb N] [--phrase-share F]
+    python benchmark.py links [--anchors N] [--hosts N] [--repeat N]
+    python benchmark.py pull [--pages N] [--keywords N] [--repeat N]
+    python benchmark.py dedup [--sites N] [--max-mirrors N] [--distance N]
+
+Each sub-command prints a small before/after table. Nothing here touches the
+GUI or the Tor process; pass --proxy/--url to point a benchmark at a real
+SocksPort instead of the built-in local HTTP server.
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+
+# --- Local HTTP server (keep-alive) used as a default fetch target ---
+
+SAMPLE_HTML = (
+    b"<html><head><title>Benchmark Page</title></head><body>"
+    + b"<p>lorem ipsum dolor sit amet</p>" * 200
+    + b"<a href='/next'>next</a></body></html>"
+)
+
+async def _handle_http_client(reader, writer):
+    """Answers every request on the connection with SAMPLE_HTML (HTTP/1.1 keep-alive)."""
+    try:
+        while True:
+            request = await reader.readuntil(b"\r\n\r\n")
+            if not request:
+                break
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/html; charset=utf-8\r\n"
+                b"Content-Length: " + str(len(SAMPLE_HTML)).encode() + b"\r\n"
+                b"Connection: keep-alive\r\n\r\n" + SAMPLE_HTML
+            )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def start_local_http_server():
+    """Starts the local server on a random port. Returns (server, base_url)."""
+    server = await asyncio.start_server(_handle_http_client, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"http://127.0.0.1:{port}"
+
+def print_results(title, rows):
+    """Prints a list of (label, value) rows under a title."""
+    print(f"\n=== {title} ===")
+    width = max(len(label) for label, _ in rows)
+    for label, value in rows:
+        print(f"  {label.ljust(width)}  {value}")
+
+# --- fetch: per-request AsyncSession vs SessionPool ---
+
+async def _run_fetch_benchmark(url, proxies, total_requests, concurrency, use_pool):
+    from curl_cffi.requests import AsyncSession
+    from session_pool import SessionPool
+
+    pool = SessionPool(proxies, max_concurrency=concurrency) if use_pool else None
+    queue = asyncio.Queue()
+    for i in range(total_requests):
+        queue.put_nowait(f"{url}/page{i}")
+    failures = 0
+
+    async def worker():
+        nonlocal failures
+        while True:
+            try:
+                target = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                if pool:
+                    async with pool.borrow(target) as lease:
+                        response = await lease.session.get(target, timeout=60, proxy=lease.proxy)
+                else:
+                    async with AsyncSession() as session:
+                        response = await session.get(target, timeout=60, proxy=random.choice(proxies))
+                if response.status_code != 200:
+                    failures += 1
+            except Exception:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    if pool:
+        await pool.close()
+    return elapsed, failures
+
+async def bench_fetch(args):
+    server = None
+    url = args.url
+    if not url:
+        server, url = await start_local_http_server()
+    proxies = [args.proxy] if args.proxy else [None]
+
+    rows = []
+    for label, use_pool in (("per-request AsyncSession", False), ("SessionPool", True)):
+        elapsed, failures = await _run_fetch_benchmark(url, proxies, args.requests, args.concurrency, use_pool)
+        rps = args.requests / elapsed if elapsed else 0
+        rows.append((label, f"{rps:8.1f} req/s  ({elapsed:.2f}s, {failures} failures)"))
+
+    if server:
+        server.close()
+        await server.wait_closed()
+    print_results(f"fetch: {args.requests} requests, concurrency {args.concurrency}", rows)
+
+# --- parse: single-pass lxml engine vs BeautifulSoup ---
+
+CORPUS_SUFFIXES = {'.html', '.htm', '.txt'}
+
+def build_sample_corpus(pages=50, seed=1):
+    """Synthetic onion-directory-like pages, used when no --corpus is given."""
+    rng = random.Random(seed)
+    words = "market forum wiki mirror login vendor escrow bitcoin search index hidden service link list форум рынок".split()
+    corpus = []
+    for i in range(pages):
+        parts = [f"<html><head><title>Directory {i}</title><style>body{{color:#333}}</style>"
+                 f"<script>var x = '<a href=\"/no\">';</script></head><body>"
+                 f"<nav>{' '.join(f'<a href=/c/{w}>{w}</a>' for w in words)}</nav>"]
+        for j in range(rng.randint(50, 400)):
+            host = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz234567") for _ in range(56))
+            text = " ".join(rng.choice(words) for _ in range(rng.randint(3, 20)))
+            parts.append(f"<div class='row'><p>{text} &amp; more</p><!-- row {j} -->"
+                         f"<a href='http://{host}.onion/{j}'>{rng.choice(words)}</a> <span>Verified mirror</span></div>")
+        parts.append("<footer>Copyright Hidden Directory. All mirrors are listed above.</footer></body></html>")
+        corpus.append((f"sample-{i}", "".join(parts).encode('utf-8')))
+    return corpus
+
+def load_corpus(directory):
+    """Every .html/.htm/.txt file under `directory`, as raw bytes (what the worker receives)."""
+    corpus = []
+    for path in sorted(Path(directory).rglob("*")):
+        if path.is_file() and path.suffix.lower() in CORPUS_SUFFIXES:
+            corpus.append((path.name, path.read_bytes()))
+    return corpus
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def _measure_engine(extract, corpus, repeat):
+    """Per-page CPU seconds (best of `repeat`) and per-page peak traced memory in bytes."""
+    cpu_times, peaks = [], []
+    for _, page in corpus:
+        best = None
+        for _ in range(repeat):
+            start = time.process_time()
+            extract(page)
+            elapsed = time.process_time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        cpu_times.append(best)
+
+    # Separate pass: tracemalloc slows allocation down and would skew the timings
+    tracemalloc.start()
+    for _, page in corpus:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        result = extract(page)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        del result
+    tracemalloc.stop()
+    return cpu_times, peaks
+
+def bench_parse(args):
+    from keyword_matcher import KeywordMatcher
+    from page_parser import TextOptions, extract_page_bs4, extract_page_lxml, sniff_charset
+
+    corpus = load_corpus(args.corpus) if args.corpus else build_sample_corpus()
+    if not corpus:
+        print(f"No .html/.htm/.txt files found under {args.corpus}.")
+        return
+    total_bytes = sum(len(page) for _, page in corpus)
+
+    # Before: the worker decoded every body to a str first. After: bytes in, decoded by libxml2.
+    def decoded(extract):
+        return lambda body: extract(body.decode('utf-8', errors='ignore'))
+    def bytes_in(extract, text_options=None):
+        return lambda body: extract(body, sniff_charset(body), text_options)
+    text_options = TextOptions(strip_boilerplate=True, max_chars=args.max_text_chars)
+    engines = (
+        ("bs4, str in", decoded(extract_page_bs4)),
+        ("lxml, str in", decoded(extract_page_lxml)),
+        ("lxml, bytes in", bytes_in(extract_page_lxml)),
+        ("lxml, bounded text", bytes_in(extract_page_lxml, text_options)),
+    )
+    mismatches = [name for name, page in corpus if engines[0][1](page) != engines[2][1](page)]
+    # Same boilerplate stripping and cap in both engines
+    mismatches += [name for name, page in corpus
+                   if bytes_in(extract_page_bs4, text_options)(page) != engines[3][1](page)]
+
+    rows = []
+    for label, extract in engines:
+        cpu_times, peaks = _measure_engine(extract, corpus, args.repeat)
+        rows.append((f"{label} CPU/page", f"median {statistics.median(cpu_times) * 1000:7.2f} ms  "
+                                          f"p95 {_percentile(cpu_times, 0.95) * 1000:7.2f} ms  "
+                                          f"({len(corpus) / sum(cpu_times):6.1f} pages/s)"))
+        rows.append((f"{label} peak memory/page", f"median {statistics.median(peaks) / 1024:8.1f} KiB  "
+                                                  f"max {max(peaks) / 1024:8.1f} KiB"))
+    # Text size drives page_data storage, exports and keyword-scan time
+    keyword_matcher = KeywordMatcher(["mirror", "hidden service", "REGEX: escrow\\s+\\w+"])
+    for label, extract in (engines[2], engines[3]):
+        texts = [extract(page)[1] for _, page in corpus]
+        text_sizes = [len(text) for text in texts]
+        rows.append((f"{label} text/page", f"median {statistics.median(text_sizes) / 1024:8.1f} K chars  "
+                                           f"total {sum(text_sizes) / 1024 / 1024:6.2f} M chars"))
+        scan_seconds, _ = _best_time(lambda: [keyword_matcher.find_matches(text) for text in texts], args.repeat)
+        rows.append((f"{label} keyword scan/page", f"mean {scan_seconds / len(texts) * 1000:7.2f} ms"))
+    rows.append(("output mismatches (bs4 vs lxml)", f"{len(mismatches)}" + (f" (e.g. {mismatches[0]})" if mismatches else "")))
+    print_results(f"parse: {len(corpus)} pages, {total_bytes / 1024 / 1024:.1f} MiB of HTML, best of {args.repeat}", rows)
+    print("  (peak memory is Python-heap memory traced by tracemalloc; libxml2's own buffers are not included)")
+
+# --- keywords: per-keyword substring scans vs one-pass plain keyword matching ---
+
+def _random_word(rng, length):
+    return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(length))
+
+def build_keyword_list(rng, size, phrase_share, vocabulary):
+    """`size` plain keywords: mostly vocabulary words, the rest made up; `phrase_share` of them two-word phrases."""
+    keywords = set()
+    while len(keywords) < size:
+        word = rng.choice(vocabulary) if rng.random() < 0.5 else _random_word(rng, rng.randint(4, 10))
+        if rng.random() < phrase_share:
+            word = f"{word} {rng.choice(vocabulary)}"
+        keywords.add(word)
+    return list(keywords)
+
+def _scan_per_keyword(keywords, page_text):
+    """The previous matcher: one substring scan of the padded text per keyword."""
+    page_text_padded = f" {page_text.lower()} "
+    found = []
+    for keyword in keywords:
+        keyword_lower = keyword.lower()
+        term = keyword_lower if ' ' in keyword_lower else f" {keyword_lower} "
+        if term in page_text_padded:
+            found.append(keyword)
+    return found
+
+def _best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def bench_keywords(args):
+    from keyword_matcher import KeywordMatcher
+
+    rng = random.Random(7)
+    vocabulary = [_random_word(rng, rng.randint(3, 9)) for _ in range(5000)]
+    words, size = [], 0
+    while size < args.text_kb * 1024:
+        word = rng.choice(vocabulary)
+        words.append(word)
+        size += len(word) + 1
+    page_text = " ".join(words)
+
+    rows = []
+    for count in (int(size) for size in args.sizes.split(",")):
+        keywords = build_keyword_list(rng, count, args.phrase_share, vocabulary)
+        build_time, matcher = _best_time(lambda: KeywordMatcher(keywords), 1)
+        repeat = args.repeat if count <= 10000 else 1
+        old_time, old_found = _best_time(lambda: _scan_per_keyword(keywords, page_text), repeat)
+        new_time, new_found = _best_time(lambda: matcher.find_plain(page_text), repeat)
+        same = "same hits" if sorted(old_found) == sorted(new_found) else "HITS DIFFER"
+        rows.append((f"{count:>7} keywords", f"per-keyword {old_time * 1000:9.1f} ms  one-pass {new_time * 1000:7.1f} ms  "
+                                            f"(build {build_time * 1000:7.1f} ms, {len(new_found)} hits, {same})"))
+    print_results(f"keywords: plain keyword matching on {len(page_text) / 1024:.0f} KiB of page text, "
+                  f"{args.phrase_share:.0%} phrases, best of {args.repeat}", rows)
+
+# --- links: per-href urljoin/urlparse loop vs LinkResolver ---
+
+def build_link_farm_hrefs(rng, anchors, hosts):
+    """Hrefs of a link-farm page: absolute onion links over `hosts` hosts, relative links, junk and files."""
+    onion_hosts = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz234567") for _ in range(56)) + ".onion"
+                   for _ in range(hosts)]
+    hrefs = []
+    for i in range(anchors):
+        kind = rng.random()
+        if kind < 0.6:
+            hrefs.append(f"http://{rng.choice(onion_hosts)}/page/{i}")
+        elif kind < 0.8:
+            hrefs.append(f"/local/{i}?sort=new")
+        elif kind < 0.85:
+            hrefs.append(f"relative/{i}")
+        elif kind < 0.9:
+            hrefs.append(f"http://{rng.choice(onion_hosts)}/files/{i}.jpg")
+        elif kind < 0.95:
+            hrefs.append(f"http://{'a' * 16}.onion/{i}") # Junk host
+        else:
+            hrefs.append(f"https://clearnet{i % 50}.example.com/{i}")
+    return hrefs
+
+def _resolve_per_href(base_url, hrefs, onion_only_mode):
+    """The previous link loop of parse_page_content."""
+    from urllib.parse import urljoin, urlparse
+    from link_extractor import NON_HTML_EXTENSIONS
+    from utils import JUNK_URL_REGEX
+
+    found_links = set()
+    for href in hrefs:
+        absolute_link = urljoin(base_url, href).rstrip('/')
+        if JUNK_URL_REGEX.search(urlparse(absolute_link).netloc):
+            continue
+        parsed_link = urlparse(absolute_link)
+        if any(parsed_link.path.lower().endswith(ext) for ext in NON_HTML_EXTENSIONS):
+            continue
+        if parsed_link.scheme in ['http', 'https']:
+            if not onion_only_mode or parsed_link.netloc.endswith('.onion'):
+                found_links.add(absolute_link)
+    return found_links
+
+def bench_links(args):
+    from link_extractor import LinkResolver, netloc_allowed
+    from utils import is_junk_netloc
+
+    hrefs = build_link_farm_hrefs(random.Random(11), args.anchors, args.hosts)
+    base_url = "http://" + "b" * 7 + "xyzxyzxyzxyzxyzxyzxyzxyzxyzxyzxyzxyzxyzxyzxyzxyzxy.onion/links/index.html"
+
+    rows = []
+    for onion_only_mode in (False, True):
+        old_time, old_links = _best_time(lambda: _resolve_per_href(base_url, hrefs, onion_only_mode), args.repeat)
+        netloc_allowed.cache_clear()
+        is_junk_netloc.cache_clear()
+        cold_time, new_links = _best_time(lambda: LinkResolver(base_url, onion_only_mode).resolve(hrefs), 1)
+        warm_time, _ = _best_time(lambda: LinkResolver(base_url, onion_only_mode).resolve(hrefs), args.repeat)
+        same = "same links" if old_links == new_links else "LINKS DIFFER"
+        rows.append((f"onion_only={onion_only_mode}",
+                     f"per-href {old_time * 1000:7.1f} ms  LinkResolver {cold_time * 1000:6.1f} ms cold / "
+                     f"{warm_time * 1000:6.1f} ms warm  ({len(new_links)} links, {same})"))
+    print_results(f"links: {args.anchors} anchors over {args.hosts} hosts, best of {args.repeat}", rows)
+
+# --- pull: keyword threshold pull from stored hits vs. re-reading keyword_match ---
+
+def build_pull_database(path, pages, keywords, rng):
+    """A links table of `pages` scraped pages with keyword matches and their stored hits."""
+    from database import DatabaseManager
+    from keyword_matcher import KeywordMatcher
+
+    matcher = KeywordMatcher(keywords)
+    vocabulary = [keyword.lower() for keyword in keywords] + [_random_word(rng, 6) for _ in range(len(keywords))]
+    db = DatabaseManager(path)
+    urls = [f"http://{_random_word(rng, 16)}.onion/{i}" for i in range(pages)]
+    db.add_links(urls)
+    updates, hits = [], []
+    for url in urls:
+        text = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(20, 200)))
+        keyword_match, keyword_hits = matcher.match_hits(text, url)
+        updates.append((1, "Title", keyword_match, text, url))
+        hits.append((url, keyword_hits))
+    db.update_links_batch(updates)
+    db.save_keyword_hits_batch(hits)
+    return db, matcher
+
+def bench_pull(args):
+    import os
+    import tempfile
+
+    rng = random.Random(13)
+    keywords = [_random_word(rng, rng.randint(4, 9)) for _ in range(args.keywords - args.keywords // 5)]
+    keywords += [f"REGEX: {_random_word(rng, 3)}\\w+" for _ in range(args.keywords // 5)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        db, matcher = build_pull_database(os.path.join(directory, "pull.db"), args.pages, keywords, rng)
+        rows = []
+        for threshold in (1, 3):
+            hits_time, hits_count = _best_time(lambda: db.filter_links_by_keyword_threshold_to_new_db(
+                os.path.join(directory, "hits.db"), matcher, threshold), args.repeat)
+            # Same database as if it had been scraped before hits were stored
+            db.conn.execute("ALTER TABLE keyword_hits RENAME TO keyword_hits_saved")
+            db.conn.execute("CREATE TABLE keyword_hits AS SELECT * FROM keyword_hits_saved WHERE 0")
+            rescan_time, rescan_count = _best_time(lambda: db.filter_links_by_keyword_threshold_to_new_db(
+                os.path.join(directory, "rescan.db"), matcher, threshold), args.repeat)
+            db.conn.execute("DROP TABLE keyword_hits")
+            db.conn.execute("ALTER TABLE keyword_hits_saved RENAME TO keyword_hits")
+            same = "same rows" if hits_count == rescan_count else "ROW COUNTS DIFFER"
+            rows.append((f"threshold {threshold}", f"keyword_match rescan {rescan_time * 1000:8.1f} ms  "
+                                                    f"stored hits {hits_time * 1000:7.1f} ms  ({hits_count} pages, {same})"))
+        db.close()
+    print_results(f"pull: {args.pages} pages, {len(keywords)} keywords, best of {args.repeat}", rows)
+
+# --- dedup: near-duplicate detection on a mirror-heavy crawl ---
+
+def build_mirror_corpus(rng, sites, max_mirrors):
+    """(group, html bytes) pages: each site, its mirrors with a few words changed, and templated error pages."""
+    words = "market forum wiki mirror login vendor escrow bitcoin search index hidden service link list".split()
+    words += [_random_word(rng, rng.randint(3, 9)) for _ in range(2000)]
+    pages = []
+    for site in range(sites):
+        text = [rng.choice(words) for _ in range(rng.randint(150, 600))]
+        links = [f"http://{_random_word(rng, 56)}.onion/{i}" for i in range(rng.randint(10, 60))]
+        anchors = "".join(f"<a href='{link}'>{rng.choice(words)}</a> " for link in links)
+        for copy in range(1 + rng.randint(0, max_mirrors)):
+            copy_text = list(text)
+            if copy:
+                for _ in range(rng.randint(1, 3)): # Mirror address, counters, a changed word
+                    copy_text[rng.randrange(len(copy_text))] = _random_word(rng, 8)
+            html = f"<html><head><title>Site {site}</title></head><body><p>{' '.join(copy_text)}</p>{anchors}</body></html>"
+            pages.append((f"site-{site}", html.encode('utf-8')))
+    for i in range(sites // 2):
+        html = (f"<html><body><h1>503 Service Unavailable</h1><p>This hidden service is temporarily down for "
+                f"maintenance. Please try again later. Request id {_random_word(rng, 12)}</p></body></html>")
+        pages.append(("error-page", html.encode('utf-8')))
+    rng.shuffle(pages)
+    return pages
+
+def bench_dedup(args):
+    from link_extractor import LinkResolver
+    from near_duplicates import NearDuplicateIndex, duplicate_page_data, simhash
+    from page_parser import TextOptions, extract_page_lxml, sniff_charset
+
+    corpus = build_mirror_corpus(random.Random(17), args.sites, args.max_mirrors)
+    text_options = TextOptions()
+    parsed = []
+    for index, (group, body) in enumerate(corpus):
+        _, text, hrefs = extract_page_lxml(body, sniff_charset(body), text_options)
+        url = f"http://page{index}.onion"
+        parsed.append((group, url, text, LinkResolver(url).resolve(hrefs)))
+
+    start = time.process_time()
+    fingerprints = [simhash(text) for _, _, text, _ in parsed]
+    fingerprint_seconds = time.process_time() - start
+
+    index = NearDuplicateIndex(max_distance=args.distance)
+    canonical_group = {}
+    stored_chars = {"copy": 0, "reference": 0}
+    queued_links = {"all": set(), "skip": set()}
+    flagged = false_positives = 0
+    start = time.process_time()
+    for (group, url, text, links), fingerprint in zip(parsed, fingerprints):
+        duplicate_of = index.check(url, fingerprint) if fingerprint is not None else None
+        stored_chars["copy"] += len(text)
+        queued_links["all"].update(links)
+        if duplicate_of:
+            flagged += 1
+            false_positives += canonical_group[duplicate_of] != group
+            stored_chars["reference"] += len(duplicate_page_data(duplicate_of))
+        else:
+            canonical_group[url] = group
+            stored_chars["reference"] += len(text)
+            queued_links["skip"].update(links)
+    check_seconds = time.process_time() - start
+
+    groups = {group for group, _ in corpus}
+    rows = [
+        ("fingerprint", f"{fingerprint_seconds / len(corpus) * 1000:7.2f} ms/page  "
+                        f"index check {check_seconds / len(corpus) * 1000:6.3f} ms/page"),
+        ("near-duplicates flagged", f"{flagged} of {len(corpus) - len(groups)} copies  ({false_positives} false positives)"),
+        ("page_data stored", f"{stored_chars['copy'] / 1024 / 1024:6.2f} M chars as copies -> "
+                             f"{stored_chars['reference'] / 1024 / 1024:6.2f} M chars with references"),
+        ("links queued", f"{sum(len(links) for *_, links in parsed)} inserted -> "
+                         f"{sum(len(links) for (_, url, _, links) in parsed if url in canonical_group)} "
+                         f"with skip_duplicate_links ({len(queued_links['all'])} -> {len(queued_links['skip'])} distinct)"),
+    ]
+    print_results(f"dedup: {len(corpus)} pages from {args.sites} sites and their mirrors, "
+                  f"max distance {args.distance}", rows)
+
+def main():
+    parser = argparse.ArgumentParser(description="Scraper micro-benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    fetch_parser = sub.add_parser("fetch", help="Requests/sec with and without the session pool")
+    fetch_parser.add_argument("--requests", type=int, default=2000)
+    fetch_parser.add_argument("--concurrency", type=int, default=150)
+    fetch_parser.add_argument("--proxy", default=None, help="e.g. socks5h://127.0.0.1:9100")
+    fetch_parser.add_argument("--url", default=None, help="Target base URL (default: local server)")
+
+    parse_parser = sub.add_parser("parse", help="Per-page CPU time and peak memory of the HTML extraction engines")
+    parse_parser.add_argument("--corpus", default=None,
+                              help="Directory of saved pages (.html/.htm/.txt, searched recursively; default: synthetic pages)")
+    parse_parser.add_argument("--repeat", type=int, default=3, help="Timed runs per page (the best one counts)")
+    parse_parser.add_argument("--max-text-chars", type=int, default=200000,
+                              help="Text cap for the bounded-text run (max_page_text_chars; 0 = no cap)")
+
+    keywords_parser = sub.add_parser("keywords", help="Plain keyword matching time vs. keyword-list size")
+    keywords_parser.add_argument("--sizes", default="10,100,1000,10000,100000", help="Comma-separated keyword counts")
+    keywords_parser.add_argument("--text-kb", type=int, default=100, help="Size of the page text to search")
+    keywords_parser.add_argument("--phrase-share", type=float, default=0.2, help="Share of multi-word keywords")
+    keywords_parser.add_argument("--repeat", type=int, default=3, help="Timed runs per size (the best one counts)")
+
+    links_parser = sub.add_parser("links", help="Link resolution and filtering time on a link-farm page")
+    links_parser.add_argument("--anchors", type=int, default=20000)
+    links_parser.add_argument("--hosts", type=int, default=500, help="Distinct onion hosts linked to")
+    links_parser.add_argument("--repeat", type=int, default=5, help="Timed runs (the best one counts)")
+
+    pull_parser = sub.add_parser("pull", help="Keyword threshold pull time from stored hits vs. keyword_match")
+    pull_parser.add_argument("--pages", type=int, default=10000)
+    pull_parser.add_argument("--keywords", type=int, default=200, help="Keyword list size (a fifth of them regexes)")
+    pull_parser.add_argument("--repeat", type=int, default=3, help="Timed runs (the best one counts)")
+
+    dedup_parser = sub.add_parser("dedup", help="Near-duplicate detection, storage and link savings on mirrored sites")
+    dedup_parser.add_argument("--sites", type=int, default=500)
+    dedup_parser.add_argument("--max-mirrors", type=int, default=4, help="Mirrors per site (0 to this many)")
+    dedup_parser.add_argument("--distance", type=int, default=3, help="near_duplicate_distance")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.command == "fetch":
+        asyncio.run(bench_fetch(args))
+    elif args.command == "parse":
+        bench_parse(args)
+    elif args.command == "keywords":
+        bench_keywords(args)
+    elif args.command == "links":
+        bench_links(args)
+    elif args.command == "pull":
+        bench_pull(args)
+    elif args.command == "dedup":
+        bench_dedup(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Adaptive (AIMD) concurrency control for the scraper workers.
+
+The scraper still starts `batch_size` worker coroutines, but each one must
+take a fetch slot from the AdaptiveConcurrencyController before it touches
+the network. The number of slots grows while throughput keeps rising and
+shrinks multiplicatively when Tor circuits start timing out, so the
+user-entered "Concurrent Requests" value acts as a ceiling rather than a
+fixed level.
+"""
+
+import logging
+import time
+import asyncio
+import statistics
+from collections import deque
+
+# Outcome labels passed to release()
+OUTCOME_SUCCESS = "success"
+OUTCOME_TIMEOUT = "timeout"
+OUTCOME_ERROR = "error"
+# Timeout on a host that never answered or whose circuit is already open.
+# Dead onions time out however idle Tor is, so this is no congestion signal.
+OUTCOME_HOST_TIMEOUT = "host timeout"
+
+# --- Tuning constants ---
+ADJUST_INTERVAL_SECONDS = 5.0     # How often the limit is re-evaluated
+MIN_SAMPLES_PER_WINDOW = 10       # Don't react to a handful of requests
+TIMEOUT_RATE_BACKOFF = 0.25       # Timeout share that triggers a decrease
+DECREASE_FACTOR = 0.7             # Multiplicative decrease on congestion
+LATENCY_BACKOFF_FACTOR = 2.5      # p50 vs. baseline that counts as congestion
+THROUGHPUT_DROP_FACTOR = 0.8      # Throughput fall that, with high latency, counts as congestion
+
+
+class AdaptiveConcurrencyController:
+    """
+    Additive-increase / multiplicative-decrease limiter for in-flight fetches.
+
+    Starts in slow-start (limit doubles every window while the workers are
+    saturated), then switches to additive increase after the first congestion
+    signal. Congestion is a high rate of timeouts (OUTCOME_TIMEOUT, not
+    OUTCOME_HOST_TIMEOUT), or a p50 latency far above the best window seen so
+    far combined with falling throughput.
+    """
+    def __init__(self, ceiling, floor=8, enabled=True, stats_dict=None, stats_lock=None):
+        self.ceiling = max(1, int(ceiling))
+        self.floor = max(1, min(int(floor), self.ceiling))
+        self.enabled = enabled
+        self.limit = max(self.floor, self.ceiling // 4) if enabled else self.ceiling
+        self.additive_step = max(1, self.ceiling // 20)
+        self.slow_start = True
+
+        self.in_flight = 0
+        self._waiters = deque()
+
+        self.stats_dict = stats_dict
+        self.stats_lock = stats_lock
+
+        self._baseline_latency = None
+        self._last_throughput = None
+        self._reset_window()
+        self._publish()
+
+    def _reset_window(self):
+        self._window_start = time.monotonic()
+        self._window_latencies = []
+        self._window_timeouts = 0
+        self._window_errors = 0
+        self._window_host_timeouts = 0
+        self._window_bytes = 0
+        self._window_saturated = False
+
+    # --- Slot gate ---
+
+    async def acquire(self):
+        """Waits until a fetch slot is free and takes it."""
+        while self.in_flight >= self.limit:
+            self._window_saturated = True
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                elif waiter.done() and not waiter.cancelled():
+                    # We were woken but won't use the slot; pass it on
+                    self._wake_waiters()
+                raise
+        self.in_flight += 1
+        if self.in_flight >= self.limit:
+            self._window_saturated = True
+
+    def release(self, latency=None, outcome=OUTCOME_SUCCESS, nbytes=0):
+        """Returns a slot and records how the fetch went."""
+        self.in_flight = max(0, self.in_flight - 1)
+
+        if outcome == OUTCOME_SUCCESS and latency is not None:
+            self._window_latencies.append(latency)
+            self._window_bytes += nbytes
+        elif outcome == OUTCOME_TIMEOUT:
+            self._window_timeouts += 1
+        elif outcome == OUTCOME_ERROR:
+            self._window_errors += 1
+        elif outcome == OUTCOME_HOST_TIMEOUT:
+            self._window_host_timeouts += 1
+
+        if time.monotonic() - self._window_start >= ADJUST_INTERVAL_SECONDS:
+            self._adjust()
+        self._wake_waiters()
+
+    def _wake_waiters(self):
+        free_slots = self.limit - self.in_flight
+        while free_slots > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free_slots -= 1
+
+    # --- AIMD ---
+
+    def _adjust(self):
+        elapsed = max(0.001, time.monotonic() - self._window_start)
+        successes = len(self._window_latencies)
+        completions = successes + self._window_timeouts + self._window_errors + self._window_host_timeouts
+
+        if completions < MIN_SAMPLES_PER_WINDOW:
+            # Not enough signal yet. Keep accumulating unless the window is stale.
+            if elapsed < ADJUST_INTERVAL_SECONDS * 6:
+                return
+            self._reset_window()
+            return
+
+        timeout_rate = self._window_timeouts / completions
+        throughput = successes / elapsed
+        p50_latency = statistics.median(self._window_latencies) if self._window_latencies else None
+
+        if p50_latency is not None:
+            if self._baseline_latency is None or p50_latency < self._baseline_latency:
+                self._baseline_latency = p50_latency
+
+        old_limit = self.limit
+        reason = None
+
+        if self.enabled:
+            latency_congested = (
+                p50_latency is not None and self._baseline_latency
+                and p50_latency > self._baseline_latency * LATENCY_BACKOFF_FACTOR
+                and self._last_throughput is not None
+                and throughput < self._last_throughput * THROUGHPUT_DROP_FACTOR
+            )
+
+            if timeout_rate >= TIMEOUT_RATE_BACKOFF or latency_congested:
+                self.limit = max(self.floor, int(self.limit * DECREASE_FACTOR))
+                self.slow_start = False
+                reason = "timeouts" if timeout_rate >= TIMEOUT_RATE_BACKOFF else "latency"
+            elif self._window_saturated:
+                if self.slow_start:
+                    self.limit = min(self.ceiling, self.limit * 2)
+                else:
+                    self.limit = min(self.ceiling, self.limit + self.additive_step)
+                reason = "slow start" if self.slow_start else "increase"
+
+        if self.limit != old_limit:
+            latency_str = f"{p50_latency:.1f}s" if p50_latency is not None else "n/a"
+            logging.info(f"[CONCURRENCY] Limit {old_limit} -> {self.limit} / {self.ceiling} ({reason}) | "
+                         f"timeouts {timeout_rate:.0%}, p50 {latency_str}, {throughput:.1f} pages/s")
+
+        self._last_throughput = throughput
+        self._publish(timeout_rate=timeout_rate, p50_latency=p50_latency,
+                      throughput=throughput, bytes_per_sec=self._window_bytes / elapsed)
+        self._reset_window()
+
+    def _publish(self, **window_stats):
+        """Copies the current state into the shared stats dict for the GUI."""
+        if self.stats_dict is None or self.stats_lock is None:
+            return
+        snapshot = {
+            "limit": self.limit,
+            "ceiling": self.ceiling,
+            "in_flight": self.in_flight,
+            "adaptive": self.enabled,
+        }
+        snapshot.update(window_stats)
+        with self.stats_lock:
+            self.stats_dict['concurrency'] = snapshot
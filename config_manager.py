@@ -5,6 +5,51 @@ Manages loading and saving the JSON configuration file.
 import json
 import logging
 import os
+import sys
+
+# Advanced scraper settings. These have no widget in the main window; they
+# are read from (and written back to) the config file as-is.
+ADVANCED_DEFAULTS = {
+    'sessions_per_proxy': 2,
+    'max_page_bytes': 10 * 1024 * 1024, # 0 = no cap
+    'title_byte_budget': 32 * 1024,
+    'adaptive_concurrency': True,
+    'min_concurrency': 8,
+    'host_failure_threshold': 3,
+    'host_backoff_seconds': 600,
+    'max_retries': 3,
+    'retry_base_delay': 30,
+    'retry_max_delay': 600,
+    'max_per_host': 4,
+    'host_min_delay': 0.0,
+    'hedge_requests': False,
+    'hedge_budget': 0.1,
+    'hedge_min_delay': 2.0,
+    'adaptive_timeouts': True,
+    'timeout_floor': 5.0,
+    'timeout_ceiling': 60.0,
+    'new_host_connect_timeout': 20.0,
+    'fetch_total_timeout': 180.0,
+    'socks_isolation': 'none', # 'none', 'worker', 'host' or 'requests'
+    'isolation_requests_per_credential': 50,
+    'tor_instances': 1,
+    'socks_ports_per_instance': 7,
+    'compress_responses': True,
+    'host_probe': False,
+    'host_probe_timeout': 15.0,
+    'host_probe_concurrency': 100,
+    'parser_engine': 'lxml', # 'lxml' (single pass) or 'bs4'
+    'parse_offload': not getattr(sys, 'frozen', False), # Off in frozen builds until spawned parse processes are verified there
+    'parse_processes': 0, # 0 = one per CPU core, minus one
+    'parse_pending_per_process': 2,
+    'strip_boilerplate': True,
+    'max_page_text_chars': 200000, # 0 = no cap
+    'keyword_hit_offsets': 5,
+    'keyword_snippet_chars': 40,
+    'detect_near_duplicates': True,
+    'near_duplicate_distance': 3, # differing bits of 64
+    'skip_duplicate_links': False,
+}
 
 def save_parameters(config_file, settings_dict):
     """Saves the provided settings dictionary to the config file."""
@@ -29,6 +74,7 @@ def load_parameters(config_file):
         'keyword_file': None,
         'overwrite_torrc_auto': False
     }
+    defaults.update(ADVANCED_DEFAULTS)
     
     if not os.path.exists(config_file):
         return defaults
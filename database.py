@@ -4,8 +4,10 @@ Contains the DatabaseManager class for handling all SQLite operations.
 
 import sqlite3
 import logging
+import json
 from utils import get_top_level_url, is_junk_url
 import re2 as re # <-- MODIFIED: Using re2
+from keyword_matcher import KeywordMatcher
 import os
 import shutil
 import traceback
@@ -36,6 +38,7 @@ class DatabaseManager:
         # --- FIX: Register REGEXP function on connection object ---
         self.conn.create_function("REGEXP", 2, sqlite_regexp)
         # --- END FIX ---
+        self._keyword_ids = {} # Hit key -> keywords.id (ids never change)
         
         self.create_table()
         self.upgrade_table() # Add new columns if they don't exist
@@ -50,11 +53,64 @@ class DatabaseManager:
                     scraped INTEGER DEFAULT 0, -- 0: unscraped, 1: success, 2: failed
                     title TEXT,
                     keyword_match TEXT,
-                    page_data TEXT
+                    page_data TEXT,
+                    attempts INTEGER DEFAULT 0, -- failed fetch attempts so far
+                    next_attempt_at REAL, -- Unix time of the scheduled automatic retry (NULL = none)
+                    last_error TEXT, -- failure kind of the last failed attempt
+                    etag TEXT, -- validators of the last successful fetch
+                    last_modified TEXT,
+                    content_hash TEXT, -- hash of the last successfully parsed body
+                    keyword_set_hash TEXT, -- hash of the run signature (keywords, parser engine, text options) the row was parsed with
+                    last_checked_at REAL, -- Unix time the page was last fetched successfully
+                    final_url TEXT, -- where this URL redirected to (the row holding its content)
+                    redirect_chain TEXT, -- JSON list: requested URL, redirect hops, final URL
+                    simhash INTEGER, -- SimHash fingerprint of the page text (signed 64-bit)
+                    duplicate_of TEXT -- canonical URL this page is a near-duplicate of
                 )
             """)
             self.conn.execute("CREATE INDEX IF NOT EXISTS url_index ON links (url)")
             self.conn.execute("CREATE INDEX IF NOT EXISTS scraped_index ON links (scraped)")
+            # --- NEW: Per-host circuit breaker state (survives restarts) ---
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS hosts (
+                    netloc TEXT PRIMARY KEY,
+                    state TEXT DEFAULT 'closed', -- 'closed': reachable, 'open': considered dead
+                    consecutive_failures INTEGER DEFAULT 0,
+                    trip_count INTEGER DEFAULT 0,
+                    last_failure_at REAL,
+                    last_success_at REAL,
+                    next_probe_at REAL -- Unix time after which an 'open' host may be retried
+                )
+            """)
+            # Per-host latency histograms (JSON bucket counts) for learned timeouts
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS host_latency (
+                    netloc TEXT PRIMARY KEY,
+                    connect_hist TEXT,
+                    ttfb_hist TEXT,
+                    total_hist TEXT,
+                    updated_at REAL
+                )
+            """)
+            # Keyword hits per page, so threshold pulls are index lookups
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS keywords (
+                    id INTEGER PRIMARY KEY,
+                    keyword TEXT UNIQUE NOT NULL -- hit key: plain keyword lowercased, or the 'REGEX: ' line
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS keyword_hits (
+                    link_id INTEGER NOT NULL, -- links.id
+                    keyword_id INTEGER NOT NULL, -- keywords.id
+                    hit_count INTEGER NOT NULL, -- occurrences in the page text
+                    offsets TEXT, -- JSON list: character offsets of the first hits
+                    snippets TEXT, -- JSON list: the text around each of those hits
+                    PRIMARY KEY (link_id, keyword_id)
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS keyword_hits_keyword_index ON keyword_hits (keyword_id, link_id)")
+            # --- END NEW ---
 
     def upgrade_table(self):
         """Adds new columns to an existing database if they are missing."""
@@ -74,6 +130,27 @@ class DatabaseManager:
             with self.conn:
                 self.conn.execute("ALTER TABLE links ADD COLUMN page_data TEXT")
 
+        # --- NEW: Retry bookkeeping and revalidation columns ---
+        self._add_missing_columns("retry", ["attempts INTEGER DEFAULT 0", "next_attempt_at REAL", "last_error TEXT"])
+        self._add_missing_columns("revalidation", ["etag TEXT", "last_modified TEXT", "content_hash TEXT",
+                                                   "keyword_set_hash TEXT", "last_checked_at REAL"])
+        self._add_missing_columns("redirect", ["final_url TEXT", "redirect_chain TEXT"])
+        self._add_missing_columns("near-duplicate", ["simhash INTEGER", "duplicate_of TEXT"])
+        with self.conn:
+            self.conn.execute("CREATE INDEX IF NOT EXISTS simhash_index ON links (simhash)")
+        # --- END NEW ---
+
+    def _add_missing_columns(self, label, column_defs):
+        """Adds each 'name TYPE' column definition to 'links' if the column is missing."""
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(links)")}
+        missing = [col for col in column_defs if col.split()[0] not in existing]
+        if not missing:
+            return
+        logging.warning(f"Upgrading database: Adding {label} columns {[col.split()[0] for col in missing]}...")
+        with self.conn:
+            for column_def in missing:
+                self.conn.execute(f"ALTER TABLE links ADD COLUMN {column_def}")
+
     # --- FIX: Helper function to build correct schema string ---
     def _build_create_table_schema(self, columns_to_insert):
         """Builds a CREATE TABLE schema string with correct types."""
@@ -177,120 +254,72 @@ class DatabaseManager:
 
     def get_initial_keyword_match_count(self, keywords):
         """
-        Gets the total count of links matching at least one keyword in the 
-        keyword_match column. (Simplified COUNT for streaming setup).
+        Gets the total count of links matching at least one keyword (from
+        their stored keyword hits, or their keyword_match column for rows
+        scraped before hits were stored). (Simplified COUNT for streaming setup).
+        `keywords` is a KeywordMatcher or a keyword list.
         """
-        if not keywords: return 0 
-
-        # --- MODIFIED: Separate all 3 keyword types ---
-        input_keywords_plain = {k.strip().lower() for k in keywords if not k.startswith("REGEX: ")}
-        input_assert_regex = []
-        input_find_regex = []
-
-        for k in keywords:
-            if k.startswith("REGEX: "):
-                try:
-                    pattern_str = k[7:].strip()
-                    compiled_pattern = re.compile(pattern_str, re.IGNORECASE)
-                    if pattern_str.startswith("(?="):
-                        input_assert_regex.append((k, compiled_pattern))
-                    else:
-                        input_find_regex.append((k, compiled_pattern))
-                except re.error: # <-- MODIFIED to re.error
-                    pass # Ignore invalid regex
-        # --- END MODIFIED ---
-
-        sql_query_parts = []
-        sql_query_values = []
-        
-        # --- MODIFIED: Force Case-Insensitive SQL ---
-        # 1. Add plain keywords (searches for the literal word)
-        for k in input_keywords_plain:
-            # Use LOWER(col) to guarantee case insensitivity in SQL
-            sql_query_parts.append("LOWER(keyword_match) LIKE ?")
-            sql_query_values.append(f"%{k}%") 
-            
-        # 2. Add "Assert" regex (searches for the literal "REGEX: (?=...)" string)
-        for original_string, pattern in input_assert_regex:
-            sql_query_parts.append("LOWER(keyword_match) LIKE ?")
-            # Lowercase the search term because we are lowercasing the column
-            sql_query_values.append(f"%{original_string.lower()}%") 
-            
-        # 3. Add "Find" regex (executes the pattern against the stored words)
-        for original_string, pattern in input_find_regex:
-            sql_query_parts.append("keyword_match REGEXP ?")
-            sql_query_values.append(pattern.pattern) # Use REGEXP (uses re.IGNORECASE)
-        # --- END MODIFIED ---
+        keyword_matcher = KeywordMatcher.build(keywords)
+        if not keyword_matcher: return 0 
 
-        if not sql_query_parts:
-            return 0
-            
-        sql_filter = " OR ".join(sql_query_parts)
-        count_query = f"SELECT COUNT(*) FROM links WHERE keyword_match IS NOT NULL AND keyword_match != '' AND ({sql_filter})"
-        
         with self.conn:
             self.conn.row_factory = None # Ensure default
             self.conn.create_function("REGEXP", 2, sqlite_regexp) 
-            cursor = self.conn.execute(count_query, sql_query_values)
-            return cursor.fetchone()[0]
+            return sum(self.conn.execute(f"SELECT COUNT(*) FROM ({query})", values).fetchone()[0]
+                       for query, values, _ in self._keyword_pull_queries(keyword_matcher, 1))
+
+    def _keyword_pull_queries(self, keyword_matcher, threshold):
+        """
+        (query, values, recount) sources of a keyword pull. Pages with stored
+        hits are picked from keyword_hits by keyword id: at least `threshold`
+        distinct keywords of the list. Rows scraped before hits were stored are
+        selected by the keyword_match filter and must be recounted per row.
+        """
+        queries = []
+        keyword_ids = sorted(self._get_keyword_ids(sorted(keyword_matcher.hit_keys())).values())
+        if keyword_ids:
+            id_list = ", ".join(str(int(keyword_id)) for keyword_id in keyword_ids) # Too many for bound variables
+            queries.append((f"""
+                SELECT links.* FROM links JOIN (
+                    SELECT link_id FROM keyword_hits WHERE keyword_id IN ({id_list})
+                    GROUP BY link_id HAVING COUNT(*) >= ?
+                ) AS hits ON hits.link_id = links.id
+            """, [max(1, threshold)], False))
+
+        candidate_filter = keyword_matcher.sql_filter()
+        if candidate_filter and self._has_matches_without_hits():
+            sql_filter, sql_query_values = candidate_filter
+            queries.append((f"""
+                SELECT * FROM links WHERE keyword_match IS NOT NULL AND keyword_match != '' AND ({sql_filter})
+                AND NOT EXISTS (SELECT 1 FROM keyword_hits WHERE keyword_hits.link_id = links.id)
+            """, sql_query_values, True))
+        return queries
+
+    def _has_matches_without_hits(self):
+        """True if some row has a keyword_match but no stored hits (scraped before hits were stored)."""
+        with self.conn:
+            self.conn.row_factory = None # Ensure default
+            return self.conn.execute("""
+                SELECT EXISTS (SELECT 1 FROM links WHERE keyword_match IS NOT NULL AND keyword_match != ''
+                               AND NOT EXISTS (SELECT 1 FROM keyword_hits WHERE keyword_hits.link_id = links.id))
+            """).fetchone()[0] == 1
 
     def filter_links_by_keyword_threshold_to_new_db(self, new_db_path, keywords, threshold, progress_signal=None, total_rows_to_check=-1): 
         """
-        Pulls links whose keyword_match column contains at least 'threshold' 
-        unique keywords from the provided 'keywords' list.
+        Pulls links with at least 'threshold' unique keywords from the
+        provided 'keywords' (a KeywordMatcher or a keyword list). Pages with
+        stored keyword hits are counted by an index lookup; only rows scraped
+        before hits were stored have their keyword_match column recounted.
         """
-        if not keywords:
+        keyword_matcher = KeywordMatcher.build(keywords)
+        if not keyword_matcher:
             return 0 
 
-        # --- MODIFIED: Separate all 3 keyword types for counting ---
-        input_keywords_plain = {k.strip().lower() for k in keywords if not k.startswith("REGEX: ")}
-        
-        input_assert_regex = [] # Holds ("REGEX: (?=...)", re.compile(...))
-        input_find_regex = []   # Holds ("REGEX: \s...", re.compile(...))
-        
-        for k in keywords:
-            if k.startswith("REGEX: "):
-                try:
-                    pattern_str = k[7:].strip()
-                    compiled_pattern = re.compile(pattern_str, re.IGNORECASE)
-                    
-                    if pattern_str.startswith("(?="):
-                        input_assert_regex.append((k, compiled_pattern))
-                    else:
-                        input_find_regex.append((k, compiled_pattern))
-                        
-                except re.error as e: # <-- MODIFIED to re.error
-                    logging.warning(f"Invalid regex in keyword file (skipping): '{k}'. Error: {e}")
-        # --- END MODIFIED ---
-
-        # --- MODIFIED: Build SQL query to find all candidates ---
-        sql_query_parts = []
-        sql_query_values = []
-        
-        # --- MODIFIED: Force Case-Insensitive SQL ---
-        # 1. Add plain keywords (searches for the literal word)
-        for k in input_keywords_plain:
-            sql_query_parts.append("LOWER(keyword_match) LIKE ?")
-            sql_query_values.append(f"%{k}%") 
-            
-        # 2. Add "Assert" regex (searches for the literal "REGEX: (?=...)" string)
-        for original_string, pattern in input_assert_regex:
-            sql_query_parts.append("LOWER(keyword_match) LIKE ?")
-            sql_query_values.append(f"%{original_string.lower()}%") 
-            
-        # 3. Add "Find" regex (executes the pattern against the stored words)
-        for original_string, pattern in input_find_regex:
-            sql_query_parts.append("keyword_match REGEXP ?")
-            sql_query_values.append(pattern.pattern) # Use REGEXP (uses re.IGNORECASE)
-        # --- END MODIFIED ---
-        
-        if not sql_query_parts:
+        queries = self._keyword_pull_queries(keyword_matcher, threshold)
+        if not queries:
             logging.warning("No valid keywords found for filtering.")
             return 0
 
-        sql_filter = " OR ".join(sql_query_parts)
-        initial_query = f"SELECT * FROM links WHERE keyword_match IS NOT NULL AND keyword_match != '' AND ({sql_filter})"
-
         if os.path.exists(new_db_path): 
             os.remove(new_db_path)
             
@@ -304,8 +333,8 @@ class DatabaseManager:
             try:
                 temp_conn = sqlite3.connect(self.db_path)
                 temp_conn.create_function("REGEXP", 2, sqlite_regexp)
-                cursor = temp_conn.execute(f"SELECT COUNT(*) FROM links WHERE keyword_match IS NOT NULL AND keyword_match != '' AND ({sql_filter})", sql_query_values)
-                total_rows_to_check = cursor.fetchone()[0]
+                total_rows_to_check = sum(temp_conn.execute(f"SELECT COUNT(*) FROM ({query})", values).fetchone()[0]
+                                          for query, values, _ in queries)
                 temp_conn.close()
                 logging.info(f"Calculated {total_rows_to_check} candidate rows for keyword pull.")
             except Exception as e:
@@ -324,69 +353,38 @@ class DatabaseManager:
             temp_conn = sqlite3.connect(self.db_path)
             temp_conn.row_factory = sqlite3.Row 
             temp_conn.create_function("REGEXP", 2, sqlite_regexp)
-            cursor = temp_conn.cursor()
+            insert_sql = None
             
-            logging.debug(f"Executing keyword pull query: {initial_query}")
-            logging.debug(f"With values: {sql_query_values}")
-            cursor.execute(initial_query, sql_query_values)
-            
-            original_columns = [description[0] for description in cursor.description]
-            columns_to_insert = [col for col in original_columns if col.lower() != 'id']
-            
-            with new_conn:
-                # --- FIX: Create table with correct schema ---
-                schema_string = self._build_create_table_schema(columns_to_insert)
-                new_conn.execute(f"CREATE TABLE links ({schema_string})")
-                # --- END FIX ---
+            for query, sql_query_values, recount in queries:
+                cursor = temp_conn.cursor()
+                logging.debug(f"Executing keyword pull query: {query}")
+                logging.debug(f"With values: {sql_query_values}")
+                cursor.execute(query, sql_query_values)
                 
-                placeholders = ", ".join(["?"] * len(columns_to_insert))
-                insert_sql = f"INSERT INTO links ({', '.join(columns_to_insert)}) VALUES ({placeholders})"
-            
-            for row in cursor:
-                row_tuple = tuple(row[col] for col in columns_to_insert)
-                keyword_match_string = row['keyword_match']
+                if insert_sql is None:
+                    original_columns = [description[0] for description in cursor.description]
+                    columns_to_insert = [col for col in original_columns if col.lower() != 'id']
+                    
+                    with new_conn:
+                        # --- FIX: Create table with correct schema ---
+                        schema_string = self._build_create_table_schema(columns_to_insert)
+                        new_conn.execute(f"CREATE TABLE links ({schema_string})")
+                        # --- END FIX ---
+                        
+                        placeholders = ", ".join(["?"] * len(columns_to_insert))
+                        insert_sql = f"INSERT INTO links ({', '.join(columns_to_insert)}) VALUES ({placeholders})"
                 
-                # --- MODIFIED: New counting logic ---
-                unique_match_count = 0
-                if keyword_match_string:
-                    # --- THIS IS THE FIX ---
-                    # Split by the new unique delimiter
-                    stored_matches_set_lower = {k.strip().lower() for k in keyword_match_string.split(" _!|!_ ")}
-                    stored_matches_original_case = {k.strip() for k in keyword_match_string.split(" _!|!_ ")}
-                    # --- END FIX ---
-
-                    # 1. Count plain keyword matches
-                    common_plain_matches = stored_matches_set_lower.intersection(input_keywords_plain)
-                    unique_match_count += len(common_plain_matches)
+                for row in cursor:
+                    row_tuple = tuple(row[col] for col in columns_to_insert)
                     
-                    # 2. Count "Assert" regex matches
-                    # Check if any of the stored items are the "Assert" regex patterns
-                    for input_regex_str, _ in input_assert_regex:
-                        if input_regex_str in stored_matches_original_case: # Must use original case
-                            unique_match_count += 1
-                                
-                    # 3. Count "Find" regex matches
-                    # Check if any "Find" regex *pattern* matches any *stored word*
-                    stored_words_only = {k for k in stored_matches_original_case if not k.startswith("REGEX: ")}
+                    rows_processed += 1
+                    if progress_signal and total_rows_to_check > 0 and rows_processed % 20 == 0: 
+                        percentage = int((rows_processed / total_rows_to_check) * 100)
+                        progress_signal.emit(percentage)
                     
-                    if stored_words_only:
-                        for _, find_pattern in input_find_regex:
-                            # Check if this pattern matches *any* of the stored words
-                            for word in stored_words_only:
-                                # --- THIS IS THE FIX: Use re.search, not re.fullmatch ---
-                                if find_pattern.search(word): 
-                                    unique_match_count += 1
-                                    # This pattern is matched, break to avoid double-counting
-                                    # (e.g., if "street" and "house" both match \s\w{5}\s)
-                                    break 
-                # --- END MODIFIED COUNTING ---
-                
-                rows_processed += 1
-                if progress_signal and total_rows_to_check > 0 and rows_processed % 20 == 0: 
-                    percentage = int((rows_processed / total_rows_to_check) * 100)
-                    progress_signal.emit(percentage)
-                
-                if unique_match_count >= threshold:
+                    # Distinct keywords (plain, assert, find) among the stored matches
+                    if recount and keyword_matcher.count_stored_matches(row['keyword_match']) < threshold:
+                        continue
                     insert_batch.append(row_tuple)
                     
                     if len(insert_batch) >= batch_size:
@@ -442,8 +440,73 @@ class DatabaseManager:
             return
         with self.conn:
             self.conn.row_factory = None # Ensure default
-            self.conn.executemany("UPDATE links SET scraped = ?, title = ?, keyword_match = ?, page_data = ? WHERE url = ?", update_data)
+            # A canonical page of the near-duplicate index keeps its text when none is stored this
+            # time (failed refetch, no keyword match any more): its duplicates only hold a reference to it
+            self.conn.executemany("""
+                UPDATE links SET scraped = ?, title = ?, keyword_match = ?,
+                                 page_data = COALESCE(?, CASE WHEN simhash IS NOT NULL AND duplicate_of IS NULL THEN page_data END)
+                WHERE url = ?
+            """, update_data)
+            self._clear_retry_state([row[-1] for row in update_data if row[0] == 1])
             
+    # --- NEW: Structured keyword hits ---
+    def _get_keyword_ids(self, keys, create=False):
+        """Maps hit keys to keywords.id (keys without an id are left out). With `create`, missing keys are added."""
+        ids = {key: self._keyword_ids[key] for key in keys if key in self._keyword_ids}
+        missing = [key for key in keys if key not in ids]
+        if not missing:
+            return ids
+        if create:
+            self.conn.executemany("INSERT OR IGNORE INTO keywords (keyword) VALUES (?)", [(key,) for key in missing])
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            placeholders = ", ".join(["?"] * len(chunk))
+            for key, keyword_id in self.conn.execute(f"SELECT keyword, id FROM keywords WHERE keyword IN ({placeholders})", chunk):
+                self._keyword_ids[key] = keyword_id
+                ids[key] = keyword_id
+        return ids
+
+    def save_keyword_hits_batch(self, update_data):
+        """
+        Replaces the stored keyword hits of pages. Tuples are (url, hits), hits
+        being the (hit key, hit count, offsets, snippets) records of
+        KeywordMatcher.match_hits; an empty list clears the page's hits.
+        """
+        if not update_data:
+            return
+        with self.conn:
+            self.conn.row_factory = None # Ensure default
+            for url, hits in update_data:
+                row = self.conn.execute("SELECT id FROM links WHERE url = ?", (url,)).fetchone()
+                if not row:
+                    continue
+                link_id = row[0]
+                self.conn.execute("DELETE FROM keyword_hits WHERE link_id = ?", (link_id,))
+                if not hits:
+                    continue
+                keyword_ids = self._get_keyword_ids([hit[0] for hit in hits], create=True)
+                self.conn.executemany("""
+                    INSERT OR REPLACE INTO keyword_hits (link_id, keyword_id, hit_count, offsets, snippets)
+                    VALUES (?, ?, ?, ?, ?)
+                """, [(link_id, keyword_ids[key], count, json.dumps(offsets), json.dumps(snippets, ensure_ascii=False))
+                      for key, count, offsets, snippets in hits])
+
+    def get_keyword_hits(self, url):
+        """Stored keyword hits of `url` as dicts (keyword, hit_count, offsets, snippets), most hits first."""
+        with self.conn:
+            self.conn.row_factory = None # Ensure default
+            rows = self.conn.execute("""
+                SELECT keywords.keyword, keyword_hits.hit_count, keyword_hits.offsets, keyword_hits.snippets
+                FROM links
+                JOIN keyword_hits ON keyword_hits.link_id = links.id
+                JOIN keywords ON keywords.id = keyword_hits.keyword_id
+                WHERE links.url = ?
+                ORDER BY keyword_hits.hit_count DESC, keywords.keyword
+            """, (url,)).fetchall()
+        return [{"keyword": keyword, "hit_count": count, "offsets": json.loads(offsets or "[]"),
+                 "snippets": json.loads(snippets or "[]")} for keyword, count, offsets, snippets in rows]
+    # --- END NEW ---
+
     def update_titles_batch(self, update_data):
         if not update_data:
             return
@@ -459,8 +522,117 @@ class DatabaseManager:
         with self.conn:
             self.conn.row_factory = None # Ensure default
             self.conn.executemany("UPDATE links SET scraped = ?, title = ? WHERE url = ?", update_data)
+            self._clear_retry_state([row[-1] for row in update_data if row[0] == 1])
     # --- END NEW FUNCTION ---
 
+    # --- NEW: Retry bookkeeping ---
+    def _clear_retry_state(self, urls):
+        """Resets the failed-attempt bookkeeping of URLs (inside the caller's transaction)."""
+        if urls:
+            self.conn.executemany("UPDATE links SET attempts = 0, last_error = NULL, next_attempt_at = NULL WHERE url = ?",
+                                  [(url,) for url in urls])
+
+    def reset_retry_state(self, urls):
+        """Resets the failed-attempt bookkeeping of URLs (e.g. failed links queued by a manual rescrape)."""
+        with self.conn:
+            self.conn.row_factory = None # Ensure default
+            self._clear_retry_state(urls)
+
+    def record_failed_attempt(self, url, error_kind):
+        """Increments the attempt counter for a failed URL and returns the new count."""
+        with self.conn:
+            self.conn.row_factory = None # Ensure default
+            self.conn.execute("UPDATE links SET attempts = COALESCE(attempts, 0) + 1, last_error = ? WHERE url = ?",
+                              (error_kind, url))
+            row = self.conn.execute("SELECT attempts FROM links WHERE url = ?", (url,)).fetchone()
+            return row[0] if row else 1
+
+    def set_next_attempt_batch(self, update_data):
+        """Sets next_attempt_at for a batch of (next_attempt_at, url) tuples. NULL = no retry."""
+        if not update_data:
+            return
+        with self.conn:
+            self.conn.row_factory = None # Ensure default
+            self.conn.executemany("UPDATE links SET next_attempt_at = ? WHERE url = ?", update_data)
+
+    def get_revalidation_info(self, url):
+        """
+        Gets what a refetch of `url` needs to decide whether the page changed:
+        validators, content hash and the stored result. None if unknown.
+        """
+        with self.conn:
+            self.conn.row_factory = sqlite3.Row
+            row = self.conn.execute("""
+                SELECT scraped, title, keyword_match, etag, last_modified, content_hash, keyword_set_hash,
+                       (page_data IS NOT NULL AND page_data != '') AS has_page_data
+                FROM links WHERE url = ?
+            """, (url,)).fetchone()
+            self.conn.row_factory = None
+            return dict(row) if row else None
+
+    def save_fetch_validators_batch(self, update_data):
+        """
+        Stores validators after a successful parse. Tuples are
+        (etag, last_modified, content_hash, keyword_set_hash, last_checked_at, url).
+        """
+        if not update_data:
+            return
+        with self.conn:
+            self.conn.row_factory = None # Ensure default
+            self.conn.executemany("""
+                UPDATE links SET etag = ?, last_modified = ?, content_hash = ?, keyword_set_hash = ?,
+                                 last_checked_at = ?
+                WHERE url = ?
+            """, update_data)
+
+    def touch_unchanged_batch(self, update_data):
+        """Marks unchanged pages (304 / same hash) as scraped without touching their stored data. Tuples are (last_checked_at, url)."""
+        if not update_data:
+            return
+        with self.conn:
+            self.conn.row_factory = None # Ensure default
+            self.conn.executemany("""
+                UPDATE links SET scraped = 1, attempts = 0, last_error = NULL, next_attempt_at = NULL, last_checked_at = ?
+                WHERE url = ?
+            """, update_data)
+
+    def save_redirect(self, chain, chain_json, resolved_title=None):
+        """
+        Records a redirect chain (requested URL first, final URL last) on
+        every URL of the chain except the final one. If `resolved_title` is
+        given, the final page was fetched: the final URL is added if missing
+        and the other URLs are marked scraped, with no content of their own,
+        so none of them is fetched again. Call before storing the final page.
+        """
+        final_url, aliases = chain[-1], chain[:-1]
+        with self.conn:
+            self.conn.row_factory = None # Ensure default
+            if resolved_title is None:
+                self.conn.executemany("UPDATE links SET final_url = ?, redirect_chain = ? WHERE url = ?",
+                                      [(final_url, chain_json, url) for url in aliases])
+                return
+            self.conn.executemany("INSERT OR IGNORE INTO links (url) VALUES (?)", [(url,) for url in chain])
+            self.conn.executemany("""
+                UPDATE links SET scraped = 1, title = ?, keyword_match = NULL, page_data = NULL,
+                                 final_url = ?, redirect_chain = ?, next_attempt_at = NULL,
+                                 etag = NULL, last_modified = NULL, content_hash = NULL,
+                                 simhash = NULL, duplicate_of = NULL
+                WHERE url = ?
+            """, [(resolved_title, final_url, chain_json, url) for url in aliases])
+            self.conn.executemany("DELETE FROM keyword_hits WHERE link_id = (SELECT id FROM links WHERE url = ?)",
+                                  [(url,) for url in aliases])
+            # The final URL is the content record; it no longer redirects anywhere
+            self.conn.execute("UPDATE links SET final_url = NULL, redirect_chain = NULL WHERE url = ?", (final_url,))
+
+    def get_scheduled_retries(self):
+        """Gets (url, next_attempt_at) for failed links that still have a retry scheduled."""
+        with self.conn:
+            self.conn.row_factory = None # Ensure default
+            return self.conn.execute(
+                "SELECT url, next_attempt_at FROM links WHERE scraped = 2 AND next_attempt_at IS NOT NULL"
+            ).fetchall()
+    # --- END NEW ---
+
     def reset_failed_links(self):
         with self.conn:
             self.conn.row_factory = None # Ensure default
@@ -471,6 +643,69 @@ class DatabaseManager:
             self.conn.row_factory = None # Ensure default
             self.conn.execute("UPDATE links SET scraped = 0 WHERE scraped != 2 AND (page_data IS NULL OR page_data = '')")
 
+    # --- NEW: Host state (circuit breaker) persistence ---
+    def get_host_states(self):
+        """Returns every row of the 'hosts' table as a list of dicts."""
+        with self.conn:
+            self.conn.row_factory = sqlite3.Row
+            rows = [dict(row) for row in self.conn.execute("SELECT * FROM hosts")]
+            self.conn.row_factory = None
+            return rows
+
+    def save_host_states_batch(self, host_rows):
+        """
+        Inserts or replaces host rows. Each row is a tuple of
+        (netloc, state, consecutive_failures, trip_count, last_failure_at, last_success_at, next_probe_at).
+        """
+        if not host_rows:
+            return
+        with self.conn:
+            self.conn.row_factory = None # Ensure default
+            self.conn.executemany("""
+                INSERT OR REPLACE INTO hosts
+                (netloc, state, consecutive_failures, trip_count, last_failure_at, last_success_at, next_probe_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, host_rows)
+
+    def get_host_latency(self):
+        """Returns every row of the 'host_latency' table as a list of dicts."""
+        with self.conn:
+            self.conn.row_factory = sqlite3.Row
+            rows = [dict(row) for row in self.conn.execute("SELECT * FROM host_latency")]
+            self.conn.row_factory = None
+            return rows
+
+    def save_host_latency_batch(self, latency_rows):
+        """Inserts or replaces (netloc, connect_hist, ttfb_hist, total_hist, updated_at) rows."""
+        if not latency_rows:
+            return
+        with self.conn:
+            self.conn.row_factory = None # Ensure default
+            self.conn.executemany("""
+                INSERT OR REPLACE INTO host_latency (netloc, connect_hist, ttfb_hist, total_hist, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, latency_rows)
+    # --- END NEW ---
+
+    # --- NEW: Near-duplicate fingerprints ---
+    def save_page_fingerprint_batch(self, update_data):
+        """Stores page fingerprints. Tuples are (simhash as signed 64-bit int or None, duplicate_of url or None, url)."""
+        if not update_data:
+            return
+        with self.conn:
+            self.conn.row_factory = None # Ensure default
+            self.conn.executemany("UPDATE links SET simhash = ?, duplicate_of = ? WHERE url = ?", update_data)
+
+    def get_page_fingerprints(self):
+        """Gets (url, simhash) of the scraped pages that are not duplicates of another page and have their text stored."""
+        with self.conn:
+            self.conn.row_factory = None # Ensure default
+            return self.conn.execute(
+                "SELECT url, simhash FROM links WHERE simhash IS NOT NULL AND duplicate_of IS NULL AND scraped = 1 "
+                "AND page_data IS NOT NULL"
+            ).fetchall()
+    # --- END NEW ---
+
     def get_total_link_count(self):
         with self.conn:
             self.conn.row_factory = None # Ensure default
@@ -25,11 +25,26 @@ from PySide6.QtCore import (QObject, Signal, QThread, Qt, QAbstractTableModel,
                             QModelIndex) 
 from PySide6.QtGui import QColor, QTextCursor, QFont, QAction
 
-from scraper import scraper_main_producer, scraper_worker_task
+from scraper import scraper_main_producer, scraper_worker_task, retry_feeder, FetchOptions
+from session_pool import SessionPool
+from proxy_scheduler import ProxyScheduler
+from concurrency import AdaptiveConcurrencyController
+from host_state import HostCircuitBreaker, HostDispatcher, HostLatencyTracker, HostTimeoutPolicy
+from hedging import HedgingPolicy
+from transfer_stats import TransferStats
+from redirects import RedirectTracker
+from host_probe import HostProber
+from page_parser import TextOptions, resolve_parser_engine
+from keyword_matcher import KeywordMatcher
+from parse_pool import ParsePool
+from near_duplicates import NearDuplicateIndex
+from stream_isolation import SocksIsolation, circuit_monitor
+from tor_pool import follow_tor_pool
+from retry_scheduler import RetryScheduler
 # Import DatabaseManager to be used only inside DbWorker for execution
 from database import DatabaseManager 
 from database_actions import DbViewer # Import DbViewer from its new home
-from utils import MODE_PAGINATE, MODE_PULL_TOP_LEVEL, MODE_PULL_KEYWORDS 
+from utils import MODE_PAGINATE, MODE_PULL_TOP_LEVEL, MODE_PULL_KEYWORDS, PROXIES
 
 # --- NEW: Text Editor Dialog (Request 2) ---
 
@@ -191,7 +206,7 @@ class DbWorker(QThread):
         
         count = db.filter_links_by_keyword_threshold_to_new_db(
             new_db_path, 
-            self.keywords, 
+            KeywordMatcher.build(self.keywords), 
             self.threshold,
             self.progress_update, 
             self.total_rows_to_check
@@ -469,7 +484,9 @@ class ScraperWorker(QThread):
                  rescrape_mode=False, top_level_only_mode=False, 
                  onion_only_mode=False, titles_only_mode=False, keywords=None, 
                  save_page_data_mode="Keyword Match", # <-- Changed
-                 rescrape_page_data_mode=False): 
+                 rescrape_page_data_mode=False,
+                 scrape_stats=None, scrape_stats_lock=None,
+                 tor_pool=None): 
         super().__init__()
         self.args = args
         self.stop_event = stop_event
@@ -483,11 +500,25 @@ class ScraperWorker(QThread):
         self.keywords = keywords
         self.save_page_data_mode = save_page_data_mode # <-- Changed
         self.rescrape_page_data_mode = rescrape_page_data_mode 
+        self.scrape_stats = scrape_stats # Shared with the Network Activity viewer
+        self.scrape_stats_lock = scrape_stats_lock
+        self.tor_pool = tor_pool # Running Tor instances supply the SocksPorts
         
         # --- REVAMP: Attributes to hold the loop and tasks ---
         self.loop = None
         self.producer_task = None
         self.worker_tasks = []
+        self.session_pool = None
+        self.concurrency_controller = None
+        self.host_breaker = None
+        self.retry_scheduler = None
+        self.service_tasks = [] # Background tasks that live for the whole run (retry feeder, circuit monitor)
+        self.hedging_policy = None
+        self.transfer_stats = None
+        self.redirect_tracker = None
+        self.parse_pool = None
+        self.near_duplicates = None
+        self.latency_tracker = None
         # --- END REVAMP ---
     
     async def _shutdown_tasks(self):
@@ -503,10 +534,17 @@ class ScraperWorker(QThread):
         for task in self.worker_tasks:
             task.cancel()
             
+        for task in self.service_tasks:
+            task.cancel()
+            
         # Wait for all tasks to acknowledge cancellation
-        all_tasks = self.worker_tasks + [self.producer_task]
+        all_tasks = self.worker_tasks + self.service_tasks + [self.producer_task]
         await asyncio.gather(*[t for t in all_tasks if t], return_exceptions=True)
         
+        # Workers are gone, so no session is borrowed any more
+        if self.session_pool:
+            await self.session_pool.close()
+        
         if self.loop:
             self.loop.stop()
         logging.warning("Event loop stopped.")
@@ -536,12 +574,139 @@ class ScraperWorker(QThread):
                 asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
             
             concurrency = self.args.batch_size
-            queue = asyncio.Queue(maxsize=concurrency * 2)
+            # Host-aware queue: caps in-flight requests per onion host
+            queue = HostDispatcher(
+                maxsize=concurrency * 2,
+                max_per_host=getattr(self.args, 'max_per_host', 4),
+                min_delay=getattr(self.args, 'host_min_delay', 0.0)
+            )
             
             # --- MODIFIED: Get db_path to pass to workers ---
             db_path = self.args.db_file
             # --- END MODIFIED ---
             
+            # Per-host latency history (warm from earlier runs) and learned timeouts
+            self.latency_tracker = HostLatencyTracker()
+            history_db = DatabaseManager(db_path)
+            self.latency_tracker.load(history_db)
+            history_db.close()
+            timeout_policy = HostTimeoutPolicy(
+                self.latency_tracker,
+                floor=getattr(self.args, 'timeout_floor', 5.0),
+                ceiling=getattr(self.args, 'timeout_ceiling', 60.0),
+                new_host_connect=getattr(self.args, 'new_host_connect_timeout', 20.0),
+                enabled=getattr(self.args, 'adaptive_timeouts', True),
+                total_ceiling=getattr(self.args, 'fetch_total_timeout', 180.0)
+            )
+            
+            # Optional SOCKS credentials so Tor isolates streams onto separate circuits
+            isolation = SocksIsolation(
+                getattr(self.args, 'socks_isolation', 'none'),
+                requests_per_credential=getattr(self.args, 'isolation_requests_per_credential', 50)
+            )
+            
+            # SocksPorts of the Tor instances that have bootstrapped so far
+            proxies = (self.tor_pool.running_proxies() if self.tor_pool else None) or PROXIES
+            logging.info(f"[TOR] Scraping through {len(proxies)} SocksPorts.")
+            
+            # One pool of long-lived sessions shared by every worker
+            self.session_pool = SessionPool(
+                proxies,
+                sessions_per_proxy=getattr(self.args, 'sessions_per_proxy', 2),
+                max_concurrency=concurrency,
+                scheduler=ProxyScheduler(proxies, self.scrape_stats, self.scrape_stats_lock),
+                latency_tracker=self.latency_tracker,
+                isolation=isolation,
+                # Never shorter than a request's own headers (connect + read) or total deadline
+                transfer_timeout=max(getattr(self.args, 'fetch_total_timeout', 180.0),
+                                     2 * getattr(self.args, 'timeout_ceiling', 60.0))
+            )
+            
+            # Optional: duplicate slow requests through a second SocksPort
+            if getattr(self.args, 'hedge_requests', False):
+                self.hedging_policy = HedgingPolicy(
+                    self.latency_tracker,
+                    budget=getattr(self.args, 'hedge_budget', 0.1),
+                    min_delay=getattr(self.args, 'hedge_min_delay', 2.0),
+                    stats_dict=self.scrape_stats,
+                    stats_lock=self.scrape_stats_lock
+                )
+            
+            fetch_options = FetchOptions.from_args(self.args, self.titles_only_mode)
+            self.transfer_stats = TransferStats(self.scrape_stats, self.scrape_stats_lock)
+            fetch_options.transfer_stats = self.transfer_stats
+            self.redirect_tracker = RedirectTracker()
+            logging.info(f"[TRANSFER] Accept-Encoding: {fetch_options.accept_encoding or 'identity (compression off)'}")
+            parser_engine = resolve_parser_engine(getattr(self.args, 'parser_engine', 'lxml'))
+            logging.info(f"[PARSER] HTML extraction engine: {parser_engine}")
+            text_options = TextOptions.from_args(self.args)
+            logging.info(f"[PARSER] Page text: boilerplate {'stripped' if text_options.strip_boilerplate else 'kept'}, "
+                         f"capped at {text_options.max_chars or 'no'} characters.")
+            
+            # Keyword file classified and compiled once, shared by every worker (and parse process)
+            keyword_matcher = KeywordMatcher.build(
+                self.keywords,
+                hit_offsets=getattr(self.args, 'keyword_hit_offsets', 5),
+                snippet_chars=getattr(self.args, 'keyword_snippet_chars', 40)
+            )
+            if keyword_matcher:
+                logging.info(f"[KEYWORDS] {keyword_matcher.summary()}.")
+            
+            # Mirrors and templated pages are stored as references to the first copy
+            if getattr(self.args, 'detect_near_duplicates', True) and not self.titles_only_mode:
+                self.near_duplicates = NearDuplicateIndex(
+                    db_path,
+                    max_distance=getattr(self.args, 'near_duplicate_distance', 3),
+                    skip_links=getattr(self.args, 'skip_duplicate_links', False)
+                )
+            
+            # CPU-bound parsing and keyword matching run in worker processes, off the event loop
+            if getattr(self.args, 'parse_offload', not getattr(sys, 'frozen', False)) and not self.titles_only_mode:
+                self.parse_pool = ParsePool(
+                    keyword_matcher, self.onion_only_mode, self.save_page_data_mode, parser_engine,
+                    processes=getattr(self.args, 'parse_processes', 0),
+                    pending_per_process=getattr(self.args, 'parse_pending_per_process', 2),
+                    text_options=text_options,
+                    fingerprint_pages=self.near_duplicates is not None
+                )
+                logging.info(f"[PARSE] Parsing in {self.parse_pool.processes} processes "
+                             f"(up to {self.parse_pool.max_pending} pages queued).")
+            
+            # "Concurrent Requests" is the ceiling; the controller picks the live limit
+            self.concurrency_controller = AdaptiveConcurrencyController(
+                concurrency,
+                floor=getattr(self.args, 'min_concurrency', 8),
+                enabled=getattr(self.args, 'adaptive_concurrency', True),
+                stats_dict=self.scrape_stats,
+                stats_lock=self.scrape_stats_lock
+            )
+            logging.info(f"[INFO] Starting {concurrency} workers with an initial fetch limit of {self.concurrency_controller.limit}.")
+            
+            # Per-host circuit breaker; dead hosts are remembered in the DB
+            self.host_breaker = HostCircuitBreaker(
+                db_path,
+                failure_threshold=getattr(self.args, 'host_failure_threshold', 3),
+                backoff_seconds=getattr(self.args, 'host_backoff_seconds', 600)
+            )
+            
+            # Optional: SOCKS-connect never-seen hosts before spending a full fetch on them
+            host_prober = None
+            if getattr(self.args, 'host_probe', False):
+                host_prober = HostProber(
+                    self.host_breaker,
+                    self.session_pool.proxies,
+                    latency_tracker=self.latency_tracker,
+                    timeout=getattr(self.args, 'host_probe_timeout', 15.0),
+                    concurrency=getattr(self.args, 'host_probe_concurrency', 100)
+                )
+            
+            # Transient failures are retried later in the same run
+            self.retry_scheduler = RetryScheduler(
+                max_attempts=getattr(self.args, 'max_retries', 3),
+                base_delay=getattr(self.args, 'retry_base_delay', 30),
+                max_delay=getattr(self.args, 'retry_max_delay', 600)
+            )
+            
             # Create worker tasks
             for i in range(concurrency):
                 worker_id = f"Worker-{i+1}" 
@@ -551,7 +716,20 @@ class ScraperWorker(QThread):
                     self.onion_only_mode, self.titles_only_mode,
                     self.keywords, self.save_page_data_mode, # <-- Pass mode string
                     self.top_level_only_mode,
-                    db_path  # <-- MODIFIED: Pass db_path
+                    db_path,  # <-- MODIFIED: Pass db_path
+                    self.session_pool,
+                    fetch_options,
+                    self.concurrency_controller,
+                    self.host_breaker,
+                    self.retry_scheduler,
+                    self.hedging_policy,
+                    timeout_policy,
+                    self.redirect_tracker,
+                    parser_engine,
+                    self.parse_pool,
+                    keyword_matcher,
+                    text_options,
+                    self.near_duplicates
                 ))
                 self.worker_tasks.append(task)
             
@@ -562,8 +740,23 @@ class ScraperWorker(QThread):
                 self.onion_only_mode, self.titles_only_mode,
                 self.keywords, 
                 self.save_page_data_mode, # <-- Pass mode string
-                self.rescrape_page_data_mode 
+                self.rescrape_page_data_mode,
+                self.host_breaker,
+                self.retry_scheduler,
+                host_prober
+            ))
+            self.service_tasks.append(self.loop.create_task(
+                retry_feeder(queue, self.retry_scheduler, self.stop_event)
             ))
+            self.service_tasks.append(self.loop.create_task(
+                circuit_monitor(isolation, self.scrape_stats, self.scrape_stats_lock, self.stop_event,
+                                tor_pool=self.tor_pool)
+            ))
+            if self.tor_pool:
+                # Instances that finish bootstrapping later join this run
+                self.service_tasks.append(self.loop.create_task(
+                    follow_tor_pool(self.tor_pool, self.session_pool, self.stop_event)
+                ))
             
             # Run the loop until stop() is called
             logging.info("Scraper event loop started.")
@@ -574,6 +767,22 @@ class ScraperWorker(QThread):
         except Exception as e:
             logging.error(f"[ERROR] Scraper thread error: {e}\n{traceback.format_exc()}")
         finally:
+            if self.hedging_policy:
+                self.hedging_policy.close()
+            if self.transfer_stats:
+                self.transfer_stats.close()
+            if self.redirect_tracker:
+                self.redirect_tracker.close()
+            if self.parse_pool:
+                self.parse_pool.close()
+            if self.near_duplicates:
+                self.near_duplicates.close()
+            if self.host_breaker:
+                self.host_breaker.close()
+            if self.latency_tracker:
+                history_db = DatabaseManager(self.args.db_file)
+                self.latency_tracker.save(history_db)
+                history_db.close()
             if self.loop:
                 self.loop.close()
             logging.info("Scraper thread finished. Emitting finished signal.")
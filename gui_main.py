@@ -97,6 +97,10 @@ class ScraperApp(QMainWindow):
 
         self.active_tasks_dict = {}
         self.active_tasks_lock = threading.Lock()
+        
+        # Run-wide scraper metrics (concurrency limit, etc.) for the Network viewer
+        self.scrape_stats = {}
+        self.scrape_stats_lock = threading.Lock()
 
         self.setup_ui()
         self.setup_logging() 
@@ -128,7 +132,9 @@ class ScraperApp(QMainWindow):
             QMessageBox.critical(self, "Import Error", f"Failed to load network components: {e}\n\nNetwork monitor will be disabled.")
             self.network_activity_button.setEnabled(False)
 
-        if self.tor_manager.ensure_local_torrc(self.overwrite_torrc_auto):
+        if self.tor_manager.ensure_local_torrc(self.overwrite_torrc_auto,
+                                               self.advanced_params['tor_instances'],
+                                               self.advanced_params['socks_ports_per_instance']):
             self.tor_manager.launch_monitoring_tools()
         else:
             logging.critical("[FATAL] Tor configuration was cancelled or failed.")
@@ -466,13 +472,14 @@ class ScraperApp(QMainWindow):
             QMessageBox.warning(self, "Error", "Network Activity Viewer component failed to load on startup.")
             return
 
-        if not self.tor_manager.tor_process:
+        tor_process = self.tor_manager.tor_process
+        if not tor_process:
             QMessageBox.warning(self, "Error", "Tor process object does not exist.")
             return
 
         try:
             import psutil
-            tor_ps_process = psutil.Process(self.tor_manager.tor_process.pid)
+            tor_ps_process = psutil.Process(tor_process.pid)
             if not tor_ps_process.is_running():
                 QMessageBox.warning(self, "Error", "Tor process has ended.")
                 return
@@ -488,8 +495,10 @@ class ScraperApp(QMainWindow):
                 self.network_viewer = self.NetworkActivityViewer(
                     self.active_tasks_dict, 
                     self.active_tasks_lock, 
-                    self.tor_manager.tor_process.pid, 
-                    self
+                    tor_process.pid, 
+                    self,
+                    self.scrape_stats,
+                    self.scrape_stats_lock
                 )
             except Exception as e:
                 logging.error(f"Failed to create NetworkActivityViewer: {e}\n{traceback.format_exc()}")
@@ -833,6 +842,7 @@ class ScraperApp(QMainWindow):
             'keyword_file': self.keyword_file_path,
             'overwrite_torrc_auto': self.overwrite_torrc_auto
         }
+        params_to_save.update(self.advanced_params)
         config_manager.save_parameters(self.CONFIG_FILE, params_to_save)
 
     def load_parameters(self):
@@ -859,6 +869,7 @@ class ScraperApp(QMainWindow):
         if self.keyword_file_path:
             self.keyword_file_display.setText(self.keyword_file_path)
         self.overwrite_torrc_auto = params['overwrite_torrc_auto']
+        self.advanced_params = {k: params[k] for k in config_manager.ADVANCED_DEFAULTS}
         
         self.toggle_keyword_widgets(self.keyword_checkbox.isChecked())
 
@@ -976,13 +987,16 @@ class ScraperApp(QMainWindow):
         
         with self.active_tasks_lock:
             self.active_tasks_dict.clear()
+        with self.scrape_stats_lock:
+            self.scrape_stats.clear()
         
         save_page_data_mode = self.save_page_data_dropdown.currentText() # <-- Changed
         
         args = argparse.Namespace(
             urls=urls, 
             db_file=self.entries['db_file'].text(), 
-            batch_size=batch_size
+            batch_size=batch_size,
+            **self.advanced_params
             # save_all_page_data is no longer needed here
         )
         
@@ -995,7 +1009,9 @@ class ScraperApp(QMainWindow):
             self.active_tasks_dict, self.active_tasks_lock, 
             rescrape_mode, top_level_only_mode, onion_only_mode, 
             titles_only_mode, keywords, save_page_data_mode, # <-- Pass mode string
-            rescrape_page_data_mode
+            rescrape_page_data_mode,
+            self.scrape_stats, self.scrape_stats_lock,
+            self.tor_manager.pool
         )
         
         del urls 
@@ -0,0 +1,96 @@
+"""
+Hedged requests across SocksPorts.
+
+Tor latency is heavy-tailed: a request on a bad circuit can hang for most of
+the timeout while another circuit would answer in seconds. With hedging on,
+a request that has not produced response headers by its host's p90
+time-to-headers gets a duplicate through a different SocksPort. Whichever
+attempt gets headers first wins; the other is cancelled. A budget caps the
+share of requests that may be hedged, since each hedge is extra Tor load.
+"""
+
+import logging
+
+from stats_publisher import StatsPublisher
+
+# --- Defaults ---
+DEFAULT_HEDGE_BUDGET = 0.10    # At most 10% of requests get a duplicate
+DEFAULT_HEDGE_MIN_DELAY = 2.0  # Never hedge earlier than this (seconds)
+HEDGE_PERCENTILE = 0.90
+
+
+class HedgingPolicy(StatsPublisher):
+    """When to hedge, how often it is allowed, and what it achieved."""
+    stats_key = 'hedging'
+
+    def __init__(self, latency_tracker, budget=DEFAULT_HEDGE_BUDGET, min_delay=DEFAULT_HEDGE_MIN_DELAY,
+                 stats_dict=None, stats_lock=None):
+        self.latency_tracker = latency_tracker
+        self.budget = min(1.0, max(0.0, float(budget)))
+        self.min_delay = max(0.0, float(min_delay))
+        self.stats_dict = stats_dict
+        self.stats_lock = stats_lock
+
+        # Run-wide counters
+        self.requests = 0
+        self.hedges_sent = 0
+        self.hedges_won = 0       # The duplicate got headers first
+        self.hedges_lost = 0      # The original answered first; the duplicate was wasted
+        self.over_budget = 0      # Slow requests that were not hedged because of the budget
+        self.seconds_saved = 0.0  # Estimated wait avoided by winning hedges
+
+    def hedge_delay(self, netloc):
+        """Seconds to wait for headers before hedging, or None if there is no latency data yet."""
+        p90 = self.latency_tracker.percentile(netloc, HEDGE_PERCENTILE)
+        if p90 is None:
+            return None
+        return max(self.min_delay, p90)
+
+    def on_request(self):
+        self.requests += 1
+
+    def try_hedge(self):
+        """Takes a hedge from the budget. Returns False if the budget is used up."""
+        if self.hedges_sent + 1 > self.budget * self.requests:
+            self.over_budget += 1
+            return False
+        self.hedges_sent += 1
+        return True
+
+    def on_hedge_won(self, elapsed):
+        """
+        The duplicate answered first, `elapsed` seconds after the original was
+        sent. The original would still have needed (on average) as long as
+        other requests that were this slow, so that is what counts as saved.
+        """
+        self.hedges_won += 1
+        excess = self.latency_tracker.expected_excess(elapsed)
+        if excess is not None:
+            self.seconds_saved += excess
+        self._publish()
+
+    def on_hedge_lost(self):
+        self.hedges_lost += 1
+        self._publish()
+
+    def snapshot(self):
+        return {
+            "requests": self.requests,
+            "hedges_sent": self.hedges_sent,
+            "hedges_won": self.hedges_won,
+            "hedges_lost": self.hedges_lost,
+            "over_budget": self.over_budget,
+            "seconds_saved": self.seconds_saved,
+            "budget": self.budget,
+        }
+
+    def summary(self):
+        share = self.hedges_sent / self.requests if self.requests else 0.0
+        return (f"{self.hedges_sent} hedges sent ({share:.1%} of {self.requests} requests), "
+                f"{self.hedges_won} won, {self.hedges_lost} wasted, {self.over_budget} skipped over budget, "
+                f"~{self.seconds_saved:.0f}s of tail latency saved")
+
+    def close(self):
+        self._publish(force=True)
+        if self.requests:
+            logging.info(f"[HEDGE] {self.summary()}.")
@@ -40,7 +40,7 @@ class HelpDialog(QDialog):
             <li><b>Database File:</b> The SQLite file to save all scraped data.</li>
             <li><b>URL File:</b> A .txt file containing a list of starting URLs to begin a scrape.</li>
             <li><b>Keyword File:</b> A .txt file containing keywords (one per line) to search for.</li>
-            <li><b>Concurrent Requests:</b> The number of parallel workers to use for scraping.</li>
+            <li><b>Concurrent Requests:</b> The maximum number of parallel workers to use for scraping. The scraper adjusts the live limit below this ceiling based on timeouts and throughput (see the Network Activity window).</li>
             <li><b>Only scrape .onion links:</b> If checked, workers will ignore any non-.onion links.</li>
             <li><b>Keyword Search:</b> If checked, the scraper will search the text of each page for keywords from the file.</li>
             <li><b>Scrape Top-Level URLs Only:</b> If checked, the scraper will only scrape base domains (e.g., http://example.com) and not deep links.</li>
@@ -55,7 +55,7 @@ class HelpDialog(QDialog):
         
         <h3>Scrapes Menu</h3>
         <ul>
-            <li><b>Rescrape Failed:</b> Re-queues all links marked as 'failed' (status 2) for another attempt.</li>
+            <li><b>Rescrape Failed:</b> Re-queues all links marked as 'failed' (status 2) for another attempt. Links on hosts that recently stopped answering (see the <code>hosts</code> table) are left out until the host is due for a re-check.</li>
             <li><b>Rescrape for page data:</b> Re-queues all *successful* links that are missing page data. Useful if you ran a scrape with "Save page data" un-checked and now want to fill in the data.</li>
         </ul>
 
@@ -0,0 +1,185 @@
+"""
+Liveness pre-probe for hosts the scraper has never contacted.
+
+Big seed lists are mostly dead onion addresses, and finding that out with
+a full GET costs a worker slot for the whole connect timeout per URL.
+HostProber holds back the links of never-seen hosts, and opens a bare
+SOCKS5 CONNECT to each such host through Tor with a tight deadline and
+high parallelism. Reaching the host takes the same descriptor lookup and
+rendezvous as a real request, but sends no HTTP and downloads nothing.
+Links on hosts that answer go on to the full-fetch workers. Hosts that
+don't answer have their circuit opened in the host-state table (see
+HostCircuitBreaker), so this run and later runs skip them until their
+backoff expires.
+"""
+
+import asyncio
+import itertools
+import logging
+from urllib.parse import urlsplit
+
+# --- Defaults ---
+DEFAULT_PROBE_TIMEOUT = 15.0
+DEFAULT_PROBE_CONCURRENCY = 100
+SAVE_BATCH_SIZE = 200 # Probe results written to the hosts table per transaction
+
+SOCKS_VERSION = 0x05
+SOCKS_NO_AUTH = 0x00
+SOCKS_CONNECT = 0x01
+SOCKS_ATYP_DOMAIN = 0x03
+SOCKS_REPLIES = {
+    0x01: "general failure",
+    0x02: "not allowed",
+    0x03: "network unreachable",
+    0x04: "host unreachable",
+    0x05: "connection refused",
+    0x06: "TTL expired",
+    0xF0: "onion descriptor not found",
+    0xF1: "onion descriptor invalid",
+    0xF2: "onion introduction failed",
+    0xF3: "onion rendezvous failed",
+    0xF4: "onion client auth missing",
+    0xF5: "onion client auth incorrect",
+    0xF6: "onion address invalid",
+    0xF7: "onion introduction timed out",
+}
+
+
+def probe_target(url):
+    """(netloc, hostname, port) for a URL, or None if it has no usable host."""
+    try:
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+    except ValueError:
+        return None
+    if not parts.hostname:
+        return None
+    return parts.netloc, parts.hostname, port
+
+async def socks_connect(proxy_host, proxy_port, host, port):
+    """
+    Asks the SOCKS5 proxy to open a connection to host:port (resolved by the
+    proxy) and closes it again. Returns None on success or the failure reason.
+    """
+    reader, writer = await asyncio.open_connection(proxy_host, proxy_port)
+    try:
+        writer.write(bytes([SOCKS_VERSION, 1, SOCKS_NO_AUTH]))
+        greeting = await reader.readexactly(2)
+        if greeting[1] != SOCKS_NO_AUTH:
+            return "proxy refused the no-auth method"
+
+        host_bytes = host.encode('idna')
+        writer.write(bytes([SOCKS_VERSION, SOCKS_CONNECT, 0x00, SOCKS_ATYP_DOMAIN, len(host_bytes)])
+                     + host_bytes + port.to_bytes(2, 'big'))
+        reply = await reader.readexactly(2)
+        if reply[1] == 0x00:
+            return None
+        return SOCKS_REPLIES.get(reply[1], f"SOCKS error {reply[1]:#04x}")
+    finally:
+        writer.close()
+
+
+class HostProber:
+    """Pre-probes never-seen hosts and releases the links of the live ones."""
+    def __init__(self, host_breaker, proxies, latency_tracker=None,
+                 timeout=DEFAULT_PROBE_TIMEOUT, concurrency=DEFAULT_PROBE_CONCURRENCY):
+        self.host_breaker = host_breaker
+        self.proxies = proxies # Read on every probe, so SocksPorts joining or leaving the run are followed
+        self.latency_tracker = latency_tracker
+        self.timeout = max(1.0, float(timeout))
+        self.concurrency = max(1, int(concurrency))
+        self._proxy_cycle = itertools.count()
+
+        # Run-wide counters
+        self.probed = 0
+        self.alive = 0
+        self.dead = 0
+        self.unprobed = 0 # Local proxy failed; fetched without a verdict
+
+    def is_seen(self, netloc):
+        """True if an earlier fetch or probe left any trace of the host."""
+        if self.host_breaker.is_known(netloc):
+            return True
+        return bool(self.latency_tracker and self.latency_tracker.sample_count(netloc))
+
+    def hold_unseen(self, links):
+        """
+        Splits `links` (keeping their order) into links to fetch now and
+        {netloc: (hostname, port, [links])} for never-seen hosts to probe first.
+        """
+        ready, held = [], {}
+        for link in links:
+            target = probe_target(link)
+            if target is None or self.is_seen(target[0]):
+                ready.append(link)
+                continue
+            netloc, hostname, port = target
+            held.setdefault(netloc, (hostname, port, []))[2].append(link)
+        return ready, held
+
+    def _next_proxy(self):
+        proxy = self.proxies[next(self._proxy_cycle) % len(self.proxies)]
+        parts = urlsplit(proxy)
+        return parts.hostname, parts.port
+
+    async def _probe_host(self, netloc, hostname, port, semaphore):
+        """Returns (netloc, True) if the host answered, False if not, None if the local proxy failed."""
+        async with semaphore:
+            proxy_host, proxy_port = self._next_proxy()
+            try:
+                error = await asyncio.wait_for(socks_connect(proxy_host, proxy_port, hostname, port), self.timeout)
+            except asyncio.TimeoutError:
+                error = f"no answer within {self.timeout:.0f}s"
+            except (OSError, asyncio.IncompleteReadError) as e:
+                # Our own SocksPort failed; that says nothing about the host
+                logging.debug(f"[PROBE] {netloc}: proxy {proxy_host}:{proxy_port} failed ({e}). Fetching without a probe.")
+                return netloc, None
+        logging.debug(f"[PROBE] {netloc}: {'alive' if error is None else error}")
+        return netloc, error is None
+
+    async def probe(self, held, stop_event, on_alive):
+        """
+        Probes every host in `held` (from hold_unseen) and awaits
+        `on_alive(links)` with each live host's links as soon as its probe
+        succeeds (or could not be made because the local proxy failed).
+        """
+        if not held:
+            return
+        logging.info(f"[PROBE] Pre-probing {len(held)} never-seen hosts "
+                     f"({sum(len(entry[2]) for entry in held.values())} links held back).")
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = [asyncio.create_task(self._probe_host(netloc, hostname, port, semaphore))
+                 for netloc, (hostname, port, _) in held.items()]
+        unsaved = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                netloc, alive = await next_done
+                if alive is None:
+                    self.unprobed += 1
+                    await on_alive(held[netloc][2])
+                    continue
+                self.probed += 1
+                self.host_breaker.record_probe(netloc, alive)
+                unsaved.append(netloc)
+                if len(unsaved) >= SAVE_BATCH_SIZE:
+                    self.host_breaker.save_hosts(unsaved)
+                    unsaved = []
+                if alive:
+                    self.alive += 1
+                    await on_alive(held[netloc][2])
+                else:
+                    self.dead += 1
+                if stop_event.is_set():
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.host_breaker.save_hosts(unsaved)
+            logging.info(f"[PROBE] {self.summary()}.")
+
+    def summary(self):
+        summary = f"{self.probed} hosts probed: {self.alive} alive, {self.dead} dead"
+        if self.unprobed:
+            summary += f" ({self.unprobed} not probed because of proxy errors)"
+        return summary
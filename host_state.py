@@ -0,0 +1,594 @@
+"""
+Per-host (netloc) state shared by the scraper workers.
+
+HostCircuitBreaker: counts consecutive connection failures per onion host.
+After `failure_threshold` failures in a row the host's circuit "opens" and
+the remaining URLs for that host are short-circuited instead of each one
+burning a worker slot until its timeout. After a backoff period one request
+is let through as a probe ("half-open"); if it succeeds the host is closed
+again, if it fails the backoff doubles. Open hosts are written to the
+'hosts' table so later runs (and Rescrape Failed) skip known-dead hosts.
+
+HostDispatcher: the queue between the producer and the workers. It caps the
+number of requests in flight per host (with an optional politeness delay)
+and hands workers a URL from the next eligible host instead of letting one
+large site occupy every worker.
+
+HostLatencyTracker: per-host latency histograms (connect, time-to-headers,
+total), persisted in the 'host_latency' table. HostTimeoutPolicy turns them
+into per-host connect/read deadlines; hedging uses them to spot slow requests.
+"""
+
+import asyncio
+import bisect
+import heapq
+import json
+import logging
+import time
+from collections import deque, OrderedDict
+from urllib.parse import urlparse
+
+from database import DatabaseManager
+
+# --- Tuning constants ---
+DEFAULT_FAILURE_THRESHOLD = 3       # Consecutive connection failures before opening
+DEFAULT_BACKOFF_SECONDS = 600       # First open period; doubles on every failed probe
+MAX_BACKOFF_SECONDS = 7 * 24 * 3600 # Never wait longer than a week between probes
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open' # In memory only; persisted as 'open'
+
+LATENCY_METRICS = ('connect', 'ttfb', 'total')
+LATENCY_BUCKET_EDGES = tuple(round(0.05 * 1.35 ** i, 3) for i in range(28)) # 0.05s .. ~165s
+HISTOGRAM_DECAY_AT = 200     # Halve a histogram's counts past this many samples
+GLOBAL_SAMPLES = 1000        # Raw recent time-to-headers samples across all hosts
+MIN_HOST_SAMPLES = 5         # Fewer than this: fall back to the global numbers
+MIN_GLOBAL_SAMPLES = 20
+MAX_TRACKED_HOSTS = 50000
+
+DEFAULT_TIMEOUT_FLOOR = 5.0
+DEFAULT_TIMEOUT_CEILING = 60.0
+DEFAULT_NEW_HOST_CONNECT_TIMEOUT = 20.0
+DEFAULT_TOTAL_TIMEOUT_CEILING = 180.0 # Whole request, body included
+TIMEOUT_PERCENTILE = 0.99
+TIMEOUT_SAFETY_FACTOR = 3.0  # Deadline = 3x the host's p99
+MAX_TIMEOUT_WIDENINGS = 3    # A timing-out host gets at most 8x its learned deadline
+
+
+class HostState:
+    """Breaker bookkeeping for one netloc."""
+    def __init__(self, netloc):
+        self.netloc = netloc
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self.trip_count = 0
+        self.last_failure_at = None
+        self.last_success_at = None
+        self.next_probe_at = 0.0
+        self.probe_in_flight = False
+
+    def to_row(self):
+        state = STATE_CLOSED if self.state == STATE_CLOSED else STATE_OPEN
+        return (self.netloc, state, self.consecutive_failures, self.trip_count,
+                self.last_failure_at, self.last_success_at, self.next_probe_at)
+
+
+class HostCircuitBreaker:
+    """
+    Decides whether a URL's host is worth contacting. All methods are called
+    from the scraper's event loop thread, so no locking is needed.
+
+    Only connection-level failures (timeouts, SOCKS/curl errors) count; any
+    HTTP response, even a 404 or 500, proves the host is reachable.
+    """
+    def __init__(self, db_path=None, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 backoff_seconds=DEFAULT_BACKOFF_SECONDS):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.backoff_seconds = max(1, int(backoff_seconds))
+        self.hosts = {}
+        self.short_circuited = 0
+        self.db_manager = DatabaseManager(db_path) if db_path else None
+        if self.db_manager:
+            self._load()
+
+    def _load(self):
+        """Restores persisted host states from the database."""
+        try:
+            rows = self.db_manager.get_host_states()
+        except Exception as e:
+            logging.error(f"[HOSTS] Could not load host states: {e}")
+            return
+        for row in rows:
+            host = HostState(row['netloc'])
+            host.state = row['state'] or STATE_CLOSED
+            host.consecutive_failures = row['consecutive_failures'] or 0
+            host.trip_count = row['trip_count'] or 0
+            host.last_failure_at = row['last_failure_at']
+            host.last_success_at = row['last_success_at']
+            host.next_probe_at = row['next_probe_at'] or 0.0
+            self.hosts[host.netloc] = host
+        dead = sum(1 for h in self.hosts.values() if h.state == STATE_OPEN)
+        if rows:
+            logging.info(f"[HOSTS] Loaded {len(rows)} known hosts ({dead} marked dead).")
+
+    def _save(self, host):
+        if not self.db_manager:
+            return
+        try:
+            self.db_manager.save_host_states_batch([host.to_row()])
+        except Exception as e:
+            logging.error(f"[HOSTS] Could not save state for {host.netloc}: {e}")
+
+    def is_known_dead(self, netloc):
+        """True if the host is open and its next probe is not due yet."""
+        host = self.hosts.get(netloc)
+        return host is not None and host.state != STATE_CLOSED and time.time() < host.next_probe_at
+
+    def allow(self, netloc):
+        """
+        Returns True if a request to `netloc` should go out now. When an open
+        host's backoff has expired, the first caller gets through as the
+        half-open probe and everyone else is refused until it finishes.
+        """
+        host = self.hosts.get(netloc)
+        if host is None or host.state == STATE_CLOSED:
+            return True
+        if host.probe_in_flight or time.time() < host.next_probe_at:
+            self.short_circuited += 1
+            return False
+        host.state = STATE_HALF_OPEN
+        host.probe_in_flight = True
+        logging.info(f"[HOSTS] Probing {netloc} (failed {host.trip_count} time(s) before).")
+        return True
+
+    def record_success(self, netloc):
+        """The host answered with an HTTP response."""
+        host = self.hosts.get(netloc)
+        if host is None:
+            return # Never failed; nothing to track
+        was_failing = host.state != STATE_CLOSED or host.consecutive_failures
+        host.state = STATE_CLOSED
+        host.consecutive_failures = 0
+        host.probe_in_flight = False
+        host.last_success_at = time.time()
+        if host.trip_count:
+            logging.info(f"[HOSTS] {netloc} is reachable again; closing its circuit.")
+        if was_failing:
+            self._save(host)
+
+    def record_failure(self, netloc):
+        """A connection-level failure (timeout, SOCKS error, ...)."""
+        host = self.hosts.get(netloc)
+        if host is None:
+            host = self.hosts[netloc] = HostState(netloc)
+        now = time.time()
+        host.consecutive_failures += 1
+        host.last_failure_at = now
+        was_probe = host.state == STATE_HALF_OPEN
+        host.probe_in_flight = False
+
+        if was_probe or (host.state == STATE_CLOSED and host.consecutive_failures >= self.failure_threshold):
+            backoff = min(MAX_BACKOFF_SECONDS, self.backoff_seconds * (2 ** host.trip_count))
+            host.state = STATE_OPEN
+            host.trip_count += 1
+            host.next_probe_at = now + backoff
+            logging.warning(f"[HOSTS] Opening circuit for {netloc} after {host.consecutive_failures} "
+                            f"consecutive failures; next probe in {backoff}s.")
+            self._save(host)
+
+    def is_tripped(self, netloc):
+        """True if the host's circuit is open or half-open."""
+        host = self.hosts.get(netloc)
+        return host is not None and host.state != STATE_CLOSED
+
+    def is_known(self, netloc):
+        """True if the host has any recorded history (a failure, a trip or a probe result)."""
+        return netloc in self.hosts
+
+    def record_probe(self, netloc, alive):
+        """
+        Result of a liveness pre-probe of a never-seen host. A dead host's
+        circuit opens straight away; a live one is remembered as reachable.
+        Call `save_hosts` afterwards to persist a batch of probe results.
+        """
+        host = self.hosts.get(netloc)
+        if host is None:
+            host = self.hosts[netloc] = HostState(netloc)
+        now = time.time()
+        if alive:
+            host.state = STATE_CLOSED
+            host.consecutive_failures = 0
+            host.last_success_at = now
+            return
+        backoff = min(MAX_BACKOFF_SECONDS, self.backoff_seconds * (2 ** host.trip_count))
+        host.state = STATE_OPEN
+        host.consecutive_failures += 1
+        host.trip_count += 1
+        host.last_failure_at = now
+        host.next_probe_at = now + backoff
+
+    def save_hosts(self, netlocs):
+        """Persists the current state of several hosts in one transaction."""
+        if not self.db_manager or not netlocs:
+            return
+        rows = [self.hosts[netloc].to_row() for netloc in netlocs if netloc in self.hosts]
+        try:
+            self.db_manager.save_host_states_batch(rows)
+        except Exception as e:
+            logging.error(f"[HOSTS] Could not save {len(rows)} host states: {e}")
+
+    def record_cancel(self, netloc):
+        """A request was cancelled; release the probe slot without judging the host."""
+        host = self.hosts.get(netloc)
+        if host is not None and host.probe_in_flight:
+            host.probe_in_flight = False
+            host.state = STATE_OPEN
+
+    def close(self):
+        if self.short_circuited:
+            logging.info(f"[HOSTS] Skipped {self.short_circuited} requests to hosts with an open circuit.")
+        if self.db_manager:
+            self.db_manager.close()
+            self.db_manager = None
+
+
+class LatencyHistogram:
+    """
+    Log-spaced latency histogram. Counts are halved once they pass
+    HISTOGRAM_DECAY_AT, so old behaviour fades out as new samples arrive.
+    """
+    __slots__ = ('counts', 'total')
+
+    def __init__(self, counts=None):
+        self.counts = list(counts) if counts and len(counts) == len(LATENCY_BUCKET_EDGES) else [0] * len(LATENCY_BUCKET_EDGES)
+        self.total = sum(self.counts)
+
+    def add(self, seconds):
+        index = bisect.bisect_left(LATENCY_BUCKET_EDGES, seconds)
+        self.counts[min(index, len(self.counts) - 1)] += 1
+        self.total += 1
+        if self.total > HISTOGRAM_DECAY_AT:
+            self.counts = [c // 2 for c in self.counts]
+            self.total = sum(self.counts)
+
+    def quantile(self, q):
+        """Upper edge of the bucket holding the q-quantile (None if empty)."""
+        if not self.total:
+            return None
+        target = q * self.total
+        running = 0
+        for edge, count in zip(LATENCY_BUCKET_EDGES, self.counts):
+            running += count
+            if running >= target:
+                return edge
+        return LATENCY_BUCKET_EDGES[-1]
+
+    def to_json(self):
+        return json.dumps(self.counts)
+
+    @classmethod
+    def from_json(cls, text):
+        try:
+            return cls(json.loads(text)) if text else cls()
+        except (TypeError, ValueError):
+            return cls()
+
+
+class HostLatencyTracker:
+    """
+    Per-host histograms of connect time (SOCKS handshake + circuit setup),
+    time-to-headers and total fetch time, plus overall histograms. Loaded
+    from and saved to the 'host_latency' table so a new run starts warm.
+    """
+    def __init__(self):
+        self._hosts = OrderedDict() # netloc -> {metric: LatencyHistogram} (LRU order)
+        self._global = {metric: LatencyHistogram() for metric in LATENCY_METRICS}
+        self._recent_ttfb = deque(maxlen=GLOBAL_SAMPLES) # Raw samples for expected_excess()
+        self._dirty = set()
+
+    def _histograms(self, netloc, create=False):
+        histograms = self._hosts.get(netloc)
+        if histograms is None and create:
+            histograms = self._hosts[netloc] = {metric: LatencyHistogram() for metric in LATENCY_METRICS}
+            if len(self._hosts) > MAX_TRACKED_HOSTS:
+                evicted, _ = self._hosts.popitem(last=False)
+                self._dirty.discard(evicted)
+        elif histograms is not None:
+            self._hosts.move_to_end(netloc)
+        return histograms
+
+    def record(self, netloc, ttfb=None, connect=None, total=None):
+        """Adds one successful request's timings (seconds; None = not measured)."""
+        histograms = self._histograms(netloc, create=True)
+        for metric, value in (('connect', connect), ('ttfb', ttfb), ('total', total)):
+            if value is not None:
+                histograms[metric].add(value)
+                self._global[metric].add(value)
+        if ttfb is not None:
+            self._recent_ttfb.append(ttfb)
+        self._dirty.add(netloc)
+
+    def sample_count(self, netloc, metric='ttfb'):
+        histograms = self._hosts.get(netloc)
+        return histograms[metric].total if histograms else 0
+
+    def host_percentile(self, netloc, q, metric='ttfb'):
+        """The host's own q-percentile, or None if it has too few samples."""
+        histograms = self._hosts.get(netloc)
+        if histograms is None or histograms[metric].total < MIN_HOST_SAMPLES:
+            return None
+        return histograms[metric].quantile(q)
+
+    def percentile(self, netloc, q, metric='ttfb'):
+        """The host's q-percentile, the global one if the host has too few samples, else None."""
+        value = self.host_percentile(netloc, q, metric)
+        if value is not None:
+            return value
+        if self._global[metric].total >= MIN_GLOBAL_SAMPLES:
+            return self._global[metric].quantile(q)
+        return None
+
+    def expected_excess(self, elapsed):
+        """
+        Mean extra wait of requests that were still unanswered after `elapsed`
+        seconds, i.e. E[latency - elapsed | latency > elapsed]. None if unknown.
+        """
+        slower = [s - elapsed for s in self._recent_ttfb if s > elapsed]
+        return sum(slower) / len(slower) if slower else None
+
+    def load(self, db_manager):
+        """Restores per-host histograms saved by an earlier run."""
+        try:
+            rows = db_manager.get_host_latency()
+        except Exception as e:
+            logging.error(f"[HOSTS] Could not load latency histograms: {e}")
+            return
+        for row in rows:
+            histograms = {metric: LatencyHistogram.from_json(row[f'{metric}_hist']) for metric in LATENCY_METRICS}
+            self._hosts[row['netloc']] = histograms
+            for metric, histogram in histograms.items():
+                global_histogram = self._global[metric]
+                global_histogram.counts = [a + b for a, b in zip(global_histogram.counts, histogram.counts)]
+                global_histogram.total += histogram.total
+        while len(self._hosts) > MAX_TRACKED_HOSTS:
+            self._hosts.popitem(last=False)
+        if rows:
+            logging.info(f"[HOSTS] Loaded latency history for {len(rows)} hosts.")
+
+    def save(self, db_manager):
+        """Writes the histograms of every host that got new samples this run."""
+        now = time.time()
+        rows = []
+        for netloc in self._dirty:
+            histograms = self._hosts.get(netloc)
+            if histograms:
+                rows.append((netloc, histograms['connect'].to_json(), histograms['ttfb'].to_json(),
+                             histograms['total'].to_json(), now))
+        try:
+            db_manager.save_host_latency_batch(rows)
+            self._dirty.clear()
+        except Exception as e:
+            logging.error(f"[HOSTS] Could not save latency histograms: {e}")
+
+
+class HostTimeoutPolicy:
+    """
+    Per-host connect and read deadlines learned from HostLatencyTracker,
+    replacing a single fixed timeout. Hosts with no history get a short
+    connect deadline so dead onions fail fast; a host that times out at its
+    learned deadline gets twice as long next time until it answers again.
+    """
+    def __init__(self, latency_tracker, floor=DEFAULT_TIMEOUT_FLOOR, ceiling=DEFAULT_TIMEOUT_CEILING,
+                 new_host_connect=DEFAULT_NEW_HOST_CONNECT_TIMEOUT, enabled=True,
+                 total_ceiling=DEFAULT_TOTAL_TIMEOUT_CEILING):
+        self.latency_tracker = latency_tracker
+        self.floor = max(1.0, float(floor))
+        self.ceiling = max(self.floor, float(ceiling))
+        self.total_ceiling = max(self.ceiling, float(total_ceiling))
+        self.new_host_connect = min(self.ceiling, max(self.floor, float(new_host_connect)))
+        self.enabled = enabled
+        self._widen = {} # netloc -> consecutive timeouts
+
+    def _clamp(self, seconds):
+        return min(self.ceiling, max(self.floor, seconds))
+
+    def timeouts_for(self, netloc):
+        """
+        (connect, read) deadlines in seconds for the next request to `netloc`,
+        or the single ceiling timeout when adaptive timeouts are off.
+        """
+        if not self.enabled:
+            return self.ceiling
+        tracker = self.latency_tracker
+        widen = 2 ** self._widen.get(netloc, 0)
+
+        connect_p99 = tracker.host_percentile(netloc, TIMEOUT_PERCENTILE, 'connect')
+        ttfb_p99 = tracker.host_percentile(netloc, TIMEOUT_PERCENTILE, 'ttfb')
+        if connect_p99 is None:
+            connect_p99 = ttfb_p99 # curl timing not available: headers time is an upper bound
+        connect = self._clamp(connect_p99 * TIMEOUT_SAFETY_FACTOR * widen) if connect_p99 else self._clamp(self.new_host_connect * widen)
+        read = self._clamp(ttfb_p99 * TIMEOUT_SAFETY_FACTOR * widen) if ttfb_p99 else self.ceiling
+        return (connect, read)
+
+    def total_for(self, netloc):
+        """
+        Deadline in seconds for the whole request to `netloc`, body included:
+        3x the host's p99 total time, between the read ceiling and the total
+        ceiling. Hosts with no history (or adaptive timeouts off) get the total ceiling.
+        """
+        if not self.enabled:
+            return self.total_ceiling
+        total_p99 = self.latency_tracker.host_percentile(netloc, TIMEOUT_PERCENTILE, 'total')
+        if not total_p99:
+            return self.total_ceiling
+        widen = 2 ** self._widen.get(netloc, 0)
+        return min(self.total_ceiling, max(self.ceiling, total_p99 * TIMEOUT_SAFETY_FACTOR * widen))
+
+    def on_result(self, netloc, timed_out):
+        if timed_out:
+            self._widen[netloc] = min(MAX_TIMEOUT_WIDENINGS, self._widen.get(netloc, 0) + 1)
+        else:
+            self._widen.pop(netloc, None)
+
+
+def interleave_by_host(links):
+    """
+    Reorders links so consecutive entries come from different hosts
+    (round-robin over netlocs, keeping each host's original order). Stops one
+    big site from filling the whole queue before any other host gets in.
+    """
+    by_host = {}
+    for link in links:
+        by_host.setdefault(urlparse(link).netloc, deque()).append(link)
+    backlogs = deque(by_host.values())
+    interleaved = []
+    while backlogs:
+        backlog = backlogs.popleft()
+        interleaved.append(backlog.popleft())
+        if backlog:
+            backlogs.append(backlog)
+    return interleaved
+
+
+class HostDispatcher:
+    """
+    Host-aware replacement for the asyncio.Queue between the producer and
+    the workers. Items are (url, task_id) tuples, kept in one FIFO per netloc.
+
+    `get()` hands out the next item from a host that has fewer than
+    `max_per_host` requests in flight and whose politeness delay has passed,
+    rotating round-robin over hosts, so workers stay busy on other hosts
+    instead of piling onto one slow hidden service. Workers must call
+    `task_done(url)` so the host's in-flight slot is released.
+    """
+    def __init__(self, maxsize=0, max_per_host=4, min_delay=0.0):
+        self.maxsize = maxsize
+        self.max_per_host = max(1, int(max_per_host))
+        self.min_delay = max(0.0, float(min_delay))
+
+        self._backlogs = {}   # netloc -> deque of items
+        self._in_flight = {}  # netloc -> requests handed out and not yet done
+        self._next_allowed = {} # netloc -> monotonic time of the next allowed dispatch
+        self._ready = deque() # Hosts that can dispatch now, in round-robin order
+        self._ready_set = set()
+        self._delayed = []    # Heap of (time, netloc) waiting for their politeness delay
+        self._getters = deque()
+        self._size = 0
+        self._unfinished_tasks = 0
+        self._finished = asyncio.Event()
+        self._finished.set()
+
+    # --- asyncio.Queue compatible surface ---
+    def qsize(self):
+        return self._size
+
+    def empty(self):
+        return self._size == 0
+
+    def full(self):
+        return 0 < self.maxsize <= self._size
+
+    def put_nowait(self, item):
+        if self.full():
+            raise asyncio.QueueFull
+        host = urlparse(item[0]).netloc
+        self._backlogs.setdefault(host, deque()).append(item)
+        self._size += 1
+        self._unfinished_tasks += 1
+        self._finished.clear()
+        self._reconsider(host)
+
+    async def get(self):
+        while True:
+            item = self._pop_eligible()
+            if item is not None:
+                return item
+
+            getter = asyncio.get_running_loop().create_future()
+            self._getters.append(getter)
+            wait = self._seconds_until_delayed()
+            try:
+                await asyncio.wait_for(asyncio.shield(getter), timeout=wait)
+            except asyncio.TimeoutError:
+                pass # A delayed host may be eligible now; look again
+            except asyncio.CancelledError:
+                if getter.done() and not getter.cancelled():
+                    self._wake_one() # Pass the wake-up on to another worker
+                raise
+            finally:
+                if not getter.done():
+                    getter.cancel()
+                try:
+                    self._getters.remove(getter)
+                except ValueError:
+                    pass
+
+    def task_done(self, url=None):
+        if self._unfinished_tasks <= 0:
+            raise ValueError('task_done() called too many times')
+        if url is not None:
+            host = urlparse(url).netloc
+            self._in_flight[host] = max(0, self._in_flight.get(host, 0) - 1)
+            if not self._in_flight[host]:
+                del self._in_flight[host]
+            self._reconsider(host)
+        self._unfinished_tasks -= 1
+        if self._unfinished_tasks == 0:
+            self._finished.set()
+
+    async def join(self):
+        if self._unfinished_tasks > 0:
+            await self._finished.wait()
+
+    # --- Scheduling ---
+    def _reconsider(self, host):
+        """Puts `host` on the ready list (or the delay heap) if it can dispatch."""
+        if host in self._ready_set or not self._backlogs.get(host):
+            return
+        if self._in_flight.get(host, 0) >= self.max_per_host:
+            return
+        allowed_at = self._next_allowed.get(host, 0.0)
+        if allowed_at > time.monotonic():
+            heapq.heappush(self._delayed, (allowed_at, host))
+            return
+        self._ready.append(host)
+        self._ready_set.add(host)
+        self._wake_one()
+
+    def _promote_delayed(self):
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, host = heapq.heappop(self._delayed)
+            self._reconsider(host)
+
+    def _seconds_until_delayed(self):
+        if not self._delayed:
+            return None
+        return max(0.01, self._delayed[0][0] - time.monotonic())
+
+    def _pop_eligible(self):
+        self._promote_delayed()
+        while self._ready:
+            host = self._ready.popleft()
+            self._ready_set.discard(host)
+            backlog = self._backlogs.get(host)
+            if not backlog or self._in_flight.get(host, 0) >= self.max_per_host:
+                continue # Stale entry; _reconsider re-adds it when it can dispatch
+            item = backlog.popleft()
+            if not backlog:
+                del self._backlogs[host]
+            self._size -= 1
+            self._in_flight[host] = self._in_flight.get(host, 0) + 1
+            if self.min_delay:
+                self._next_allowed[host] = time.monotonic() + self.min_delay
+            self._reconsider(host) # Back of the round-robin line
+            return item
+        return None
+
+    def _wake_one(self):
+        while self._getters:
+            getter = self._getters.popleft()
+            if not getter.done():
+                getter.set_result(None)
+                return
@@ -0,0 +1,287 @@
+"""
+Keyword matching, compiled once per run.
+
+A keyword file line is one of:
+
+    word / multi word phrase  - plain keyword. Single words match as whole
+                                words, phrases as substrings (case-insensitive).
+    REGEX: (?=...)            - "Assert" regex: checked once against the whole
+                                page; the keyword line itself is recorded.
+    REGEX: pattern            - "Find" regex: every match is recorded (stripped).
+
+KeywordMatcher classifies the lines and compiles every pattern when it is
+built, instead of on every page. Plain keywords are found in one pass
+over the lowercased text whatever their number: a single word matches
+when it is one of the text's space-separated tokens (the same test as
+" word " in " text "), so all of them are one set lookup per token, and
+phrases go through one Aho-Corasick automaton. The Find patterns are also
+added to one RE2 Set, which tells in a single scan of the page which of
+them match at all; only those are then run to collect their matches. The same object
+drives the database's keyword threshold pull (candidate SQL filter and the
+per-row match count), so both sides read the keyword file the same way.
+
+match_hits() also returns a hit record per matched keyword: its hit key
+(a plain keyword lowercased, or the REGEX: line), how often it occurs,
+and the offsets and surrounding text of its first few hits. The scraper
+stores them in the keyword_hits table, where threshold pulls count them
+with an index lookup instead of re-reading keyword_match.
+"""
+
+import logging
+
+import re2 as re
+
+from aho_corasick import AhoCorasick
+
+REGEX_PREFIX = "REGEX: "
+ASSERT_PREFIX = "(?="
+MATCH_DELIMITER = " _!|!_ " # Separates matches in links.keyword_match
+
+# Below this many phrases, one substring scan each is cheaper than the automaton
+AUTOMATON_MIN_PHRASES = 32
+
+DEFAULT_HIT_OFFSETS = 5 # Hits per keyword whose offset and snippet are kept
+DEFAULT_SNIPPET_CHARS = 40 # Context kept on each side of a hit
+
+
+def _build_search_set(patterns):
+    """An RE2 Set of `patterns` (case-insensitive), or None if the regex module has no Set support."""
+    set_class = getattr(re, 'Set', None)
+    if set_class is None or not patterns:
+        return None
+    try:
+        options = re.Options()
+        options.case_sensitive = False
+        options.log_errors = False
+        search_set = set_class.SearchSet(options)
+        for pattern in patterns:
+            search_set.Add(pattern)
+        search_set.Compile()
+        return search_set
+    except Exception as e:
+        logging.debug(f"[KEYWORDS] RE2 Set unavailable, running each Find regex separately: {e}")
+        return None
+
+
+class KeywordMatcher:
+    """Classified, precompiled keyword list. Picklable (rebuilt from the keyword lines)."""
+    def __init__(self, keywords, hit_offsets=DEFAULT_HIT_OFFSETS, snippet_chars=DEFAULT_SNIPPET_CHARS):
+        self.keywords = list(keywords or [])
+        self.hit_offsets = max(0, int(hit_offsets))
+        self.snippet_chars = max(0, int(snippet_chars))
+        self.plain = [] # Plain keyword lines
+        self.words = {} # Lowercased single word -> keywords spelling it
+        self.phrases = [] # (keyword, lowercased phrase)
+        self.plain_lower = set() # Lowercased plain keywords, for the threshold pull
+        self.assert_patterns = [] # (keyword line, compiled pattern)
+        self.find_patterns = [] # (keyword line, compiled pattern)
+        self.invalid = [] # (keyword line, error)
+
+        seen = set()
+        for keyword in self.keywords:
+            if keyword in seen:
+                continue
+            seen.add(keyword)
+            if keyword.startswith(REGEX_PREFIX):
+                pattern = keyword[len(REGEX_PREFIX):].strip()
+                try:
+                    compiled = re.compile(pattern, re.IGNORECASE)
+                except re.error as e:
+                    logging.warning(f"Invalid regex in keyword file (skipping): '{keyword}'. Error: {e}")
+                    self.invalid.append((keyword, e))
+                    continue
+                if pattern.startswith(ASSERT_PREFIX):
+                    self.assert_patterns.append((keyword, compiled))
+                else:
+                    self.find_patterns.append((keyword, compiled))
+            else:
+                keyword_lower = keyword.lower()
+                # Multi-word: substring search. Single word: whole-word match
+                self.plain.append(keyword)
+                if ' ' in keyword_lower:
+                    self.phrases.append((keyword, keyword_lower))
+                else:
+                    self.words.setdefault(keyword_lower, []).append(keyword)
+                self.plain_lower.add(keyword.strip().lower())
+
+        self.phrase_automaton = None
+        if len(self.phrases) >= AUTOMATON_MIN_PHRASES:
+            self.phrase_automaton = AhoCorasick([phrase for _, phrase in self.phrases])
+        self.find_set = _build_search_set([compiled.pattern for _, compiled in self.find_patterns])
+
+    @classmethod
+    def build(cls, keywords, **options):
+        """`keywords` as a KeywordMatcher (returned as-is if it already is one), or None if empty."""
+        if isinstance(keywords, cls):
+            return keywords
+        return cls(keywords, **options) if keywords else None
+
+    def __bool__(self):
+        return bool(self.plain or self.assert_patterns or self.find_patterns)
+
+    def __getstate__(self):
+        # Compiled patterns don't pickle; a parse process rebuilds them once
+        return {"keywords": self.keywords, "hit_offsets": self.hit_offsets, "snippet_chars": self.snippet_chars}
+
+    def __setstate__(self, state):
+        self.__init__(state["keywords"], state["hit_offsets"], state["snippet_chars"])
+
+    def summary(self):
+        summary = (f"{len(self.plain)} plain, {len(self.find_patterns)} find-regex, "
+                   f"{len(self.assert_patterns)} assert-regex keywords")
+        if self.phrase_automaton is not None:
+            summary += " (phrases matched by an Aho-Corasick automaton)"
+        if self.find_set is not None:
+            summary += " (find-regex prefiltered by an RE2 Set)"
+        if self.invalid:
+            summary += f", {len(self.invalid)} invalid skipped"
+        return summary
+
+    # --- Page matching ---
+
+    def _candidate_find_patterns(self, page_text):
+        if self.find_set is None:
+            return self.find_patterns
+        hits = self.find_set.Match(page_text)
+        if not hits:
+            return []
+        return [self.find_patterns[index] for index in sorted(hits)]
+
+    def find_plain(self, page_text):
+        """Plain keywords (original case) found in `page_text`."""
+        # Pad the whole document for reliable whole-word matching
+        page_text_padded = f" {page_text.lower()} "
+        found = []
+        if self.words:
+            # " word " occurs exactly when word is one of the space-separated tokens
+            for token in set(page_text_padded.split(' ')).intersection(self.words):
+                found.extend(self.words[token])
+        if self.phrase_automaton is not None:
+            found.extend(self.phrases[index][0] for index in self.phrase_automaton.search(page_text_padded))
+        else:
+            found.extend(keyword for keyword, phrase in self.phrases if phrase in page_text_padded)
+        return found
+
+    def _scan(self, page_text, base_url, hits):
+        """Unique matches in `page_text`; hit records are appended to `hits` unless it is None."""
+        matches = set()
+        if self.plain:
+            plain_hits = {} # Hit key -> the first keyword spelling it
+            for keyword in self.find_plain(page_text):
+                matches.add(keyword) # Store the original cased keyword
+                plain_hits.setdefault(keyword.strip().lower(), keyword)
+                logging.info(f"[KEYWORD HIT] Found '{keyword}' at {base_url}")
+            if hits is not None and plain_hits:
+                self._plain_hits(page_text, plain_hits, hits)
+
+        for keyword, compiled in self.assert_patterns:
+            # Lookaheads don't capture, so the keyword line itself is recorded
+            match = compiled.search(page_text)
+            if match:
+                matches.add(keyword)
+                logging.info(f"[KEYWORD HIT] Whole-document regex '{compiled.pattern}' matched at {base_url}")
+                if hits is not None:
+                    hits.append(self._hit(keyword, 1, [(match.start(), match.end())], page_text))
+
+        for keyword, compiled in self._candidate_find_patterns(page_text):
+            count, spans = 0, []
+            for match in compiled.finditer(page_text):
+                stripped_match = match.group(0).strip()
+                if stripped_match:
+                    matches.add(stripped_match)
+                    logging.info(f"[KEYWORD HIT] Regex '{compiled.pattern}' found: '{stripped_match}' at {base_url}")
+                    count += 1
+                    if len(spans) < self.hit_offsets:
+                        spans.append(match.span())
+            if hits is not None and count:
+                hits.append(self._hit(keyword, count, spans, page_text))
+        return matches
+
+    def _plain_hits(self, page_text, plain_hits, hits):
+        page_text_lower = page_text.lower()
+        page_text_padded = f" {page_text_lower} "
+        # Offsets in the lowercased text are the page's own unless lowercasing changed its length
+        source = page_text if len(page_text_lower) == len(page_text) else page_text_lower
+        for key, keyword in plain_hits.items():
+            keyword_lower = keyword.lower()
+            if ' ' in keyword_lower:
+                needle, shift, length = keyword_lower, -1, len(keyword_lower)
+                step = 1
+            else:
+                # " word ": the match starts at the leading space, which is the padding's offset
+                needle, shift, length = f" {keyword_lower} ", 0, len(keyword_lower)
+                step = len(needle) - 1 # The trailing space may lead the next hit
+            count, spans = 0, []
+            position = page_text_padded.find(needle)
+            while position != -1:
+                count += 1
+                if len(spans) < self.hit_offsets:
+                    start = max(0, position + shift)
+                    spans.append((start, start + length))
+                position = page_text_padded.find(needle, position + step)
+            hits.append(self._hit(key, count, spans, source))
+
+    def _hit(self, key, count, spans, text):
+        """(hit key, hit count, offsets, snippets) for one keyword."""
+        offsets = [start for start, _ in spans]
+        snippets = [text[max(0, start - self.snippet_chars):end + self.snippet_chars].strip() for start, end in spans]
+        return key, count, offsets, snippets
+
+    def hit_keys(self):
+        """Hit keys of every usable keyword (plain keywords lowercased, regex keywords as their line)."""
+        return self.plain_lower | {keyword for keyword, _ in self.assert_patterns} | {
+            keyword for keyword, _ in self.find_patterns}
+
+    def find_matches(self, page_text, base_url=None):
+        """The set of unique matches in `page_text` (plain keywords, assert lines, stripped find matches)."""
+        return self._scan(page_text, base_url, None)
+
+    def match(self, page_text, base_url=None):
+        """The keyword_match string for a page (sorted unique matches), or None."""
+        matches = self.find_matches(page_text, base_url)
+        return MATCH_DELIMITER.join(sorted(matches)) if matches else None
+
+    def match_hits(self, page_text, base_url=None):
+        """(keyword_match string or None, hit records) for a page; see _hit for the record layout."""
+        hits = []
+        matches = self._scan(page_text, base_url, hits)
+        return (MATCH_DELIMITER.join(sorted(matches)) if matches else None), hits
+
+    # --- Stored matches (links.keyword_match) ---
+
+    def sql_filter(self):
+        """
+        (sql, values) selecting rows whose keyword_match may hold one of the
+        keywords; None if no keyword is usable. Needs the REGEXP function.
+        """
+        parts, values = [], []
+        for keyword in sorted(self.plain_lower):
+            parts.append("LOWER(keyword_match) LIKE ?")
+            values.append(f"%{keyword}%")
+        for keyword, _ in self.assert_patterns:
+            # Assert hits are stored as the keyword line itself
+            parts.append("LOWER(keyword_match) LIKE ?")
+            values.append(f"%{keyword.lower()}%")
+        for _, compiled in self.find_patterns:
+            # Executes the pattern against the stored words
+            parts.append("keyword_match REGEXP ?")
+            values.append(compiled.pattern)
+        if not parts:
+            return None
+        return " OR ".join(parts), values
+
+    def count_stored_matches(self, keyword_match_string):
+        """Number of distinct keywords (plain, assert, find) found in a stored keyword_match string."""
+        if not keyword_match_string:
+            return 0
+        stored = {k.strip() for k in keyword_match_string.split(MATCH_DELIMITER)}
+        count = len({k.lower() for k in stored} & self.plain_lower)
+        count += sum(1 for keyword, _ in self.assert_patterns if keyword in stored)
+
+        stored_words_only = [k for k in stored if not k.startswith(REGEX_PREFIX)]
+        if stored_words_only:
+            for _, compiled in self.find_patterns:
+                # A pattern counts once, however many stored words it matches
+                if any(compiled.search(word) for word in stored_words_only):
+                    count += 1
+        return count
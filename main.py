@@ -14,6 +14,7 @@ import subprocess
 import os
 import ctypes # Added for admin check
 import asyncio
+import multiprocessing
 
 # --- 1. Library Installation ---
 # Import the installer and SCRIPT_DIR first.
@@ -99,6 +100,9 @@ def run_as_admin():
 
 # --- 4. Main Execution ---
 if __name__ == "__main__":
+    # Parse worker processes (parse_pool.py) are spawned from this script; in a
+    # frozen build they must run their task here instead of starting the GUI.
+    multiprocessing.freeze_support()
     
     # --- FIX for "ValueError: too many file descriptors" ---
     if sys.platform == "win32":
@@ -0,0 +1,167 @@
+"""
+Near-duplicate page detection with SimHash.
+
+Onion space is full of mirrors, clones and templated error pages. Each
+page's text gets a 64-bit SimHash fingerprint in the parse stage: every
+distinct word (shingle of SHINGLE_WORDS words) is hashed, and each
+fingerprint bit is the majority vote of that bit over all of them,
+weighted by how often each occurs. Pages whose texts differ in a few
+words get fingerprints that differ in a few bits, so two pages are
+near-duplicates when the Hamming distance of their fingerprints is at
+most `max_distance`.
+
+NearDuplicateIndex holds the fingerprints of the canonical pages (the
+first page seen with that text) and finds a match without comparing
+against every page: the 64 bits are cut into max_distance + 1 blocks,
+and two fingerprints within the distance agree on at least one whole
+block, so only pages sharing a block value are compared. The worker
+stores a duplicate's fingerprint and a reference to its canonical page
+(links.simhash / links.duplicate_of) instead of a copy of its text, so only
+pages whose text was saved become canonical pages.
+"""
+
+import hashlib
+import logging
+
+from database import DatabaseManager
+
+FINGERPRINT_BITS = 64
+# Words per hashed shingle. Longer shingles also weigh word order, but every
+# edited word then changes several of them: mirrors with a few words changed
+# (address, counters) were matched far less often with 3 than with 1.
+SHINGLE_WORDS = 1
+MIN_FINGERPRINT_WORDS = 8 # Pages with less text are not fingerprinted (all near-empty pages would match)
+DEFAULT_MAX_DISTANCE = 3 # Differing bits of two near-duplicate fingerprints
+
+# Stored on a duplicate's page_data instead of the text
+DUPLICATE_PAGE_DATA_PREFIX = "Duplicate of: "
+
+_BYTE_BITS = [[(value >> bit) & 1 for bit in range(8)] for value in range(256)]
+
+
+def simhash(text):
+    """64-bit SimHash of `text` (word shingles, case-insensitive), or None if it is too short."""
+    words = text.lower().split()
+    if len(words) < MIN_FINGERPRINT_WORDS:
+        return None
+    shingles = {}
+    for start in range(len(words) - SHINGLE_WORDS + 1):
+        shingle = " ".join(words[start:start + SHINGLE_WORDS])
+        shingles[shingle] = shingles.get(shingle, 0) + 1
+
+    # Per-bit votes, tallied per byte value: 8 additions per shingle instead of 64
+    byte_tallies = [[0] * 256 for _ in range(FINGERPRINT_BITS // 8)]
+    total = 0
+    for shingle, weight in shingles.items():
+        digest = hashlib.blake2b(shingle.encode('utf-8'), digest_size=FINGERPRINT_BITS // 8).digest()
+        for position, value in enumerate(digest):
+            byte_tallies[position][value] += weight
+        total += weight
+
+    fingerprint = 0
+    for position, tally in enumerate(byte_tallies):
+        ones = [0] * 8
+        for value, weight in enumerate(tally):
+            if weight:
+                bits = _BYTE_BITS[value]
+                for bit in range(8):
+                    if bits[bit]:
+                        ones[bit] += weight
+        for bit in range(8):
+            if ones[bit] * 2 > total:
+                fingerprint |= 1 << (position * 8 + bit)
+    return fingerprint
+
+def hamming_distance(first, second):
+    return bin(first ^ second).count('1')
+
+def to_signed(fingerprint):
+    """The fingerprint as the signed 64-bit integer SQLite stores."""
+    return fingerprint - (1 << FINGERPRINT_BITS) if fingerprint >= 1 << (FINGERPRINT_BITS - 1) else fingerprint
+
+def from_signed(value):
+    return value + (1 << FINGERPRINT_BITS) if value < 0 else value
+
+def duplicate_page_data(canonical_url):
+    return f"{DUPLICATE_PAGE_DATA_PREFIX}{canonical_url}"
+
+
+class NearDuplicateIndex:
+    """
+    Fingerprints of the canonical pages, seeded from the database. All
+    methods are called from the scraper's event loop thread, so no locking
+    is needed.
+    """
+    def __init__(self, db_path=None, max_distance=DEFAULT_MAX_DISTANCE, skip_links=False):
+        self.skip_links = skip_links # Don't queue the outlinks of duplicates
+        self.max_distance = min(max(0, int(max_distance)), FINGERPRINT_BITS // 2 - 1)
+        blocks = self.max_distance + 1
+        width = FINGERPRINT_BITS // blocks
+        # (shift, mask) of each block; the last one takes the leftover bits
+        self._blocks = [(index * width, (1 << (width if index < blocks - 1 else FINGERPRINT_BITS - index * width)) - 1)
+                        for index in range(blocks)]
+        self._tables = [{} for _ in self._blocks] # block value -> fingerprints
+        self._urls = {} # fingerprint -> canonical url
+        self.pages_checked = 0
+        self.duplicates_found = 0
+        if db_path:
+            self._load(db_path)
+
+    def _load(self, db_path):
+        """Indexes the canonical pages already in the database."""
+        db = DatabaseManager(db_path)
+        try:
+            rows = db.get_page_fingerprints()
+        except Exception as e:
+            logging.error(f"[DEDUP] Could not load page fingerprints: {e}")
+            return
+        finally:
+            db.close()
+        for url, fingerprint in rows:
+            self.add(url, from_signed(fingerprint))
+        if rows:
+            logging.info(f"[DEDUP] Loaded {len(rows)} page fingerprints.")
+
+    def add(self, url, fingerprint):
+        """Indexes `url` as the canonical page of `fingerprint` (the first url of a fingerprint is kept)."""
+        if fingerprint in self._urls:
+            return
+        self._urls[fingerprint] = url
+        for table, (shift, mask) in zip(self._tables, self._blocks):
+            table.setdefault((fingerprint >> shift) & mask, []).append(fingerprint)
+
+    def find(self, fingerprint, exclude_url=None):
+        """The canonical url of a page within max_distance of `fingerprint` (not `exclude_url`), or None."""
+        url = self._urls.get(fingerprint)
+        if url is not None and url != exclude_url:
+            return url
+        for table, (shift, mask) in zip(self._tables, self._blocks):
+            for candidate in table.get((fingerprint >> shift) & mask, ()):
+                if hamming_distance(fingerprint, candidate) <= self.max_distance:
+                    url = self._urls[candidate]
+                    if url != exclude_url:
+                        return url
+        return None
+
+    def check(self, url, fingerprint, keeps_text=True):
+        """
+        The canonical url `url`'s page duplicates, or None; a page that is not
+        a duplicate becomes the canonical page of its fingerprint if its text
+        is saved (`keeps_text`).
+        """
+        self.pages_checked += 1
+        canonical_url = self.find(fingerprint, exclude_url=url)
+        if canonical_url is None:
+            if keeps_text:
+                self.add(url, fingerprint)
+        else:
+            self.duplicates_found += 1
+        return canonical_url
+
+    def summary(self):
+        return (f"{self.pages_checked} pages fingerprinted, {self.duplicates_found} near-duplicates "
+                f"(max {self.max_distance} differing bits), {len(self._urls)} distinct pages indexed")
+
+    def close(self):
+        if self.pages_checked:
+            logging.info(f"[DEDUP] {self.summary()}.")
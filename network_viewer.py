@@ -43,16 +43,27 @@ def format_total_size(b):
     if b < 1024: return f"{b:.2f} GB"
     b /= 1024.0
     return f"{b:.2f} TB"
+
+def format_task_bytes(task_data):
+    """Wire bytes of a task, plus the decoded size when the page came compressed."""
+    wire = task_data.get('bytes', 0)
+    decoded = task_data.get('decoded_bytes', 0)
+    if decoded and decoded != wire:
+        return f"{wire:,} B ({decoded:,} B decoded)"
+    return f"{wire:,} B"
 # --- END NEW ---
 
 # --- REMOVED (Request 1): abbreviate_site function is no longer needed ---
 
 class NetworkActivityViewer(QDialog):
     """A dialog to show active scraper tasks and Tor network I/O."""
-    def __init__(self, active_tasks_dict, active_tasks_lock, tor_pid, parent=None):
+    def __init__(self, active_tasks_dict, active_tasks_lock, tor_pid, parent=None,
+                 scrape_stats=None, scrape_stats_lock=None):
         super().__init__(parent)
         self.active_tasks_dict = active_tasks_dict
         self.active_tasks_lock = active_tasks_lock
+        self.scrape_stats = scrape_stats if scrape_stats is not None else {}
+        self.scrape_stats_lock = scrape_stats_lock or threading.Lock()
         self.tor_pid = tor_pid
         self.running = True
 
@@ -86,6 +97,11 @@ class NetworkActivityViewer(QDialog):
         self.active_column_headers = ["Worker", "Site", "Bytes"]
         self.finished_column_headers = ["Worker", "Site", "Title", "Bytes"]
         # --- END FIX ---
+        self.proxy_column_headers = ["SocksPort", "In-Flight", "Latency (EWMA)", "Error Rate", "Requests", "Status"]
+        # Resize mode of each column, same order as the headers
+        self.active_column_modes = [QHeaderView.ResizeToContents, QHeaderView.Stretch, QHeaderView.ResizeToContents]
+        self.finished_column_modes = [QHeaderView.ResizeToContents, QHeaderView.Stretch, QHeaderView.Stretch, QHeaderView.ResizeToContents]
+        self.proxy_column_modes = [QHeaderView.Stretch] * len(self.proxy_column_headers)
         
         # --- FIX: Create persistent list for last 50 finished tasks ---
         self.finished_tasks_list = deque(maxlen=50)
@@ -197,7 +213,7 @@ class NetworkActivityViewer(QDialog):
         active_layout = QVBoxLayout()
         self.active_table = QTableWidget()
         # --- FIX (Request 1): Setup active table with its specific headers ---
-        self.setup_table_widget(self.active_table, self.active_column_headers) 
+        self.setup_table_widget(self.active_table, self.active_column_headers, self.active_column_modes) 
         active_layout.addWidget(self.active_table)
         active_group.setLayout(active_layout)
         
@@ -206,7 +222,7 @@ class NetworkActivityViewer(QDialog):
         finished_layout = QVBoxLayout()
         self.finished_table = QTableWidget()
         # --- FIX (Request 1): Setup finished table with its specific headers ---
-        self.setup_table_widget(self.finished_table, self.finished_column_headers) 
+        self.setup_table_widget(self.finished_table, self.finished_column_headers, self.finished_column_modes) 
         finished_layout.addWidget(self.finished_table)
         finished_group.setLayout(finished_layout)
         # --- END FIX ---
@@ -219,6 +235,17 @@ class NetworkActivityViewer(QDialog):
         layout.addLayout(tables_layout) # Add tables layout
         # --- END FIX ---
 
+        # --- NEW: Per-SocksPort health (from the proxy scheduler) ---
+        proxy_group = QGroupBox("SocksPort Health")
+        proxy_layout = QVBoxLayout()
+        self.proxy_table = QTableWidget()
+        self.setup_table_widget(self.proxy_table, self.proxy_column_headers, self.proxy_column_modes)
+        self.proxy_table.setMaximumHeight(220)
+        proxy_layout.addWidget(self.proxy_table)
+        proxy_group.setLayout(proxy_layout)
+        layout.addWidget(proxy_group)
+        # --- END NEW ---
+
         # --- Tor Process I/O Stats (Merged Group) ---
         stats_group = QGroupBox("Tor Process I/O")
         stats_layout = QGridLayout() # Use grid layout for side-by-side stats
@@ -227,6 +254,10 @@ class NetworkActivityViewer(QDialog):
         self.total_download_label = QLabel("Download Rate: Calculating...")
         self.total_upload_label = QLabel("Upload Rate: Calculating...")
         self.total_active_label = QLabel("Active Tasks: 0")
+        self.concurrency_label = QLabel("Concurrency Limit: N/A")
+        self.hedging_label = QLabel("Hedged Requests: off")
+        self.circuits_label = QLabel("Tor Circuits: N/A")
+        self.transfer_label = QLabel("Page Bytes: N/A")
         
         # Labels for session total
         self.session_download_label = QLabel("Total Download: 0 B")
@@ -237,12 +268,17 @@ class NetworkActivityViewer(QDialog):
         self.total_download_label.setFont(font)
         self.total_upload_label.setFont(font)
         self.total_active_label.setFont(font)
+        self.concurrency_label.setFont(font)
+        self.hedging_label.setFont(font)
+        self.circuits_label.setFont(font)
+        self.transfer_label.setFont(font)
         self.session_download_label.setFont(font)
         self.session_upload_label.setFont(font)
 
         # Layout the widgets:
-        # Row 0: Active Tasks (Spans 2 columns)
-        stats_layout.addWidget(self.total_active_label, 0, 0, 1, 2)
+        # Row 0: Active Tasks | Concurrency Limit
+        stats_layout.addWidget(self.total_active_label, 0, 0)
+        stats_layout.addWidget(self.concurrency_label, 0, 1)
         
         # Row 1: Download Rate | Total Download
         stats_layout.addWidget(self.total_download_label, 1, 0)
@@ -251,6 +287,15 @@ class NetworkActivityViewer(QDialog):
         # Row 2: Upload Rate | Total Upload
         stats_layout.addWidget(self.total_upload_label, 2, 0)
         stats_layout.addWidget(self.session_upload_label, 2, 1)
+
+        # Row 3: Hedged requests (spans both columns)
+        stats_layout.addWidget(self.hedging_label, 3, 0, 1, 2)
+
+        # Row 4: Built circuits and SOCKS isolation policy (spans both columns)
+        stats_layout.addWidget(self.circuits_label, 4, 0, 1, 2)
+
+        # Row 5: Page bytes on the wire vs. decoded (spans both columns)
+        stats_layout.addWidget(self.transfer_label, 5, 0, 1, 2)
         
         # Add some stretch between the columns
         stats_layout.setColumnStretch(0, 1)
@@ -275,24 +320,17 @@ class NetworkActivityViewer(QDialog):
         layout.setStretchFactor(stats_group, 0) # Stats group is fixed size
 
     # --- FIX (Request 1): Helper to init tables ---
-    def setup_table_widget(self, table, headers):
-        """Applies standard settings to a QTableWidget."""
+    def setup_table_widget(self, table, headers, resize_modes):
+        """Applies standard settings to a QTableWidget; `resize_modes` holds one QHeaderView mode per column."""
         table.setColumnCount(len(headers)) 
         table.setHorizontalHeaderLabels(headers) 
 
         table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         table.verticalHeader().setVisible(False)
         
-        # --- FIX: Dynamic column resizing ---
-        if len(headers) == 3: # Active table
-            table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeToContents) # Worker
-            table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch) # Site
-            table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeToContents) # Bytes
-        else: # Finished table
-            table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeToContents) # Worker
-            table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch) # Site
-            table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch) # Title
-            table.horizontalHeader().setSectionResizeMode(3, QHeaderView.ResizeToContents) # Bytes
+        # --- FIX: Per-table column resizing ---
+        for col, mode in enumerate(resize_modes):
+            table.horizontalHeader().setSectionResizeMode(col, mode)
         # --- END FIX ---
         
         table.setWordWrap(False)
@@ -378,6 +416,47 @@ class NetworkActivityViewer(QDialog):
         
         self.total_active_label.setText(f"Active Tasks: {len(active_tasks)}")
         
+        # --- NEW: Adaptive concurrency limit ---
+        with self.scrape_stats_lock:
+            concurrency = dict(self.scrape_stats.get('concurrency', {}))
+            hedging = dict(self.scrape_stats.get('hedging', {}))
+            circuits = dict(self.scrape_stats.get('circuits', {}))
+            transfer = dict(self.scrape_stats.get('transfer', {}))
+        if concurrency:
+            mode = "adaptive" if concurrency.get('adaptive') else "fixed"
+            self.concurrency_label.setText(
+                f"Concurrency Limit: {concurrency['limit']} / {concurrency['ceiling']} ({mode})"
+            )
+        else:
+            self.concurrency_label.setText("Concurrency Limit: N/A")
+        if hedging:
+            share = hedging['hedges_sent'] / hedging['requests'] if hedging['requests'] else 0.0
+            self.hedging_label.setText(
+                f"Hedged Requests: {hedging['hedges_sent']} ({share:.1%}, budget {hedging['budget']:.0%}) | "
+                f"Won: {hedging['hedges_won']} | Wasted: {hedging['hedges_lost']} | "
+                f"Tail Latency Saved: ~{hedging['seconds_saved']:.0f}s"
+            )
+        else:
+            self.hedging_label.setText("Hedged Requests: off")
+        if circuits:
+            self.circuits_label.setText(
+                f"Tor Circuits: {circuits['built']} built ({circuits['rendezvous']} onion rendezvous, "
+                f"{circuits['isolated']} isolated) | Isolation: {circuits['policy']} "
+                f"({circuits['groups']} credential groups)"
+            )
+        else:
+            self.circuits_label.setText("Tor Circuits: N/A")
+        if transfer:
+            self.transfer_label.setText(
+                f"Page Bytes: {format_total_size(transfer['wire_bytes'])} on the wire / "
+                f"{format_total_size(transfer['decoded_bytes'])} decoded | "
+                f"Saved: {transfer['saved_ratio']:.0%} | "
+                f"Compressed: {transfer['compressed_responses']}/{transfer['responses']}"
+            )
+        else:
+            self.transfer_label.setText("Page Bytes: N/A")
+        # --- END NEW ---
+        
         # --- Populate Active Table ---
         self.active_table.setUpdatesEnabled(False)
         self.active_table.setRowCount(len(active_tasks))
@@ -385,11 +464,10 @@ class NetworkActivityViewer(QDialog):
             worker_id = task_data.get('worker_id', 'N/A')
             # --- FIX (Request 1): Use full URL, not 'site' ---
             site = task_data.get('url', 'N/A') 
-            bytes_val = task_data.get('bytes', 0)
             
             worker_item = QTableWidgetItem(worker_id)
             site_item = QTableWidgetItem(site)
-            bytes_item = QTableWidgetItem(f"{bytes_val:,} B")
+            bytes_item = QTableWidgetItem(format_task_bytes(task_data))
 
             # Set colors for active items
             for item in (worker_item, site_item, bytes_item):
@@ -410,12 +488,11 @@ class NetworkActivityViewer(QDialog):
             worker_id = task_data.get('worker_id', 'N/A')
             site = task_data.get('url', 'N/A') # Use full URL
             title = task_data.get('title', 'N/A')
-            bytes_val = task_data.get('bytes', 0)
             
             worker_item = QTableWidgetItem(worker_id)
             site_item = QTableWidgetItem(site)
             title_item = QTableWidgetItem(title)
-            bytes_item = QTableWidgetItem(f"{bytes_val:,} B")
+            bytes_item = QTableWidgetItem(format_task_bytes(task_data))
 
             # Set colors for finished items
             status = task_data.get('status', 2) # 1 = success, 2 = fail
@@ -431,11 +508,40 @@ class NetworkActivityViewer(QDialog):
             self.finished_table.setItem(row, 3, bytes_item)
         self.finished_table.setUpdatesEnabled(True)
         
+        self.update_proxy_table()
+        
         if not self.running:
             self.total_active_label.setText(f"Active Tasks: 0 (Tor process ended)")
             self.total_download_label.setText("Download Rate: N/A")
             self.total_upload_label.setText("Upload Rate: N/A")
 
+    def update_proxy_table(self):
+        """Fills the SocksPort Health table from the shared scrape stats."""
+        with self.scrape_stats_lock:
+            proxy_stats = list(self.scrape_stats.get('proxies', []))
+
+        self.proxy_table.setUpdatesEnabled(False)
+        self.proxy_table.setRowCount(len(proxy_stats))
+        for row, stats in enumerate(proxy_stats):
+            latency = stats.get('ewma_latency')
+            quarantined_for = stats.get('quarantined_for', 0)
+            status = f"Quarantined ({quarantined_for:.0f}s)" if quarantined_for > 0 else "Healthy"
+            values = [
+                str(stats.get('proxy', 'N/A')).rsplit(':', 1)[-1],
+                str(stats.get('in_flight', 0)),
+                f"{latency:.2f}s" if latency is not None else "N/A",
+                f"{stats.get('error_rate', 0):.0%}",
+                f"{stats.get('requests', 0):,}",
+                status,
+            ]
+            brush_to_use = self.red_brush if quarantined_for > 0 else self.dark_brush
+            for col, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                item.setBackground(brush_to_use)
+                item.setForeground(self.white_text_brush)
+                self.proxy_table.setItem(row, col, item)
+        self.proxy_table.setUpdatesEnabled(True)
+
     # --- FIX (Request 5): Context menu functions ---
     def open_context_menu(self, position):
         """Generates the right-click menu for both tables."""
@@ -0,0 +1,332 @@
+"""
+HTML extraction engines for parse_page_content.
+
+Each engine turns a page into (title, page_text, hrefs) and nothing else;
+keyword matching and link filtering are done by the caller, so both
+engines give the same results.
+
+    lxml  - single pass over libxml2's parse events (a parser target), no
+            tree is built. Title, visible text and <a href> values are
+            collected while the page is being parsed.
+    bs4   - the original BeautifulSoup tree, walked once each for the
+            title, the text and the links. Kept for comparison.
+
+Text follows BeautifulSoup's get_text(separator=' ', strip=True): every
+text node is stripped, empty ones are dropped, and the rest are joined
+with single spaces. Comments and the contents of <script>, <style> and
+<template> are not text.
+
+Engines take the raw body bytes plus the page's charset (see
+sniff_charset: byte-order mark, HTTP Content-Type, <meta> prescan, else
+UTF-8). The lxml engine feeds the bytes to libxml2 in chunks and lets it
+decode them, so no decoded copy of the whole page is ever held as a
+Python string, and pages in legacy charsets are no longer garbled.
+
+How much text is kept is set by TextOptions (per run, from the settings).
+With strip_boilerplate, text inside <nav>, <footer>, <aside> and
+<noscript> (or elements with a navigation/contentinfo/complementary
+role) is dropped, as is every repeat of a text node already seen on the
+page (menus, "Add to cart" buttons, per-row template text). A page that
+is nothing but such blocks keeps them. With max_chars, text stops being
+collected at the cap and TRUNCATION_MARKER is appended. Title and links
+are collected from the whole page either way. No options: the full text.
+"""
+
+import codecs
+import logging
+import warnings
+
+from bs4 import BeautifulSoup, XMLParsedAsHTMLWarning
+from lxml import etree
+
+import re2 as re
+
+ENGINE_LXML = 'lxml'
+ENGINE_BS4 = 'bs4'
+PARSER_ENGINES = (ENGINE_LXML, ENGINE_BS4)
+DEFAULT_PARSER_ENGINE = ENGINE_LXML
+
+NO_TITLE = "No Title Found"
+
+# Suppress the XMLParsedAsHTMLWarning
+warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
+
+DEFAULT_CHARSET = 'utf-8'
+CHARSET_PRESCAN_BYTES = 1024 # How far into the page a <meta> charset is looked for
+FEED_CHUNK_BYTES = 64 * 1024 # Bytes handed to libxml2 per feed() call
+REPLACEMENT_CHAR = '\ufffd' # libxml2 substitutes it for undecodable bytes
+
+BOMS = (
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+META_CHARSET_REGEX = re.compile(rb'<meta[^>]*?charset\s*=\s*["\']?\s*([a-zA-Z0-9_.:-]+)', re.IGNORECASE)
+# Labels browsers decode as windows-1252 (a superset that keeps 0x80-0x9F printable)
+WINDOWS_1252_ALIASES = {'iso8859-1', 'ascii'}
+
+# Elements whose contents are never page text
+NON_TEXT_TAGS = frozenset({'script', 'style', 'template'})
+# Template blocks dropped from the text by TextOptions.strip_boilerplate
+BOILERPLATE_TAGS = frozenset({'nav', 'footer', 'aside', 'noscript'})
+BOILERPLATE_ROLES = frozenset({'navigation', 'contentinfo', 'complementary'})
+
+DEFAULT_MAX_PAGE_TEXT_CHARS = 200000
+TRUNCATION_MARKER = "[...truncated]"
+
+
+class TextOptions:
+    """Per-run limits on the page text the engines return."""
+    def __init__(self, strip_boilerplate=True, max_chars=DEFAULT_MAX_PAGE_TEXT_CHARS):
+        self.strip_boilerplate = strip_boilerplate
+        self.max_chars = max_chars # 0 = no cap
+
+    @classmethod
+    def from_args(cls, args):
+        max_chars = getattr(args, 'max_page_text_chars', DEFAULT_MAX_PAGE_TEXT_CHARS)
+        return cls(
+            strip_boilerplate=getattr(args, 'strip_boilerplate', True),
+            max_chars=max(0, int(max_chars or 0))
+        )
+
+def is_boilerplate(tag, role=None):
+    """Whether an element (name, role attribute) is a template block."""
+    return tag in BOILERPLATE_TAGS or (role is not None and role.strip().lower() in BOILERPLATE_ROLES)
+
+
+class _TextCollector:
+    """Joins a page's stripped text nodes, applying TextOptions. Shared by both engines."""
+    def __init__(self, text_options=None):
+        self.strip_boilerplate = bool(text_options and text_options.strip_boilerplate)
+        self.max_chars = text_options.max_chars if text_options else 0
+        self.parts = []
+        self.boilerplate_parts = [] # Kept in case the page has no other text
+        self.truncated = False
+        self._length = 0 # Length of " ".join(self.parts)
+        self._seen = set()
+
+    def add(self, text, boilerplate=False):
+        if self.truncated:
+            return
+        if self.strip_boilerplate:
+            if boilerplate:
+                if not self.parts:
+                    self.boilerplate_parts.append(text)
+                return
+            if text in self._seen: # Repeated template text
+                return
+            self._seen.add(text)
+        if self.parts:
+            self._length += 1
+        if self.max_chars and self._length + len(text) > self.max_chars:
+            remaining = self.max_chars - self._length
+            cut = text[:remaining]
+            if ' ' in cut: # End on a word boundary
+                cut = cut[:cut.rfind(' ')]
+            if cut.strip():
+                self.parts.append(cut.rstrip())
+            self.parts.append(TRUNCATION_MARKER)
+            self.truncated = True
+            return
+        self.parts.append(text)
+        self._length += len(text)
+
+    def text(self):
+        if not self.parts and self.boilerplate_parts:
+            # Nothing outside the template blocks (e.g. a page that is one big <nav>): keep them
+            collector = _TextCollector(TextOptions(strip_boilerplate=False, max_chars=self.max_chars))
+            for text in self.boilerplate_parts:
+                collector.add(text)
+            return collector.text()
+        return " ".join(self.parts)
+
+
+class _PageTarget:
+    """lxml parser target collecting title, text nodes and hrefs from the parse events."""
+    def __init__(self, text_options=None):
+        self.title = None
+        self.text = _TextCollector(text_options)
+        self.hrefs = []
+        self._pending = [] # Data chunks of the current text node
+        self._skip_depth = 0 # > 0 inside <script>/<style>/<template>
+        self._depth = 0 # Open elements
+        self._boilerplate_at = None # Depth of the outermost open template block
+        self._in_title = False
+        self._title_parts = None
+
+    def _flush_text(self):
+        # libxml2 may deliver one text node in several chunks; a node ends at the next tag or comment
+        if not self._pending:
+            return
+        text = "".join(self._pending)
+        self._pending = []
+        if self._skip_depth:
+            return
+        if REPLACEMENT_CHAR in text:
+            # Undecodable bytes are dropped, as decode(errors='ignore') did
+            text = text.replace(REPLACEMENT_CHAR, '')
+        stripped = text.strip()
+        if not stripped:
+            return
+        self.text.add(stripped, self._boilerplate_at is not None)
+        if self._in_title:
+            self._title_parts.append(stripped)
+
+    def start(self, tag, attrib):
+        self._flush_text()
+        if self._boilerplate_at is None and is_boilerplate(tag, attrib.get('role')):
+            self._boilerplate_at = self._depth
+        self._depth += 1
+        if tag in NON_TEXT_TAGS:
+            self._skip_depth += 1
+        elif tag == 'a':
+            href = attrib.get('href')
+            if href is not None:
+                self.hrefs.append(href)
+        elif tag == 'title' and self.title is None and not self._in_title:
+            self._in_title = True
+            self._title_parts = []
+
+    def end(self, tag):
+        self._flush_text()
+        self._depth -= 1
+        if self._depth == self._boilerplate_at:
+            self._boilerplate_at = None
+        if tag in NON_TEXT_TAGS:
+            if self._skip_depth:
+                self._skip_depth -= 1
+        elif tag == 'title' and self._in_title:
+            self._in_title = False
+            self.title = "".join(self._title_parts)
+
+    def data(self, data):
+        self._pending.append(data)
+
+    def comment(self, text):
+        self._flush_text()
+
+    def pi(self, target, data=None):
+        self._flush_text()
+
+    def close(self):
+        self._flush_text()
+        if self._in_title: # Unterminated <title>
+            self.title = "".join(self._title_parts)
+        return self
+
+
+def _valid_charset(label):
+    """`label` (lowercased) if Python knows the encoding, mapped like browsers do; else None."""
+    label = (label or '').strip().strip('"\'').lower()
+    if not label:
+        return None
+    try:
+        name = codecs.lookup(label).name
+    except LookupError:
+        return None
+    if name in WINDOWS_1252_ALIASES:
+        return 'windows-1252'
+    return label
+
+def charset_from_content_type(content_type):
+    """The charset parameter of a Content-Type header value, or None."""
+    for param in (content_type or '').split(';')[1:]:
+        key, _, value = param.partition('=')
+        if key.strip().lower() == 'charset':
+            return _valid_charset(value)
+    return None
+
+def sniff_charset(body, content_type=None):
+    """The charset to decode `body` with: BOM, then HTTP header, then <meta>, then UTF-8."""
+    for bom, charset in BOMS:
+        if body.startswith(bom):
+            return charset
+    charset = charset_from_content_type(content_type)
+    if charset:
+        return charset
+    match = META_CHARSET_REGEX.search(bytes(body[:CHARSET_PRESCAN_BYTES]))
+    if match:
+        charset = _valid_charset(match.group(1).decode('ascii', errors='ignore'))
+        # A page whose <meta> could be read as ASCII isn't UTF-16
+        if charset and not codecs.lookup(charset).name.startswith('utf-16'):
+            return charset
+    return DEFAULT_CHARSET
+
+def _feed_bytes(parser, body):
+    for start in range(0, len(body), FEED_CHUNK_BYTES):
+        parser.feed(body[start:start + FEED_CHUNK_BYTES])
+
+def extract_page_lxml(html_content, charset=None, text_options=None):
+    """
+    Single-pass extraction. `html_content` is the raw body (decoded by libxml2
+    with `charset`) or an already decoded str. Returns (title, page_text, hrefs).
+    """
+    target = _PageTarget(text_options)
+    try:
+        if isinstance(html_content, str):
+            parser = etree.HTMLParser(target=target, recover=True, no_network=True)
+            parser.feed(html_content)
+        else:
+            charset = charset or sniff_charset(html_content)
+            try:
+                parser = etree.HTMLParser(target=target, recover=True, no_network=True, encoding=charset)
+            except LookupError:
+                # Known to Python but not to libxml2's converters: decode here instead
+                parser = etree.HTMLParser(target=target, recover=True, no_network=True)
+                html_content = html_content.decode(charset, errors='ignore')
+                parser.feed(html_content)
+            else:
+                _feed_bytes(parser, html_content)
+        parser.close()
+    except etree.LxmlError:
+        # Empty or hopeless documents; keep whatever was collected
+        target.close()
+    title = target.title if target.title is not None else NO_TITLE
+    return title, target.text.text(), target.hrefs
+
+def _outermost_boilerplate(soup):
+    """The template blocks of a soup that are not inside another one."""
+    blocks = soup.find_all(lambda tag: is_boilerplate(tag.name, tag.get('role')))
+    block_ids = {id(tag) for tag in blocks}
+    return [tag for tag in blocks if not any(id(parent) in block_ids for parent in tag.parents)]
+
+def extract_page_bs4(html_content, charset=None, text_options=None):
+    """BeautifulSoup extraction (three tree walks). Returns (title, page_text, hrefs)."""
+    if isinstance(html_content, str):
+        soup = BeautifulSoup(html_content, 'lxml')
+    else:
+        soup = BeautifulSoup(html_content, 'lxml', from_encoding=charset or sniff_charset(html_content))
+    title_tag = soup.find('title')
+    title = title_tag.get_text(strip=True) if title_tag else NO_TITLE
+    hrefs = [link['href'] for link in soup.find_all('a', href=True)]
+    if text_options is None:
+        page_text = soup.get_text(separator=' ', strip=True)
+    else:
+        text = _TextCollector(text_options)
+        if text.strip_boilerplate:
+            # Text is only collected once the blocks are out of the tree, so keep them aside
+            blocks = [tag.extract() for tag in _outermost_boilerplate(soup)]
+        for string in soup.stripped_strings:
+            text.add(string)
+        if text.strip_boilerplate:
+            for block in blocks:
+                for string in block.stripped_strings:
+                    text.add(string, boilerplate=True)
+        page_text = text.text()
+    return title, page_text, hrefs
+
+EXTRACTORS = {
+    ENGINE_LXML: extract_page_lxml,
+    ENGINE_BS4: extract_page_bs4,
+}
+
+def resolve_parser_engine(engine):
+    """Validates a configured engine name, falling back to the default."""
+    if engine not in PARSER_ENGINES:
+        logging.warning(f"[PARSER] Unknown parser engine '{engine}'. Using '{DEFAULT_PARSER_ENGINE}'.")
+        return DEFAULT_PARSER_ENGINE
+    return engine
+
+def get_extractor(engine=None):
+    """The extraction function for `engine` (the default engine if unknown or None)."""
+    return EXTRACTORS.get(engine or DEFAULT_PARSER_ENGINE, EXTRACTORS[DEFAULT_PARSER_ENGINE])
@@ -0,0 +1,126 @@
+"""
+Process-pool offload of page parsing and keyword matching.
+
+Parsing a large page and running every keyword pattern over its text is
+CPU work. Done inside the scraper's event loop it stalls every other
+worker of the run for as long as it takes, and the whole scraper is held
+to one core by the GIL. ParsePool hands that work to a pool of worker
+processes instead: the raw page bytes go in, and only the links, the
+title, the keyword match and hit records, the page fingerprint and (when
+it will be saved) the page text come back. The keyword matcher and parse
+settings are sent to each process once, when it starts (the matcher
+recompiles its patterns there).
+
+Backpressure: at most `pending_per_process` pages per process may be
+queued or parsing. A worker whose page can't get a slot waits, holding
+its page and not fetching another one, so the fetch side never gets more
+than that far ahead of the parsers.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from scraper import parse_page_content
+
+DEFAULT_PENDING_PER_PROCESS = 2
+
+# --- Parse process side (module globals set once per process) ---
+_settings = {}
+
+def _init_parse_process(keyword_matcher, onion_only_mode, save_page_data_mode, parser_engine, text_options,
+                        fingerprint_pages):
+    _settings.update(keyword_matcher=keyword_matcher, onion_only_mode=onion_only_mode,
+                     save_page_data_mode=save_page_data_mode, parser_engine=parser_engine,
+                     text_options=text_options, fingerprint_pages=fingerprint_pages)
+
+def _parse_page(body, base_url, charset):
+    """Runs in a parse process. Returns (links, title, page_text or None, matching_keyword, keyword_hits, fingerprint)."""
+    links, title, page_text, matching_keyword, keyword_hits, fingerprint = parse_page_content(
+        body, base_url, _settings['onion_only_mode'], False, _settings['keyword_matcher'], _settings['parser_engine'],
+        charset, _settings['text_options'], _settings['fingerprint_pages']
+    )
+    # Only ship the text back if the worker is going to save it
+    mode = _settings['save_page_data_mode']
+    if not (mode == "All" or (mode == "Keyword Match" and matching_keyword)):
+        page_text = None
+    return links, title, page_text, matching_keyword, keyword_hits, fingerprint
+# --- End parse process side ---
+
+
+def default_parse_processes():
+    """One parse process per CPU core, leaving one core for the scraper's event loop and Tor."""
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+class ParsePool:
+    """Parses fetched pages in worker processes. Used from the scraper's event loop thread."""
+    def __init__(self, keyword_matcher, onion_only_mode, save_page_data_mode, parser_engine=None,
+                 processes=0, pending_per_process=DEFAULT_PENDING_PER_PROCESS, text_options=None,
+                 fingerprint_pages=False):
+        self.processes = int(processes) if processes and int(processes) > 0 else default_parse_processes()
+        self.max_pending = self.processes * max(1, int(pending_per_process))
+        self._initargs = (keyword_matcher, onion_only_mode, save_page_data_mode, parser_engine, text_options,
+                          fingerprint_pages)
+        self._executor = self._new_executor()
+        self._slots = asyncio.Semaphore(self.max_pending)
+
+        # Run-wide counters
+        self.pages = 0
+        self.parse_seconds = 0.0 # Submit-to-result time of every parse
+        self.waits = 0 # Pages that had to wait for a free slot
+        self.wait_seconds = 0.0
+        self.restarts = 0
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(max_workers=self.processes, initializer=_init_parse_process,
+                                   initargs=self._initargs)
+
+    async def parse(self, body, base_url, charset=None):
+        """Parses `body` (decoded there with `charset`) in a parse process. Returns (links, title, page_text or None, matching_keyword, keyword_hits, fingerprint)."""
+        if self._slots.locked():
+            self.waits += 1
+            wait_started = time.monotonic()
+            await self._slots.acquire()
+            self.wait_seconds += time.monotonic() - wait_started
+        else:
+            await self._slots.acquire()
+        try:
+            started = time.monotonic()
+            loop = asyncio.get_running_loop()
+            executor = self._executor
+            try:
+                result = await loop.run_in_executor(executor, _parse_page, body, base_url, charset)
+            except BrokenProcessPool:
+                # A parse process died (e.g. crashed on a pathological page). Start a new pool
+                # for the next pages; this page counts as a parse failure.
+                if executor is self._executor: # Every page in flight sees the same broken pool
+                    self._restart()
+                raise
+            self.pages += 1
+            self.parse_seconds += time.monotonic() - started
+            return result
+        finally:
+            self._slots.release()
+
+    def _restart(self):
+        self.restarts += 1
+        logging.warning(f"[PARSE] A parse process died. Restarting the pool ({self.restarts} restarts so far).")
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._new_executor()
+
+    def summary(self):
+        average = self.parse_seconds / self.pages if self.pages else 0.0
+        summary = (f"{self.pages} pages parsed in {self.processes} processes (avg {average * 1000:.0f} ms) | "
+                   f"{self.waits} pages waited {self.wait_seconds:.1f}s for a parse slot")
+        if self.restarts:
+            summary += f" | {self.restarts} pool restarts"
+        return summary
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self.pages:
+            logging.info(f"[PARSE] {self.summary()}.")
@@ -0,0 +1,173 @@
+"""
+Health-scored SocksPort selection.
+
+Replaces `random.choice(PROXIES)` with a scheduler that tracks, per port, an
+EWMA of response latency and error rate plus the number of requests in
+flight. New requests go to the better of two randomly sampled healthy ports
+("power of two choices"), which keeps load spread out while steering away
+from slow or overloaded circuits. A port whose error rate or latency is far
+worse than the other ports is quarantined for a while.
+"""
+
+import logging
+import random
+import time
+import statistics
+
+from stats_publisher import StatsPublisher
+
+# --- Tuning constants ---
+LATENCY_EWMA_ALPHA = 0.2          # Weight of the newest latency sample
+ERROR_EWMA_ALPHA = 0.05           # Error rate moves slower (~20 request memory)
+GLOBAL_ERROR_EWMA_ALPHA = 0.01    # All ports together; absorbs dead hosts
+MIN_SAMPLES_FOR_QUARANTINE = 20   # Don't judge a port on a few requests
+ERROR_MARGIN_FOR_QUARANTINE = 0.35 # Port error rate above the global rate
+LATENCY_FACTOR_FOR_QUARANTINE = 3.0 # Port latency vs. median of all ports
+BASE_QUARANTINE_SECONDS = 60
+MAX_QUARANTINE_SECONDS = 600
+
+
+class ProxyStats:
+    """Running health numbers for one SocksPort."""
+    def __init__(self, proxy):
+        self.proxy = proxy
+        self.ewma_latency = None
+        self.ewma_error = 0.0
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.samples_since_reset = 0
+        self.quarantined_until = 0.0
+        self.quarantine_count = 0
+
+    def is_quarantined(self, now):
+        return now < self.quarantined_until
+
+    def to_dict(self, now):
+        return {
+            "proxy": self.proxy,
+            "in_flight": self.in_flight,
+            "ewma_latency": self.ewma_latency,
+            "error_rate": self.ewma_error,
+            "requests": self.requests,
+            "failures": self.failures,
+            "quarantined_for": max(0.0, self.quarantined_until - now),
+        }
+
+
+class ProxyScheduler(StatsPublisher):
+    """Chooses a SocksPort for each request and learns from the outcome."""
+    stats_key = 'proxies'
+
+    def __init__(self, proxies, stats_dict=None, stats_lock=None):
+        self.stats = {proxy: ProxyStats(proxy) for proxy in proxies}
+        self.global_ewma_error = 0.0
+        self.stats_dict = stats_dict
+        self.stats_lock = stats_lock
+
+    def add_proxy(self, proxy):
+        """Starts scheduling a new SocksPort (e.g. a Tor instance that finished bootstrapping)."""
+        if proxy not in self.stats:
+            self.stats[proxy] = ProxyStats(proxy)
+
+    def remove_proxy(self, proxy):
+        """Stops scheduling a SocksPort (e.g. its Tor instance died)."""
+        if self.stats.pop(proxy, None) is not None:
+            self._publish(force=True)
+
+    def _median_latency(self):
+        latencies = [s.ewma_latency for s in self.stats.values() if s.ewma_latency is not None]
+        return statistics.median(latencies) if latencies else None
+
+    def _cost(self, stats, median_latency):
+        """Lower is better. Unmeasured ports look average so they get tried."""
+        latency = stats.ewma_latency if stats.ewma_latency is not None else (median_latency or 1.0)
+        return latency * (1 + stats.in_flight) / max(0.05, 1.0 - stats.ewma_error)
+
+    def is_available(self, proxy):
+        stats = self.stats.get(proxy)
+        return stats is not None and not stats.is_quarantined(time.monotonic())
+
+    def choose(self, exclude=None):
+        """Returns the proxy URL to use for the next request."""
+        now = time.monotonic()
+        candidates = [s for s in self.stats.values()
+                      if not s.is_quarantined(now) and (not exclude or s.proxy not in exclude)]
+        if not candidates:
+            # Everything is quarantined (or excluded): use whichever recovers first
+            candidates = [s for s in self.stats.values() if not exclude or s.proxy not in exclude] or list(self.stats.values())
+            return min(candidates, key=lambda s: s.quarantined_until).proxy
+
+        if len(candidates) == 1:
+            return candidates[0].proxy
+        median_latency = self._median_latency()
+        first, second = random.sample(candidates, 2)
+        return min((first, second), key=lambda s: self._cost(s, median_latency)).proxy
+
+    def on_start(self, proxy):
+        stats = self.stats.get(proxy)
+        if stats:
+            stats.in_flight += 1
+
+    def on_cancel(self, proxy):
+        """A request was cancelled (e.g. shutdown); release it without judging the port."""
+        stats = self.stats.get(proxy)
+        if stats:
+            stats.in_flight = max(0, stats.in_flight - 1)
+
+    def on_finish(self, proxy, latency, ok):
+        """
+        Records one finished request. `ok` means the circuit delivered an HTTP
+        response (any status). `latency` should be time-to-headers if known.
+        """
+        stats = self.stats.get(proxy)
+        if stats is None:
+            return
+        stats.in_flight = max(0, stats.in_flight - 1)
+        stats.requests += 1
+        stats.samples_since_reset += 1
+
+        error_sample = 0.0 if ok else 1.0
+        if not ok:
+            stats.failures += 1
+        stats.ewma_error += ERROR_EWMA_ALPHA * (error_sample - stats.ewma_error)
+        # Dead hosts fail on every port, so a port is only judged against the global rate
+        self.global_ewma_error += GLOBAL_ERROR_EWMA_ALPHA * (error_sample - self.global_ewma_error)
+
+        if ok and latency is not None:
+            if stats.ewma_latency is None:
+                stats.ewma_latency = latency
+            else:
+                stats.ewma_latency += LATENCY_EWMA_ALPHA * (latency - stats.ewma_latency)
+
+        self._check_quarantine(stats)
+        self._publish()
+
+    def _check_quarantine(self, stats):
+        now = time.monotonic()
+        if stats.is_quarantined(now) or stats.samples_since_reset < MIN_SAMPLES_FOR_QUARANTINE:
+            return
+
+        reason = None
+        if stats.ewma_error - self.global_ewma_error > ERROR_MARGIN_FOR_QUARANTINE:
+            reason = f"error rate {stats.ewma_error:.0%} vs {self.global_ewma_error:.0%} overall"
+        else:
+            median_latency = self._median_latency()
+            if (median_latency and stats.ewma_latency
+                    and stats.ewma_latency > median_latency * LATENCY_FACTOR_FOR_QUARANTINE):
+                reason = f"latency {stats.ewma_latency:.1f}s vs {median_latency:.1f}s median"
+
+        if reason:
+            duration = min(MAX_QUARANTINE_SECONDS, BASE_QUARANTINE_SECONDS * (2 ** stats.quarantine_count))
+            stats.quarantined_until = now + duration
+            stats.quarantine_count += 1
+            # Come back on probation: neutral numbers, fresh sample count
+            stats.ewma_error = self.global_ewma_error
+            stats.ewma_latency = None
+            stats.samples_since_reset = 0
+            logging.warning(f"[PROXY] Quarantining {stats.proxy} for {duration}s ({reason}).")
+
+    def snapshot(self):
+        """Per-port stats as a list of dicts (for the Network Activity viewer)."""
+        now = time.monotonic()
+        return [s.to_dict(now) for s in self.stats.values()]
@@ -0,0 +1,70 @@
+"""
+Redirect chains and final-URL deduplication.
+
+curl follows redirects on its own, so a fetch of URL A may really return
+the page at URL C (A -> B -> C). Many onion links redirect to the same
+canonical page. Without tracking, C's content would be stored under A and
+C would be fetched again later under its own URL. The worker instead
+stores the page on C's row and marks A and B as resolved redirects that
+point at C (links.final_url / links.redirect_chain). RedirectTracker
+remembers which URLs were resolved this way during a run, so copies that
+are already queued are dropped instead of refetched.
+"""
+
+import json
+import logging
+
+# Title stored on URLs that redirect to another URL's content record
+REDIRECT_TITLE_PREFIX = "Redirect -> "
+
+
+def normalize_redirect_chain(requested_url, hop_urls, final_url):
+    """
+    Returns the chain [requested, ..., final] with URLs normalized the way
+    links are stored (no trailing '/') and repeats removed, or [] if the
+    request did not end up on a different URL (e.g. only a '/' was added).
+    """
+    chain = []
+    for url in [requested_url, *hop_urls, final_url]:
+        if not url:
+            continue
+        url = url.rstrip('/')
+        if url not in chain:
+            chain.append(url)
+    return chain if len(chain) > 1 else []
+
+def redirect_title(final_url):
+    return f"{REDIRECT_TITLE_PREFIX}{final_url}"
+
+def chain_to_json(chain):
+    return json.dumps(chain)
+
+
+class RedirectTracker:
+    """URLs resolved through another URL's redirect during this run. Runs on the scraper's event loop thread."""
+    def __init__(self):
+        self._resolved = {} # url -> final url
+        self.redirects_followed = 0
+        self.duplicates_skipped = 0
+
+    def on_redirect(self, chain):
+        """Records a successfully fetched chain: every URL after the requested one is now resolved."""
+        self.redirects_followed += 1
+        final_url = chain[-1]
+        for url in chain[1:]:
+            self._resolved[url] = final_url
+
+    def resolved_to(self, url):
+        """The final URL `url` was resolved to earlier in this run, or None."""
+        final_url = self._resolved.get(url)
+        if final_url is not None:
+            self.duplicates_skipped += 1
+        return final_url
+
+    def summary(self):
+        return (f"{self.redirects_followed} redirect chains followed, {len(self._resolved)} URLs resolved "
+                f"through them, {self.duplicates_skipped} queued duplicates not refetched")
+
+    def close(self):
+        if self.redirects_followed:
+            logging.info(f"[REDIRECT] {self.summary()}.")
@@ -0,0 +1,131 @@
+"""
+Automatic retries for transient fetch failures.
+
+Workers classify every failed fetch. Transient kinds (timeouts, SOCKS and
+connection errors, 5xx, 429) are scheduled for another attempt with
+exponential backoff and jitter; permanent kinds (404, other 4xx, parse
+errors, hosts with an open circuit) are never retried automatically. The
+attempt count and the next attempt time are stored on the link row, so a
+restarted run picks up retries that were still pending.
+"""
+
+import heapq
+import logging
+import random
+import time
+
+# --- Failure kinds (stored in links.last_error) ---
+FAILURE_TIMEOUT = 'timeout'
+FAILURE_SOCKS = 'socks'
+FAILURE_CONNECTION = 'connection'
+FAILURE_SERVER_ERROR = 'http_5xx'
+FAILURE_RATE_LIMITED = 'http_429'
+FAILURE_NOT_FOUND = 'http_404'
+FAILURE_HTTP_ERROR = 'http_error' # Any other non-200 status
+FAILURE_PARSE = 'parse'
+FAILURE_HOST_DOWN = 'host_down'   # Short-circuited by the host circuit breaker
+FAILURE_UNKNOWN = 'unknown'
+
+RETRYABLE_FAILURES = {
+    FAILURE_TIMEOUT, FAILURE_SOCKS, FAILURE_CONNECTION,
+    FAILURE_SERVER_ERROR, FAILURE_RATE_LIMITED,
+}
+
+# --- Defaults ---
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BASE_DELAY_SECONDS = 30
+DEFAULT_MAX_DELAY_SECONDS = 600
+
+
+def parse_retry_after(headers):
+    """Returns the Retry-After header in seconds, or None (HTTP-date form is ignored)."""
+    if not headers:
+        return None
+    try:
+        value = headers.get('retry-after')
+        return max(0, int(value)) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryScheduler:
+    """
+    Holds the URLs waiting for another attempt, ordered by due time.
+    All methods run on the scraper's event loop thread.
+    """
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY_SECONDS,
+                 max_delay=DEFAULT_MAX_DELAY_SECONDS):
+        self.max_attempts = max(0, int(max_attempts))
+        self.base_delay = max(1, int(base_delay))
+        self.max_delay = max(self.base_delay, int(max_delay))
+        self._heap = []        # (due_at, url)
+        self._scheduled = {}   # url -> due_at
+
+        # Run-wide counters
+        self.retries_scheduled = 0
+        self.retries_dispatched = 0
+        self.gave_up = 0
+        self.permanent = 0
+
+    @property
+    def pending(self):
+        return len(self._heap)
+
+    def backoff(self, attempts):
+        """Delay before attempt `attempts + 1`: exponential, with "equal jitter"."""
+        delay = min(self.max_delay, self.base_delay * (2 ** max(0, attempts - 1)))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def schedule(self, url, attempts, failure_kind, retry_after=None):
+        """
+        Records a failed attempt (the `attempts`-th one) and returns the Unix
+        time of the next attempt, or None if the URL should not be retried.
+        """
+        if failure_kind not in RETRYABLE_FAILURES:
+            self.permanent += 1
+            return None
+        if attempts >= self.max_attempts:
+            self.gave_up += 1
+            logging.debug(f"[RETRY] Giving up on {url} after {attempts} attempts ({failure_kind}).")
+            return None
+
+        delay = self.backoff(attempts)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        if url in self._scheduled:
+            return self._scheduled[url] # Already waiting; keep the original slot
+        due_at = time.time() + delay
+        self.add(url, due_at)
+        self.retries_scheduled += 1
+        logging.debug(f"[RETRY] {url} failed ({failure_kind}, attempt {attempts}). Retrying in {delay:.0f}s.")
+        return due_at
+
+    def add(self, url, due_at):
+        """Queues `url` for `due_at` (Unix time). Returns False if it was already queued."""
+        if url in self._scheduled:
+            return False
+        self._scheduled[url] = due_at
+        heapq.heappush(self._heap, (due_at, url))
+        return True
+
+    def pop_due(self, now=None):
+        """Removes and returns every URL whose retry time has come."""
+        now = time.time() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, url = heapq.heappop(self._heap)
+            self._scheduled.pop(url, None)
+            due.append(url)
+        self.retries_dispatched += len(due)
+        return due
+
+    def seconds_until_next(self):
+        """Seconds until the next retry is due (0 if overdue, None if nothing is pending)."""
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - time.time())
+
+    def summary(self):
+        return (f"{self.retries_scheduled} retries scheduled, {self.retries_dispatched} sent, "
+                f"{self.pending} pending, {self.gave_up} URLs out of attempts, "
+                f"{self.permanent} permanent failures not retried")
@@ -7,29 +7,294 @@ import random
 import asyncio
 import traceback
 import time 
-import warnings
-import re2 as re # <-- MODIFIED: Using re2
-from urllib.parse import urljoin, urlparse
+import html
+import hashlib
+import copy
+from urllib.parse import urlparse
 
-from bs4 import BeautifulSoup, XMLParsedAsHTMLWarning
 from curl_cffi.requests import AsyncSession
 # --- FIX: Import specific errors to suppress them from GUI ---
 from curl_cffi.requests.exceptions import ProxyError
 from curl_cffi.curl import CurlError
+from curl_cffi import CurlInfo, CurlOpt
 # --- END FIX ---
 
 from utils import PROXIES, HEADERS, is_junk_url
 from database import DatabaseManager
+from host_state import interleave_by_host
+from transfer_stats import negotiated_accept_encoding
+from redirects import normalize_redirect_chain, redirect_title, chain_to_json
+from page_parser import get_extractor, sniff_charset, DEFAULT_PARSER_ENGINE
+from keyword_matcher import KeywordMatcher
+from link_extractor import LinkResolver
+from near_duplicates import simhash, to_signed, duplicate_page_data
+from concurrency import OUTCOME_SUCCESS, OUTCOME_TIMEOUT, OUTCOME_ERROR, OUTCOME_HOST_TIMEOUT
+from retry_scheduler import (FAILURE_TIMEOUT, FAILURE_SOCKS, FAILURE_CONNECTION, FAILURE_SERVER_ERROR,
+                             FAILURE_RATE_LIMITED, FAILURE_NOT_FOUND, FAILURE_HTTP_ERROR, FAILURE_PARSE,
+                             FAILURE_HOST_DOWN, FAILURE_UNKNOWN, parse_retry_after)
 
-# Suppress the XMLParsedAsHTMLWarning
-warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
+# Title stored for URLs skipped because their host's circuit is open
+HOST_DOWN_TITLE = "Host Down (circuit open)"
 
-# --- Efficiency Suggestion: Filter out common non-HTML file extensions ---
-NON_HTML_EXTENSIONS = {
-    '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.pdf', '.zip', '.rar', 
-    '.exe', '.css', '.js', '.mp3', '.mp4', '.avi', '.mkv', '.mov',
-    '.iso', '.dmg', '.tar', '.gz', '.7z', '.xml', '.rss'
-}
+# --- NEW: Streaming fetch limits ---
+# Content types worth downloading and parsing. A missing Content-Type is let
+# through; the byte cap still applies to it.
+HTML_CONTENT_TYPES = {'text/html', 'application/xhtml+xml', 'text/plain'}
+
+# Default cap on the (decoded) body size of a single page. 0 disables it.
+DEFAULT_MAX_PAGE_BYTES = 10 * 1024 * 1024
+
+# In titles-only mode, stop reading after this many bytes if no </title> was seen.
+DEFAULT_TITLE_BYTE_BUDGET = 32 * 1024
+DEFAULT_FETCH_TIMEOUT = 60 # Used when adaptive per-host timeouts are off
+DEFAULT_FETCH_TOTAL_TIMEOUT = 180 # Whole request, body included
+# --- END NEW ---
+
+class FetchOptions:
+    """
+    Per-run settings that control how much of each response get_data reads.
+    `extra_headers`, `timeout` and `total_timeout` are usually set on
+    per-request copies (see for_request). `accept_encoding` is handed to curl,
+    which decodes the response; None asks for uncompressed pages.
+    """
+    def __init__(self, max_page_bytes=DEFAULT_MAX_PAGE_BYTES, titles_only=False,
+                 title_byte_budget=DEFAULT_TITLE_BYTE_BUDGET, accept_encoding=None,
+                 total_timeout=DEFAULT_FETCH_TOTAL_TIMEOUT):
+        self.max_page_bytes = max_page_bytes
+        self.titles_only = titles_only
+        self.title_byte_budget = title_byte_budget
+        self.accept_encoding = accept_encoding
+        self.extra_headers = None
+        self.timeout = DEFAULT_FETCH_TIMEOUT # Seconds, or a (connect, read) tuple
+        self.total_timeout = total_timeout # Seconds for the whole request, body included
+        self.transfer_stats = None # Optional TransferStats shared by every request
+
+    def for_request(self, extra_headers=None, timeout=None, total_timeout=None):
+        """
+        Returns a copy for one request: `extra_headers` are sent on top of the
+        default HEADERS, `timeout` and `total_timeout` replace the defaults.
+        """
+        if not extra_headers and timeout is None and total_timeout is None:
+            return self
+        options = copy.copy(self)
+        if extra_headers:
+            options.extra_headers = extra_headers
+        if timeout is not None:
+            options.timeout = timeout
+        if total_timeout is not None:
+            options.total_timeout = total_timeout
+        return options
+
+    def deadlines(self):
+        """
+        (time-to-headers, whole-request) deadlines in seconds. curl does not
+        enforce these on a streamed request: a (connect, read) timeout only
+        becomes a connect timeout plus a low-speed stall check, so a server
+        that trickles bytes would hold the worker indefinitely.
+        """
+        if isinstance(self.timeout, tuple):
+            headers_deadline = sum(self.timeout)
+        else:
+            headers_deadline = self.timeout
+        return headers_deadline, max(headers_deadline, self.total_timeout)
+
+    @property
+    def request_headers(self):
+        return {**HEADERS, **self.extra_headers} if self.extra_headers else HEADERS
+
+    @classmethod
+    def from_args(cls, args, titles_only_mode=False):
+        """Builds options from the scraper's argparse.Namespace."""
+        return cls(
+            max_page_bytes=getattr(args, 'max_page_bytes', DEFAULT_MAX_PAGE_BYTES),
+            titles_only=titles_only_mode,
+            title_byte_budget=getattr(args, 'title_byte_budget', DEFAULT_TITLE_BYTE_BUDGET),
+            accept_encoding=negotiated_accept_encoding() if getattr(args, 'compress_responses', True) else None,
+            total_timeout=getattr(args, 'fetch_total_timeout', DEFAULT_FETCH_TOTAL_TIMEOUT)
+        )
+
+class FetchResult:
+    """
+    Outcome of a single get_data() call.
+    `content` holds the body bytes on success. `skip_reason` is set when the
+    response was deliberately not downloaded (wrong type, too large).
+    `redirect_chain` is [requested, ..., final] if the request was redirected.
+    """
+    def __init__(self, status_code=None, content=None, headers=None, skip_reason=None, redirect_chain=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.skip_reason = skip_reason
+        self.redirect_chain = redirect_chain or []
+
+    @property
+    def final_url(self):
+        return self.redirect_chain[-1] if self.redirect_chain else None
+
+# --- NEW: Conditional revalidation ---
+def content_hash(body):
+    """Short digest of a page body, used to spot unchanged pages on a refetch."""
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+def run_signature_hash(keywords, parser_engine=None, text_options=None):
+    """
+    Digest of the settings a page's title/keyword_match/page_data depend on:
+    the keyword list, the parser engine and the page text options. Stored
+    results are only reusable by a run with the same signature.
+    """
+    parts = [
+        f"engine={parser_engine or DEFAULT_PARSER_ENGINE}",
+        f"strip_boilerplate={bool(text_options and text_options.strip_boilerplate)}",
+        f"max_page_text_chars={text_options.max_chars if text_options else 0}",
+    ]
+    parts += sorted(keywords or [])
+    return hashlib.blake2b("\n".join(parts).encode('utf-8'), digest_size=16).hexdigest()
+
+def stored_result_is_reusable(info, save_page_data_mode, run_hash):
+    """
+    True if the stored title/keyword_match/page_data of a link are what this
+    run would produce again from an unchanged page, so a 304 or identical
+    body hash lets the worker skip parsing. Rows whose last attempt failed
+    no longer hold the page's data and are always refetched in full.
+    """
+    if not info or info['scraped'] == 2 or not info['title']:
+        return False
+    if not (info['etag'] or info['last_modified'] or info['content_hash']):
+        return False
+    if info['keyword_set_hash'] != run_hash:
+        return False
+    if save_page_data_mode == "All" or (save_page_data_mode == "Keyword Match" and info['keyword_match']):
+        return bool(info['has_page_data'])
+    return True
+
+def conditional_headers(info):
+    """If-None-Match / If-Modified-Since for a stored link, if it has validators."""
+    headers = {}
+    if info.get('etag'):
+        headers['If-None-Match'] = info['etag']
+    if info.get('last_modified'):
+        headers['If-Modified-Since'] = info['last_modified']
+    return headers
+# --- END NEW ---
+
+def read_connect_time(response):
+    """curl's CONNECT_TIME for a response (SOCKS handshake + circuit setup), or None."""
+    curl = getattr(response, 'curl', None)
+    if curl is None:
+        return None
+    try:
+        connect_time = float(curl.getinfo(CurlInfo.CONNECT_TIME))
+        return connect_time if connect_time > 0 else None
+    except Exception:
+        return None
+
+def read_redirect_chain(response, requested_url):
+    """The normalized redirect chain curl followed for `requested_url` ([] if none)."""
+    hop_urls = [hop.url for hop in (getattr(response, 'history', None) or [])]
+    return normalize_redirect_chain(requested_url, hop_urls, getattr(response, 'url', None))
+
+def read_wire_bytes(response):
+    """Body bytes received so far as they came off the wire (before decoding), or None."""
+    curl = getattr(response, 'curl', None)
+    if curl is None:
+        return None
+    try:
+        return int(curl.getinfo(CurlInfo.SIZE_DOWNLOAD_T))
+    except Exception:
+        return None
+
+def is_timeout_error(e):
+    """True if a fetch exception was a timeout (curl error 28 or asyncio)."""
+    if isinstance(e, asyncio.TimeoutError):
+        return True
+    if getattr(e, 'code', None) == 28: # CURLE_OPERATION_TIMEDOUT
+        return True
+    return 'timed out' in str(e).lower()
+
+def timeout_signals_congestion(host, latency_tracker=None, host_breaker=None):
+    """
+    Whether a timeout on `host` says anything about Tor's load. Hosts that
+    never answered (dead or never-seen onions, the normal case on seed lists)
+    and hosts whose circuit is already open time out however idle Tor is.
+    """
+    if host_breaker and host_breaker.is_tripped(host):
+        return False
+    return bool(latency_tracker and latency_tracker.sample_count(host))
+
+def classify_failure(error=None, status_code=None):
+    """Maps a fetch exception or a non-200 status to a retry_scheduler FAILURE_* kind."""
+    if error is not None:
+        if is_timeout_error(error):
+            return FAILURE_TIMEOUT
+        if isinstance(error, ProxyError) or 'socks' in str(error).lower():
+            return FAILURE_SOCKS
+        if isinstance(error, CurlError):
+            return FAILURE_CONNECTION
+        return FAILURE_UNKNOWN
+    if status_code == 429:
+        return FAILURE_RATE_LIMITED
+    if status_code is not None and 500 <= status_code < 600:
+        return FAILURE_SERVER_ERROR
+    if status_code in (404, 410):
+        return FAILURE_NOT_FOUND
+    if status_code is not None:
+        return FAILURE_HTTP_ERROR
+    return FAILURE_UNKNOWN
+
+def check_response_headers(headers, max_page_bytes=DEFAULT_MAX_PAGE_BYTES):
+    """
+    Inspects response headers before the body is read.
+    Returns a reason string if the body should not be downloaded, else None.
+    """
+    content_type = (headers.get('Content-Type') or '').split(';')[0].strip().lower()
+    if content_type and content_type not in HTML_CONTENT_TYPES:
+        return f"Non-HTML content type '{content_type}'"
+
+    if max_page_bytes:
+        content_length = headers.get('Content-Length')
+        try:
+            if content_length and int(content_length) > max_page_bytes:
+                return f"Content-Length {int(content_length):,} exceeds cap of {max_page_bytes:,} bytes"
+        except ValueError:
+            pass # Malformed header, rely on the streaming cap
+    return None
+
+def extract_title(html_bytes, charset='utf-8'):
+    """
+    Lightweight <title> scanner for titles-only mode.
+    Works on a (possibly truncated) byte prefix of the page; no DOM is built.
+    Only the title's bytes are decoded, with `charset`.
+    Returns the title string, or None if no complete <title> was found.
+    """
+    lowered = html_bytes.lower()
+    start = lowered.find(b'<title')
+    while start != -1:
+        # Make sure this is <title> or <title ...>, not e.g. <titlebar>
+        next_char = lowered[start + 6:start + 7]
+        if next_char in (b'>', b' ', b'\t', b'\n', b'\r', b'/'):
+            break
+        start = lowered.find(b'<title', start + 6)
+    if start == -1:
+        return None
+
+    content_start = lowered.find(b'>', start)
+    if content_start == -1:
+        return None
+    content_end = lowered.find(b'</title', content_start)
+    if content_end == -1:
+        return None
+
+    raw_title = html_bytes[content_start + 1:content_end].decode(charset, errors='ignore')
+    title = html.unescape(' '.join(raw_title.split()))
+    return title or None
+
+def skip_dead_hosts(links, host_breaker, context):
+    """Drops links whose host has an open circuit that isn't due for a probe."""
+    alive = [link for link in links if not host_breaker.is_known_dead(urlparse(link).netloc)]
+    skipped = len(links) - len(alive)
+    if skipped:
+        logging.info(f"[HOSTS] Skipping {skipped} links on known-dead hosts ({context}).")
+    return alive
 
 # --- NEW: Helper coroutine to wait for the threading.Event ---
 async def wait_for_stop_event(stop_event):
@@ -37,12 +302,224 @@ async def wait_for_stop_event(stop_event):
     while not stop_event.is_set():
         await asyncio.sleep(0.1)
     logging.warning("Stop event detected during queue join.")
+
+async def join_queue_or_stop(queue, stop_event):
+    """
+    Waits until the queue is joined or the stop event is set.
+    Returns True if the queue drained, False if a stop was requested.
+    """
+    # Create the two tasks we'll wait for
+    join_task = asyncio.create_task(queue.join())
+    stop_task = asyncio.create_task(wait_for_stop_event(stop_event))
+
+    # Wait for *either* the queue to be joined OR the stop event to be set
+    done, pending = await asyncio.wait(
+        {join_task, stop_task}, 
+        return_when=asyncio.FIRST_COMPLETED
+    )
+
+    # We must cancel the task that didn't finish
+    for task in pending:
+        task.cancel()
+
+    return not (stop_task in done or stop_event.is_set())
 # --- END NEW ---
 
-async def get_data(url, task_id, worker_id, active_tasks_dict, active_tasks_lock): # <-- Added worker_id
-    """Asynchronously fetches the content of a URL using a random proxy."""
-    chosen_proxy = random.choice(PROXIES)
-    logging.info(f"[{worker_id}] Fetching: {url} | Proxy: {chosen_proxy}")
+async def _stream_page(session, url, proxy, worker_id, task_id, active_tasks_dict, active_tasks_lock, fetch_options,
+                       lease=None, on_headers=None):
+    """
+    Streams the body of `url`, aborting early on a non-HTML Content-Type or an
+    oversized Content-Length, and stopping once `max_page_bytes` is exceeded.
+    In titles-only mode the stream is closed as soon as </title> has been read
+    (or the title byte budget is used up) and the partial body is returned.
+    `on_headers` is called as soon as the response headers are in.
+    The task's 'bytes' counts wire bytes; 'decoded_bytes' the decoded body.
+    Missing the headers or whole-request deadline (FetchOptions.deadlines)
+    raises asyncio.TimeoutError.
+    """
+    max_page_bytes = fetch_options.max_page_bytes
+    headers_deadline, total_deadline = fetch_options.deadlines()
+    started_at = time.monotonic()
+    try:
+        response = await asyncio.wait_for(
+            session.get(url, timeout=fetch_options.timeout, headers=fetch_options.request_headers,
+                        proxy=proxy, stream=True, accept_encoding=fetch_options.accept_encoding),
+            headers_deadline
+        )
+    except asyncio.TimeoutError:
+        raise asyncio.TimeoutError(f"No response headers within {headers_deadline:.0f}s") from None
+    if lease is not None:
+        lease.mark_response(read_connect_time(response))
+    if on_headers is not None:
+        on_headers()
+    body = bytearray()
+    deadline_missed = False
+    try:
+        redirect_chain = read_redirect_chain(response, url)
+        if redirect_chain:
+            logging.info(f"[{worker_id}] [REDIRECT] {' -> '.join(redirect_chain)}")
+
+        if response.status_code == 304: # Conditional request: page unchanged
+            logging.info(f"[{worker_id}] [UNCHANGED] {url} | 304 Not Modified")
+            return FetchResult(status_code=304, headers=response.headers, redirect_chain=redirect_chain)
+
+        if response.status_code != 200:
+            logging.warning(f"[{worker_id}] [FAIL] Failed to fetch {url} | Status: {response.status_code}")
+            return FetchResult(status_code=response.status_code, headers=response.headers,
+                               redirect_chain=redirect_chain)
+
+        skip_reason = check_response_headers(response.headers, 0 if fetch_options.titles_only else max_page_bytes)
+        if skip_reason:
+            logging.info(f"[{worker_id}] [SKIP] {url} | {skip_reason}")
+            return FetchResult(status_code=200, headers=response.headers, skip_reason=skip_reason,
+                               redirect_chain=redirect_chain)
+
+        try:
+            skip_reason = await asyncio.wait_for(
+                _read_body(response, body, url, worker_id, task_id, active_tasks_dict, active_tasks_lock, fetch_options),
+                max(0.0, total_deadline - (time.monotonic() - started_at))
+            )
+        except asyncio.TimeoutError:
+            deadline_missed = True
+            raise asyncio.TimeoutError(f"Page not received within {total_deadline:.0f}s "
+                                       f"({len(body):,} bytes read)") from None
+        if skip_reason:
+            logging.info(f"[{worker_id}] [SKIP] {url} | {skip_reason}")
+            return FetchResult(status_code=200, headers=response.headers, skip_reason=skip_reason,
+                               redirect_chain=redirect_chain)
+
+        logging.info(f"[{worker_id}] [SUCCESS] Fetched: {url}")
+        return FetchResult(status_code=200, content=bytes(body), headers=response.headers,
+                           redirect_chain=redirect_chain)
+    finally:
+        if fetch_options.transfer_stats is not None:
+            fetch_options.transfer_stats.record(read_wire_bytes(response), len(body),
+                                                response.headers.get('content-encoding'))
+        # A body not read to the end (title found, cap, deadline) is aborted at curl's next write
+        if response.quit_now is not None:
+            response.quit_now.set()
+        if not deadline_missed:
+            await response.aclose()
+        # After a missed deadline the worker doesn't wait: a stalled transfer is ended by curl's own timers
+
+async def _read_body(response, body, url, worker_id, task_id, active_tasks_dict, active_tasks_lock, fetch_options):
+    """
+    Reads the streamed body of `response` into the bytearray `body`.
+    Returns a skip reason if the body exceeded max_page_bytes, else None.
+    """
+    max_page_bytes = fetch_options.max_page_bytes
+    async for chunk in response.aiter_content():
+        scanned = len(body)
+        body += chunk
+        wire_bytes = read_wire_bytes(response)
+        with active_tasks_lock:
+            if task_id in active_tasks_dict:
+                active_tasks_dict[task_id]['bytes'] = wire_bytes if wire_bytes is not None else len(body)
+                active_tasks_dict[task_id]['decoded_bytes'] = len(body)
+
+        if fetch_options.titles_only:
+            # Only look at the new bytes (plus overlap for a split tag)
+            if bytes(body[max(0, scanned - 7):]).lower().find(b'</title') != -1:
+                break
+            if len(body) >= fetch_options.title_byte_budget:
+                logging.debug(f"[{worker_id}] Title byte budget reached for {url} without </title>.")
+                break
+        elif max_page_bytes and len(body) > max_page_bytes:
+            return f"Body exceeded cap of {max_page_bytes:,} bytes"
+    return None
+
+class _FetchAttempt:
+    """One of the (at most two) copies of a hedged request."""
+    def __init__(self, label):
+        self.label = label
+        self.proxy = None
+        self.task = None
+        self.headers = asyncio.get_running_loop().create_future()
+        self.started_at = time.monotonic()
+
+    def mark_headers(self):
+        if not self.headers.done():
+            self.headers.set_result(None)
+
+async def _pooled_attempt(session_pool, attempt, url, worker_id, task_id, active_tasks_dict, active_tasks_lock,
+                          fetch_options, proxy=None):
+    async with session_pool.borrow(url, proxy, worker_id) as lease:
+        attempt.proxy = lease.proxy
+        logging.info(f"[{worker_id}] Fetching{attempt.label}: {url} | Proxy: {lease.proxy}")
+        return await _stream_page(lease.session, url, lease.request_proxy, worker_id, task_id,
+                                  active_tasks_dict, active_tasks_lock, fetch_options, lease,
+                                  on_headers=attempt.mark_headers)
+
+async def _cancel_attempts(attempts):
+    """Cancels the attempts still running and waits until they have stopped."""
+    tasks = [a.task for a in attempts if a.task and not a.task.done()]
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def _hedged_fetch(session_pool, hedging_policy, url, worker_id, task_id, active_tasks_dict, active_tasks_lock,
+                        fetch_options):
+    """
+    Sends the request; if no headers arrive within the host's hedge delay
+    (and the budget allows), sends a duplicate through another SocksPort.
+    The first attempt to get headers streams the body; the other is cancelled
+    as soon as the winner is known, so only one body comes through Tor.
+    """
+    fetch_args = (url, worker_id, task_id, active_tasks_dict, active_tasks_lock, fetch_options)
+    hedging_policy.on_request()
+    primary = _FetchAttempt("")
+    primary.task = asyncio.create_task(_pooled_attempt(session_pool, primary, *fetch_args))
+    attempts = [primary]
+    try:
+        delay = hedging_policy.hedge_delay(urlparse(url).netloc)
+        if delay is None:
+            return await primary.task
+
+        await asyncio.wait({primary.task, primary.headers}, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+        if primary.headers.done() or primary.task.done() or not hedging_policy.try_hedge():
+            return await primary.task
+
+        hedge_proxy = session_pool.scheduler.choose(exclude={primary.proxy})
+        hedge = _FetchAttempt(" (hedge)")
+        hedge.task = asyncio.create_task(_pooled_attempt(session_pool, hedge, *fetch_args, proxy=hedge_proxy))
+        attempts.append(hedge)
+        logging.debug(f"[{worker_id}] No headers from {url} after {delay:.1f}s. Hedging via {hedge_proxy}.")
+
+        # First attempt with headers wins; an attempt that fails before that drops out
+        while True:
+            waitables = {a.headers for a in attempts} | {a.task for a in attempts if not a.task.done()}
+            await asyncio.wait(waitables, return_when=asyncio.FIRST_COMPLETED)
+            responded = [a for a in attempts if a.headers.done()]
+            if responded:
+                winner = responded[0]
+                break
+            if all(a.task.done() for a in attempts):
+                winner = primary
+                break # Both failed; the original's error is raised
+
+        # Stop the losing attempt before the winner's body is streamed
+        await _cancel_attempts([a for a in attempts if a is not winner])
+        if winner is hedge:
+            hedging_policy.on_hedge_won(time.monotonic() - primary.started_at)
+        elif winner.headers.done():
+            hedging_policy.on_hedge_lost()
+        return await winner.task
+    finally:
+        # Only still running if this call was itself cancelled
+        await _cancel_attempts(attempts)
+
+async def get_data(url, task_id, worker_id, active_tasks_dict, active_tasks_lock, session_pool=None,
+                   fetch_options=None, hedging_policy=None): # <-- Added worker_id
+    """
+    Asynchronously fetches the content of a URL.
+    If a SessionPool is given, a long-lived pooled session is borrowed on the
+    healthiest SocksPort; otherwise a one-off session on a random proxy is used.
+    With a HedgingPolicy (pool only), slow requests get a duplicate on another
+    SocksPort. Returns a FetchResult; network errors are re-raised.
+    """
+    if fetch_options is None:
+        fetch_options = FetchOptions()
 
     try:
         site_name = urlparse(url).netloc
@@ -55,26 +532,34 @@ async def get_data(url, task_id, worker_id, active_tasks_dict, active_tasks_lock
             "worker_id": worker_id, # <-- STORE WORKER ID
             "url": url, 
             "site": site_name, 
-            "bytes": 0,
+            "bytes": 0, # On the wire (compressed)
+            "decoded_bytes": 0,
             "title": "Pending...", # <-- FIX (Request 2): Add title field
             "finished_at": None
         }
 
     try:
-        async with AsyncSession() as session:
-            response = await session.get(url, timeout=60, headers=HEADERS, proxy=chosen_proxy)
-            if response.status_code == 200:
-                logging.info(f"[{worker_id}] [SUCCESS] Fetched: {url}")
-                data = response.content # Get bytes
-                with active_tasks_lock:
-                    if task_id in active_tasks_dict:
-                        active_tasks_dict[task_id]['bytes'] = len(data)
-                return data # Return bytes
-            else:
-                logging.warning(f"[{worker_id}] [FAIL] Failed to fetch {url} | Status: {response.status_code}")
+        # --- NEW: Borrow a pooled session (falls back to a one-off session) ---
+        if session_pool is not None and hedging_policy is not None:
+            return await _hedged_fetch(session_pool, hedging_policy, url, worker_id, task_id,
+                                       active_tasks_dict, active_tasks_lock, fetch_options)
+        elif session_pool is not None:
+            async with session_pool.borrow(url, worker_id=worker_id) as lease:
+                logging.info(f"[{worker_id}] Fetching: {url} | Proxy: {lease.proxy}")
+                return await _stream_page(lease.session, url, lease.request_proxy, worker_id, task_id,
+                                          active_tasks_dict, active_tasks_lock, fetch_options, lease)
+        else:
+            chosen_proxy = random.choice(PROXIES)
+            logging.info(f"[{worker_id}] Fetching: {url} | Proxy: {chosen_proxy}")
+            # curl ends the transfer itself if it outlives the request's deadlines
+            transfer_timeout_ms = int(max(fetch_options.deadlines()) * 1000)
+            async with AsyncSession(curl_options={CurlOpt.TIMEOUT_MS: transfer_timeout_ms}) as session:
+                return await _stream_page(session, url, chosen_proxy, worker_id, task_id,
+                                          active_tasks_dict, active_tasks_lock, fetch_options)
+        # --- END NEW ---
     except Exception as e:
         # --- FIX: Log common network errors to DEBUG (file only) ---
-        if isinstance(e, (ProxyError, CurlError)):
+        if isinstance(e, (ProxyError, CurlError, asyncio.TimeoutError)):
             # This is an expected network failure (e.g., site is down).
             # Log it at DEBUG level so it goes to the file but not the GUI.
             logging.debug(f"[{worker_id}] [NETWORK FAIL] Fetching {url}: {e}")
@@ -88,121 +573,44 @@ async def get_data(url, task_id, worker_id, active_tasks_dict, active_tasks_lock
     # The 'finally' block that set 'finished_at' and 'Scrape Failed'
     # title has been removed to fix the race condition.
     # This is now handled by the main worker task.
-    
-    return None 
 
-def parse_page_content(html_content, base_url, onion_only_mode=False, titles_only_mode=False, keywords=None):
+def parse_page_content(html_content, base_url, onion_only_mode=False, titles_only_mode=False, keywords=None,
+                       parser_engine=None, charset=None, text_options=None, fingerprint_pages=False):
     """
     Parses HTML to find the page title, all absolute links, page text, and a matching keyword.
-    Returns: (found_links_list, title_string, page_text_string, matching_keyword_string)
+    `html_content` is the raw body (decoded by the parser with `charset`, sniffed
+    if not given) or a str. `parser_engine` picks the extraction engine (see
+    page_parser; default: single-pass lxml). `text_options` (page_parser.TextOptions)
+    bounds the page text; the keywords are matched against that bounded text.
+    `keywords` is a KeywordMatcher, or a keyword list (compiled on every call).
+    With `fingerprint_pages`, the page text's SimHash is computed (see near_duplicates).
+    Returns: (found_links_list, title_string, page_text_string, matching_keyword_string,
+    keyword_hits_list, fingerprint_or_None), the hits as returned by KeywordMatcher.match_hits.
     """
-    soup = BeautifulSoup(html_content, 'lxml')
-
-    title_tag = soup.find('title')
-    title = title_tag.get_text(strip=True) if title_tag else "No Title Found"
+    title, page_text, hrefs = get_extractor(parser_engine)(html_content, charset, text_options)
 
     if titles_only_mode:
         logging.info(f"Parsed Title Only: '{title}' from {base_url}")
-        return [], title, "", None # Return empty values for other fields
+        return [], title, "", None, [], None # Return empty values for other fields
     
-    page_text = soup.get_text(separator=' ', strip=True)
     matching_keyword = None
+    keyword_hits = []
 
-    # --- MODIFIED: Handle "Assert" vs "Find" regex types ---
-    if keywords:
-            try:
-                page_text_lower = page_text.lower()
-                # Pad the whole document for reliable whole-word matching
-                page_text_padded = f" {page_text_lower} " 
-                
-                unique_matches_found = set()
-                
-                for keyword in keywords:
-                    if keyword.startswith("REGEX: "):
-                        # This is a regular expression
-                        try:
-                            # Get the regex pattern (remove "REGEX: ")
-                            pattern = keyword[7:].strip()
-                            
-                            # --- NEW CRASH FIX ---
-                            # Check if this is a "whole document" Assert pattern
-                            if pattern.startswith("(?="):
-                                # If so, use re.search() ONCE.
-                                # This is fast and checks for a single match anywhere.
-                                if re.search(pattern, page_text, re.IGNORECASE): # <-- USE 're'
-                                    # We can't know *what* it matched (lookaheads don't capture),
-                                    # so we save the pattern itself.
-                                    unique_matches_found.add(keyword) # Add the full "REGEX: ..." string
-                                    logging.info(f"[KEYWORD HIT] Whole-document regex '{pattern}' matched at {base_url}")
-                            else:
-                                # This is a normal "Find" regex. Use finditer.
-                                for match in re.finditer(pattern, page_text, re.IGNORECASE): # <-- USE 're'
-                                    # Get the actual matched text (e.g., " street ")
-                                    matched_text = match.group(0) 
-                                    
-                                    # Strip it (e.g., "street")
-                                    stripped_match = matched_text.strip()
-                                    
-                                    # Add the *result* to the set
-                                    if stripped_match: # Don't add empty strings
-                                        unique_matches_found.add(stripped_match)
-                                        logging.info(f"[KEYWORD HIT] Regex '{pattern}' found: '{stripped_match}' at {base_url}")
-                            # --- END CRASH FIX ---
-
-                        except re.error as e: # <-- MODIFIED to re.error
-                            logging.warning(f"Invalid regex in keyword file: '{keyword}'. Error: {e}")
-                    
-                    else:
-                        # This is a plain text keyword (logic is unchanged)
-                        keyword_lower = keyword.lower()
-                        
-                        if ' ' in keyword_lower:
-                            # Multi-word: search as-is
-                            padded_search_term = keyword_lower
-                        else:
-                            # Single word: use word boundary logic
-                            padded_search_term = f" {keyword_lower} " 
-
-                        if padded_search_term in page_text_padded:
-                            unique_matches_found.add(keyword) # Store the original cased keyword
-                            logging.info(f"[KEYWORD HIT] Found '{keyword}' at {base_url}")
-                
-                if unique_matches_found:
-                    # --- THIS IS THE FIX ---
-                    # Use the new unique delimiter
-                    matching_keyword = " _!|!_ ".join(sorted(list(unique_matches_found)))
-                    # --- END FIX ---
-                else:
-                    matching_keyword = None
+    # Plain, "Assert" and "Find" keywords, classified and compiled once per run
+    keyword_matcher = KeywordMatcher.build(keywords)
+    if keyword_matcher:
+        try:
+            matching_keyword, keyword_hits = keyword_matcher.match_hits(page_text, base_url)
+        except Exception as e:
+            logging.error(f"Error during keyword search at {base_url}: {e}")
 
-            except Exception as e:
-                logging.error(f"Error during keyword search at {base_url}: {e}")
-    # --- END MODIFIED ---
+    # Base URL parsed once; netloc verdicts are cached for the run
+    found_links = LinkResolver(base_url, onion_only_mode).resolve(hrefs)
 
-    found_links = set()
-    for link in soup.find_all('a', href=True):
-        href = link['href']
-        absolute_link = urljoin(base_url, href).rstrip('/')
-        
-        # --- FIX: Add junk filter ---
-        if is_junk_url(absolute_link):
-            continue
-        # --- END FIX ---
-        
-        parsed_link = urlparse(absolute_link)
-        
-        if any(parsed_link.path.lower().endswith(ext) for ext in NON_HTML_EXTENSIONS):
-            continue
-        
-        if parsed_link.scheme in ['http', 'https']:
-            if onion_only_mode:
-                if parsed_link.netloc.endswith('.onion'):
-                    found_links.add(absolute_link)
-            else:
-                found_links.add(absolute_link)
+    fingerprint = simhash(page_text) if fingerprint_pages else None
 
     logging.info(f"Parsed {base_url} | Title: '{title}' | Found {len(found_links)} new links.")
-    return list(found_links), title, page_text, matching_keyword
+    return list(found_links), title, page_text, matching_keyword, keyword_hits, fingerprint
 
 
 async def scraper_worker_task(worker_id, queue, stop_event, pause_event, 
@@ -210,15 +618,47 @@ async def scraper_worker_task(worker_id, queue, stop_event, pause_event,
                             onion_only_mode, titles_only_mode, 
                             keywords, save_page_data_mode, # <-- Changed
                             top_level_only_mode,
-                            db_path): # <-- MODIFIED: Add db_path
+                            db_path, # <-- MODIFIED: Add db_path
+                            session_pool=None,
+                            fetch_options=None,
+                            concurrency_controller=None,
+                            host_breaker=None,
+                            retry_scheduler=None,
+                            hedging_policy=None,
+                            timeout_policy=None,
+                            redirect_tracker=None,
+                            parser_engine=None,
+                            parse_pool=None,
+                            keyword_matcher=None,
+                            text_options=None,
+                            near_duplicates=None):
     """
     A worker (consumer) that pulls a (url, task_id) tuple from the 
-    queue and processes it.
+    queue and processes it. All workers of a run share one SessionPool.
+    If a concurrency controller is given, the worker must hold one of its
+    fetch slots while the request is on the network. If a host circuit
+    breaker is given, URLs on hosts with an open circuit are marked failed
+    without being fetched. If a retry scheduler is given, transient
+    failures are handed to it for another attempt later in the run. A
+    timeout policy supplies per-host connect/read deadlines. A redirect
+    followed to another URL stores the page under the final URL; with a
+    redirect tracker, queued URLs already resolved that way are dropped.
+    `parser_engine` selects the HTML extraction engine (see page_parser).
+    With a parse pool, pages are parsed in its worker processes instead of
+    on the event loop. `keyword_matcher` is the run's compiled `keywords`.
+    `text_options` bounds the page text that is matched and saved. With a
+    near-duplicate index, pages are fingerprinted; a near-duplicate of an
+    already stored page gets a reference to it instead of its own page_data.
     """
     
     # --- MODIFIED: Worker creates its own DB connection ---
     db = DatabaseManager(db_path)
     # --- END MODIFIED ---
+    if fetch_options is None:
+        fetch_options = FetchOptions(titles_only=titles_only_mode)
+    run_hash = run_signature_hash(keywords, parser_engine, text_options)
+    if keyword_matcher is None:
+        keyword_matcher = KeywordMatcher.build(keywords)
 
     try: # --- MODIFIED: Wrap entire loop in try...finally ---
         while not stop_event.is_set():
@@ -236,7 +676,16 @@ async def scraper_worker_task(worker_id, queue, stop_event, pause_event,
             new_links = []
             title_to_save = "Scrape Failed"
             keyword_match_to_save = None
+            keyword_hits_to_save = []
+            fingerprint = None
+            duplicate_of = None
             page_data_to_save = None
+            failure_kind = None
+            result = None
+            revalidation = None # Stored validators, if the stored result can be reused
+            unchanged = False
+            body_hash = None
+            resolved_by_redirect = False # Already stored as another URL's redirect target this run
             # --- END FIX ---
                 
             try:
@@ -260,33 +709,122 @@ async def scraper_worker_task(worker_id, queue, stop_event, pause_event,
                 
                 try:
                     # --- 3. Process the URL ---
-                    result = await get_data(url, task_id, worker_id, active_tasks_dict, active_tasks_lock)
+                    # --- NEW: Skip URLs another fetch already landed on through a redirect ---
+                    if redirect_tracker and redirect_tracker.resolved_to(url):
+                        logging.debug(f"[{worker_id}] {url} was already fetched as a redirect target. Skipping.")
+                        resolved_by_redirect = True
+                        continue # finally block leaves its row alone
+
+                    # --- Short-circuit hosts that keep failing to connect ---
+                    host = urlparse(url).netloc
+                    if host_breaker and not host_breaker.allow(host):
+                        logging.debug(f"[{worker_id}] Circuit open for {host}. Skipping {url}.")
+                        title_to_save = HOST_DOWN_TITLE
+                        failure_kind = FAILURE_HOST_DOWN
+                        continue # finally block marks it failed
+                    # --- END NEW ---
+
+                    # --- NEW: Revalidate pages we already hold a complete result for ---
+                    extra_headers = None
+                    if not titles_only_mode:
+                        info = db.get_revalidation_info(url)
+                        if stored_result_is_reusable(info, save_page_data_mode, run_hash):
+                            revalidation = info
+                            extra_headers = conditional_headers(info)
+                    # --- END NEW ---
+                    request_options = fetch_options.for_request(
+                        extra_headers=extra_headers,
+                        timeout=timeout_policy.timeouts_for(host) if timeout_policy else None,
+                        total_timeout=timeout_policy.total_for(host) if timeout_policy else None
+                    )
+
+                    # --- NEW: Hold an adaptive fetch slot only while on the network ---
+                    if concurrency_controller:
+                        await concurrency_controller.acquire()
+                    fetch_started = time.monotonic()
+                    fetch_outcome = None
+                    connection_failed = False
+                    try:
+                        result = await get_data(url, task_id, worker_id, active_tasks_dict, active_tasks_lock,
+                                                session_pool, request_options, hedging_policy)
+                        fetch_outcome = OUTCOME_SUCCESS # Any HTTP answer means the circuit worked
+                    except Exception as e:
+                        fetch_outcome = OUTCOME_TIMEOUT if is_timeout_error(e) else OUTCOME_ERROR
+                        connection_failed = isinstance(e, (ProxyError, CurlError)) or is_timeout_error(e)
+                        raise
+                    finally:
+                        if concurrency_controller:
+                            fetched_bytes = len(result.content) if result and result.content else 0
+                            congestion_outcome = fetch_outcome
+                            if fetch_outcome == OUTCOME_TIMEOUT and not timeout_signals_congestion(
+                                    host, timeout_policy.latency_tracker if timeout_policy else None, host_breaker):
+                                congestion_outcome = OUTCOME_HOST_TIMEOUT
+                            concurrency_controller.release(time.monotonic() - fetch_started, congestion_outcome, fetched_bytes)
+                        if timeout_policy and fetch_outcome:
+                            timeout_policy.on_result(host, fetch_outcome == OUTCOME_TIMEOUT)
+                        if host_breaker:
+                            if fetch_outcome == OUTCOME_SUCCESS:
+                                host_breaker.record_success(host)
+                            elif connection_failed:
+                                host_breaker.record_failure(host)
+                            else:
+                                host_breaker.record_cancel(host)
+                    # --- END NEW ---
                     
                     if stop_event.is_set():
                         logging.warning(f"[{worker_id}] Stop requested. Discarding result for {url}. DB not updated.")
                         continue 
                         
                     # --- This block is now only for SUCCESSFUL fetches ---
-                    if isinstance(result, bytes): # Fetch success
+                    body = result.content if result else None
+                    page_url = (result.final_url if result else None) or url # Relative links resolve against this
+                    if isinstance(body, bytes) and not titles_only_mode:
+                        body_hash = content_hash(body)
+
+                    # --- NEW: 304 or identical body: keep the stored result, skip parsing ---
+                    if revalidation and result and not result.redirect_chain and (
+                            result.status_code == 304 or (body_hash and body_hash == revalidation['content_hash'])):
+                        unchanged = True
+                        status = 1
+                        title_to_save = revalidation['title']
+                        logging.debug(f"[{worker_id}] {url} unchanged since last fetch. Skipping parse.")
+                        with active_tasks_lock:
+                            if task_id in active_tasks_dict:
+                                active_tasks_dict[task_id]['title'] = title_to_save
+                    # --- END NEW ---
+
+                    elif isinstance(body, bytes): # Fetch success
                         # --- NEW: VERBOSE LOGGING (DEBUG) ---
-                        logging.debug(f"[{worker_id}] Download complete for {url}. Attempting to parse {len(result)} bytes...")
+                        logging.debug(f"[{worker_id}] Download complete for {url}. Attempting to parse {len(body)} bytes...")
                         # --- END NEW ---
                         try:
-                            # Decode content
-                            logging.debug(f"[{worker_id}] Decoding content for {url}...") # <-- NEW
-                            html_content = result.decode('utf-8', errors='ignore')
-                            logging.debug(f"[{worker_id}] Content decoded. HTML length: {len(html_content)}. Parsing...") # <-- NEW
-                            
-                            # Parse content
-                            new_links, title, page_text, matching_keyword = parse_page_content(
-                                html_content, url, onion_only_mode, titles_only_mode, keywords
-                            )
+                            # The parser decodes the raw bytes itself, in the page's own charset
+                            charset = sniff_charset(body, result.headers.get('Content-Type'))
+                            if titles_only_mode:
+                                # --- NEW: Head-only title pipeline (no decode of the whole page, no DOM) ---
+                                new_links, page_text, matching_keyword, keyword_hits = [], "", None, []
+                                title = extract_title(body, charset) or "No Title Found"
+                            elif parse_pool:
+                                # Parsed and keyword-matched in a parse process; this worker
+                                # waits here (not fetching) while the parsers are saturated
+                                new_links, title, page_text, matching_keyword, keyword_hits, fingerprint = await parse_pool.parse(
+                                    body, page_url, charset
+                                )
+                                if matching_keyword:
+                                    logging.info(f"[KEYWORD HIT] '{matching_keyword}' at {url}")
+                            else:
+                                logging.debug(f"[{worker_id}] Parsing {url} as {charset}...") # <-- NEW
+                                new_links, title, page_text, matching_keyword, keyword_hits, fingerprint = parse_page_content(
+                                    body, page_url, onion_only_mode, titles_only_mode, keyword_matcher, parser_engine,
+                                    charset, text_options, near_duplicates is not None
+                                )
                             
                             logging.debug(f"[{worker_id}] Content parsed for {url}.") # <-- NEW
                             logging.info(f"[{worker_id}] Parsed Title: '{title}' from {url}")
                             
                             title_to_save = title
                             keyword_match_to_save = matching_keyword
+                            keyword_hits_to_save = keyword_hits
                             
                             # --- FIX (Request 2): Update title in active dict ---
                             with active_tasks_lock:
@@ -302,6 +840,19 @@ async def scraper_worker_task(worker_id, queue, stop_event, pause_event,
                             # If mode is "None", page_data_to_save remains None
                             # --- End Updated Logic ---
                             
+                            # --- NEW: Near-duplicates (mirrors, clones, templated pages) ---
+                            if near_duplicates and fingerprint is not None:
+                                # Only a page whose text is saved can stand in for its near-duplicates
+                                duplicate_of = near_duplicates.check(page_url, fingerprint,
+                                                                     keeps_text=page_data_to_save is not None)
+                                if duplicate_of:
+                                    logging.info(f"[DEDUP] {url} is a near-duplicate of {duplicate_of}")
+                                    if near_duplicates.skip_links:
+                                        new_links = []
+                                    if page_data_to_save is not None:
+                                        page_data_to_save = duplicate_page_data(duplicate_of) # A reference, not a copy
+                            # --- END NEW ---
+                            
                             # --- BUG FIX: titles_only_mode must also set status=1 ---
                             if titles_only_mode:
                                 # db.update_titles_batch([(title_to_save, url)]) # <-- OLD
@@ -316,15 +867,28 @@ async def scraper_worker_task(worker_id, queue, stop_event, pause_event,
                         
                         except Exception as e:
                             # --- NEW: VERBOSE LOGGING (ERROR) ---
-                            logging.error(f"[{worker_id}] CRITICAL PARSE FAILURE for {url}. Bytes downloaded: {len(result)}. Error: {e}")
+                            logging.error(f"[{worker_id}] CRITICAL PARSE FAILURE for {url}. Bytes downloaded: {len(body)}. Error: {e}")
                             logging.error(f"[{worker_id}] Full traceback for parse failure:\n{traceback.format_exc()}")
                             # --- END NEW ---
+                            failure_kind = FAILURE_PARSE
                             # status remains 2, title remains "Scrape Failed"
                     
+                    # --- NEW: Skipped responses (non-HTML / oversized) ---
+                    # These are not failures: mark them done so they are
+                    # never re-downloaded by a rescrape.
+                    elif result and result.skip_reason:
+                        title_to_save = f"Skipped: {result.skip_reason}"
+                        status = 1
+                        with active_tasks_lock:
+                            if task_id in active_tasks_dict:
+                                active_tasks_dict[task_id]['title'] = title_to_save
+                    # --- END NEW ---
+
                     # --- NEW: VERBOSE LOGGING (DEBUG) ---
                     else:
-                        # This logs if get_data returned None (e.g., 404)
+                        # This logs if get_data returned no body (e.g., 404)
                         logging.debug(f"[{worker_id}] No bytes returned from get_data for {url}. Status remains 2.")
+                        failure_kind = classify_failure(status_code=result.status_code if result else None)
                     # --- END NEW ---
 
                 except asyncio.CancelledError:
@@ -342,6 +906,7 @@ async def scraper_worker_task(worker_id, queue, stop_event, pause_event,
                         # This is an unexpected error (e.g., parsing, logic), log it to the GUI.
                         logging.error(f"[{worker_id}] Error in worker processing {url}: {e}\n{traceback.format_exc()}")
                     # --- END FIX ---
+                    failure_kind = classify_failure(error=e)
                     
                     # Status is already 2 (fail), title is "Scrape Failed"
                     # We will now fall through to the finally block to update the DB
@@ -352,24 +917,63 @@ async def scraper_worker_task(worker_id, queue, stop_event, pause_event,
                     if stop_event.is_set():
                         logging.warning(f"[{worker_id}] Stop requested. Final DB update for {url} skipped.")
                     # --- FIX: This block now correctly handles all cases ---
-                    else:
+                    elif not resolved_by_redirect:
                         try:
                             # --- MODIFIED: 'db' is local, 'url' check is sufficient ---
                             if url: 
                                 
+                                # --- NEW: A redirected page is stored under its final URL ---
+                                record_url = url
+                                redirect_chain = result.redirect_chain if result else []
+                                if redirect_chain and status == 1:
+                                    db.save_redirect(redirect_chain, chain_to_json(redirect_chain),
+                                                     redirect_title(redirect_chain[-1]))
+                                    record_url = redirect_chain[-1]
+                                    if redirect_tracker:
+                                        redirect_tracker.on_redirect(redirect_chain)
+                                elif redirect_chain:
+                                    db.save_redirect(redirect_chain, chain_to_json(redirect_chain))
+                                # --- END NEW ---
+
+                                # --- NEW: Unchanged page: only the timestamp changes ---
+                                if unchanged:
+                                    db.touch_unchanged_batch([(time.time(), url)])
+                                # --- END NEW ---
+
                                 # --- BUG FIX: titles_only_mode now updates status ---
-                                if titles_only_mode:
+                                elif titles_only_mode:
                                     # This now correctly updates status AND title
-                                    db.update_status_and_title_batch([(status, title_to_save, url)])
+                                    db.update_status_and_title_batch([(status, title_to_save, record_url)])
                                 # --- END BUG FIX ---
                                 
                                 else:
                                     # This is the main update for full-scrape mode (success or fail)
-                                    db.update_links_batch([(status, title_to_save, keyword_match_to_save, page_data_to_save, url)])
+                                    db.update_links_batch([(status, title_to_save, keyword_match_to_save, page_data_to_save, record_url)])
+                                    # Replaces the page's previous hits (none are kept for a failed page)
+                                    db.save_keyword_hits_batch([(record_url, keyword_hits_to_save)])
+                                    if status == 1 and near_duplicates:
+                                        db.save_page_fingerprint_batch([(
+                                            to_signed(fingerprint) if fingerprint is not None else None,
+                                            duplicate_of, record_url
+                                        )])
+                                    if status == 1 and body_hash:
+                                        db.save_fetch_validators_batch([(
+                                            result.headers.get('etag'), result.headers.get('last-modified'),
+                                            body_hash, run_hash, time.time(), record_url
+                                        )])
                                 
                                 # Add new links (only happens on status=1 and not titles_only)
                                 if status == 1 and new_links and not titles_only_mode:
                                     db.add_links(new_links, add_top_level_too=top_level_only_mode)
+
+                                # --- NEW: Count the failed attempt and maybe schedule a retry ---
+                                # Host-down short-circuits were never fetched; the host breaker gates them
+                                if status == 2 and retry_scheduler and failure_kind != FAILURE_HOST_DOWN:
+                                    attempts = db.record_failed_attempt(url, failure_kind or FAILURE_UNKNOWN)
+                                    retry_after = parse_retry_after(result.headers) if result else None
+                                    next_attempt_at = retry_scheduler.schedule(url, attempts, failure_kind, retry_after)
+                                    db.set_next_attempt_batch([(next_attempt_at, url)])
+                                # --- END NEW ---
                                     
                         except Exception as e:
                             logging.error(f"[{worker_id}] CRITICAL: Failed to update DB for {url}: {e}")
@@ -388,7 +992,7 @@ async def scraper_worker_task(worker_id, queue, stop_event, pause_event,
                     
                     # --- MODIFIED: Check db variable before task_done ---
                     if db:
-                        queue.task_done()
+                        queue.task_done(url) # Also frees the host's in-flight slot
 
             except asyncio.CancelledError:
                 logging.info(f"[{worker_id}] Worker shutting down.")
@@ -408,10 +1012,18 @@ async def scraper_main_producer(queue, args, stop_event,
                               rescrape_mode=False, top_level_only_mode=False, 
                               onion_only_mode=False, titles_only_mode=False, keywords=None,
                               save_page_data_mode="Keyword Match", # <-- Changed
-                              rescrape_page_data_mode=False): 
+                              rescrape_page_data_mode=False,
+                              host_breaker=None,
+                              retry_scheduler=None,
+                              host_prober=None): 
     """
     The main async function (PRODUCER) for the scraper logic.
     It finds links and adds them to the queue for the workers.
+    Links on hosts the circuit breaker knows to be dead are not queued.
+    With a host prober, links on never-seen hosts are only queued once a
+    liveness pre-probe of their host succeeds (normal mode).
+    Retries are fed into the queue by `retry_feeder`; the producer only
+    waits for outstanding ones before declaring a normal scrape complete.
     """
     db = DatabaseManager(args.db_file)
     
@@ -451,6 +1063,16 @@ async def scraper_main_producer(queue, args, stop_event,
                 if onion_only_mode:
                     links_to_process = [link for link in failed_links if urlparse(link).netloc.endswith('.onion')]
                 
+                # --- NEW: Don't spend workers on hosts known to be dead ---
+                if host_breaker:
+                    links_to_process = skip_dead_hosts(links_to_process, host_breaker, "rescrape")
+                # --- END NEW ---
+
+                # A manual rescrape starts the retry count over: each link gets max_retries
+                # automatic retries again, and no stale retry time is left behind
+                db.reset_retry_state(links_to_process)
+
+                links_to_process = interleave_by_host(links_to_process)
                 logging.info(f"--- Adding {len(links_to_process)} failed links to queue ---")
                 for url in links_to_process:
                     if stop_event.is_set(): break
@@ -483,6 +1105,7 @@ async def scraper_main_producer(queue, args, stop_event,
                 if onion_only_mode:
                     links_to_process = [link for link in links_missing_data if urlparse(link).netloc.endswith('.onion')]
                 
+                links_to_process = interleave_by_host(links_to_process)
                 logging.info(f"--- Adding {len(links_to_process)} links missing data to queue ---")
                 for url in links_to_process:
                     if stop_event.is_set(): break
@@ -509,6 +1132,17 @@ async def scraper_main_producer(queue, args, stop_event,
                 logging.info(f"[INFO] Adding/updating {len(args.urls)} starting URLs from file into database...")
                 db.add_links(args.urls, add_top_level_too=top_level_only_mode)
 
+            # --- NEW: Pick up retries left pending by a previous run ---
+            if retry_scheduler:
+                restored = 0
+                for url, next_attempt_at in db.get_scheduled_retries():
+                    if onion_only_mode and not urlparse(url).netloc.endswith('.onion'):
+                        continue
+                    restored += retry_scheduler.add(url, next_attempt_at)
+                if restored:
+                    logging.info(f"[RETRY] Restored {restored} scheduled retries from the database.")
+            # --- END NEW ---
+
             iteration_count = 0
             while not stop_event.is_set():
                 iteration_count += 1
@@ -526,7 +1160,25 @@ async def scraper_main_producer(queue, args, stop_event,
 
                 links_for_this_depth = [l for l in links_for_this_depth if l not in processed_in_this_run]
 
+                # --- NEW: Leave links on dead hosts unscraped (status 0) for a later run ---
+                if host_breaker:
+                    alive_links = skip_dead_hosts(links_for_this_depth, host_breaker, f"iteration {iteration_count}")
+                    processed_in_this_run.update(set(links_for_this_depth) - set(alive_links))
+                    links_for_this_depth = alive_links
+                # --- END NEW ---
+
                 if not links_for_this_depth:
+                    # --- NEW: Retried URLs may still discover new links ---
+                    if retry_scheduler and retry_scheduler.pending:
+                        logging.info(f"[RETRY] No new unscraped links. Waiting for {retry_scheduler.pending} scheduled "
+                                     f"retries (next in {retry_scheduler.seconds_until_next():.0f}s)...")
+                        while retry_scheduler.pending and not stop_event.is_set():
+                            await asyncio.sleep(1.0)
+                        if not await join_queue_or_stop(queue, stop_event):
+                            logging.warning("Stop detected while waiting for retries. Breaking producer loop.")
+                            break
+                        continue
+                    # --- END NEW ---
                     logging.info(f"[INFO] No new unscraped links found. Scrape complete.")
                     break
                     
@@ -546,6 +1198,15 @@ async def scraper_main_producer(queue, args, stop_event,
                     logging.info("[INFO] All potential links for this iteration have been processed. Scrape complete.")
                     break
                 
+                links_to_process = interleave_by_host(links_to_process)
+
+                # --- NEW: Links on never-seen hosts wait for a liveness pre-probe ---
+                held_back = {}
+                if host_prober:
+                    links_to_process, held_back = host_prober.hold_unseen(links_to_process)
+                    for _, _, held_links in held_back.values():
+                        processed_in_this_run.update(held_links)
+                # --- END NEW ---
                 logging.info(f"--- Iteration {iteration_count}: Adding {len(links_to_process)} new links to queue ---")
                 
                 for url in links_to_process:
@@ -572,29 +1233,19 @@ async def scraper_main_producer(queue, args, stop_event,
                 
                 if stop_event.is_set(): break
 
+                # --- NEW: Queue live hosts' links as their probes come back (workers are already busy) ---
+                if held_back:
+                    await host_prober.probe(held_back, stop_event,
+                                            lambda links: enqueue_links(queue, links, stop_event))
+                    if stop_event.is_set(): break
+                # --- END NEW ---
+
                 # --- MODIFIED: Robust, non-blocking queue.join() wait ---
                 logging.info(f"--- Iteration {iteration_count} links queued. Waiting for all tasks to complete... ---")
                 
-                # Create the two tasks we'll wait for
-                join_task = asyncio.create_task(queue.join())
-                stop_task = asyncio.create_task(wait_for_stop_event(stop_event))
-
-                # Wait for *either* the queue to be joined OR the stop event to be set
-                done, pending = await asyncio.wait(
-                    {join_task, stop_task}, 
-                    return_when=asyncio.FIRST_COMPLETED
-                )
-
-                # We must cancel the task that didn't finish
-                for task in pending:
-                    task.cancel()
-
-                # Now, check *why* we woke up
-                if stop_task in done or stop_event.is_set():
+                if not await join_queue_or_stop(queue, stop_event):
                     logging.warning("Stop detected during queue join. Breaking producer loop.")
                     break # This breaks the outer 'while not stop_event.is_set()' loop
-
-                # If we're here, it means join_task finished and stop_task didn't.
                 # --- END MODIFIED ---
 
                 logging.info(f"--- Iteration {iteration_count} queue drained. Checking for new links. ---")
@@ -611,3 +1262,44 @@ async def scraper_main_producer(queue, args, stop_event,
         total_links = db.get_total_link_count()
         logging.info(f"\n[INFO] Producer has finished. Total unique links in database: {total_links}")
         db.close()
+
+
+async def enqueue_links(queue, links, stop_event):
+    """Puts links on the queue as (url, task_id), polling while it is full."""
+    for url in links:
+        if stop_event.is_set():
+            return
+        if is_junk_url(url):
+            continue
+        task_id = f"{url}_{random.randint(10000, 99999)}"
+        while not stop_event.is_set():
+            try:
+                queue.put_nowait((url, task_id))
+                break
+            except asyncio.QueueFull:
+                await asyncio.sleep(0.5) # Poll
+
+
+async def retry_feeder(queue, retry_scheduler, stop_event):
+    """
+    Runs for the whole scraper run, putting URLs back on the queue once
+    their retry time has come.
+    """
+    try:
+        while not stop_event.is_set():
+            wait = retry_scheduler.seconds_until_next()
+            await asyncio.sleep(1.0 if wait is None else min(1.0, max(0.05, wait)))
+
+            for url in retry_scheduler.pop_due():
+                task_id = f"{url}_{random.randint(10000, 99999)}"
+                while not stop_event.is_set():
+                    try:
+                        queue.put_nowait((url, task_id))
+                        break
+                    except asyncio.QueueFull:
+                        await asyncio.sleep(0.5) # Poll
+                logging.debug(f"[RETRY] Re-queued {url}.")
+    except asyncio.CancelledError:
+        logging.info("Retry feeder task was cancelled.")
+    finally:
+        logging.info(f"[RETRY] {retry_scheduler.summary()}.")
@@ -0,0 +1,215 @@
+"""
+Pool of long-lived curl_cffi AsyncSessions shared by the scraper workers.
+
+Creating a new AsyncSession per URL means every fetch pays curl handle setup
+and a fresh SOCKS5 handshake. The pool keeps a fixed number of sessions per
+SocksPort for the lifetime of a scraper run; workers borrow one for a single
+request and hand it back, so curl's connection cache gets reused across
+requests (keep-alive for repeat hosts on the same proxy). Which SocksPort a
+request goes through is decided by the pool's ProxyScheduler; an optional
+SocksIsolation adds per-worker/per-host SOCKS credentials to the proxy URL.
+"""
+
+import logging
+import math
+import time
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+
+from curl_cffi import CurlOpt
+from curl_cffi.requests import AsyncSession
+
+from proxy_scheduler import ProxyScheduler
+
+# Upper bound on how many host -> session affinities we remember.
+MAX_HOST_AFFINITY_ENTRIES = 10000
+
+
+class PooledSession:
+    """A single AsyncSession bound to one proxy, plus its usage counters."""
+    def __init__(self, proxy, max_clients, curl_options=None):
+        self.proxy = proxy
+        self.session = AsyncSession(max_clients=max_clients, curl_options=curl_options)
+        self.max_clients = max_clients
+        self.in_flight = 0
+        self.requests_served = 0
+        self.retired = False # Its proxy left the pool; closed with the pool
+
+    @property
+    def has_capacity(self):
+        return self.in_flight < self.max_clients
+
+
+class SessionLease:
+    """
+    What `SessionPool.borrow()` yields: the session and proxy to use for one
+    request. Call `mark_response()` once the response headers have arrived so
+    the proxy scheduler learns time-to-headers rather than total download time.
+    """
+    def __init__(self, pooled, request_proxy=None):
+        self.pooled = pooled
+        self.session = pooled.session
+        self.proxy = pooled.proxy
+        self.request_proxy = request_proxy or pooled.proxy # What to pass to session.get(proxy=...)
+        self.started_at = time.monotonic()
+        self.response_at = None
+        self.connect_time = None # curl's CONNECT_TIME (SOCKS + circuit setup), if known
+
+    def mark_response(self, connect_time=None):
+        if self.response_at is None:
+            self.response_at = time.monotonic()
+            self.connect_time = connect_time
+
+
+class SessionPool:
+    """
+    Owns every AsyncSession used during one scraper run.
+
+    Sessions are grouped by SOCKS proxy. `borrow()` hands out the least-loaded
+    session for a proxy, preferring the session that last served the same host
+    so curl can reuse its open connection. `close()` must be awaited once the
+    run is over. With `transfer_timeout`, curl itself aborts any transfer
+    running longer (seconds), including one whose request was abandoned by
+    an asyncio deadline before its headers arrived.
+    """
+    def __init__(self, proxies, sessions_per_proxy=2, max_concurrency=150, scheduler=None,
+                 latency_tracker=None, isolation=None, transfer_timeout=None):
+        self.proxies = list(proxies)
+        self.scheduler = scheduler or ProxyScheduler(self.proxies)
+        self.isolation = isolation # Optional SocksIsolation
+        self.latency_tracker = latency_tracker # Optional HostLatencyTracker fed with time-to-headers
+        self.sessions_per_proxy = max(1, int(sessions_per_proxy))
+        self.curl_options = {CurlOpt.TIMEOUT_MS: int(transfer_timeout * 1000)} if transfer_timeout else None
+
+        # Spread the worker ceiling evenly over every session, with headroom
+        # so a burst on one proxy doesn't block inside curl's own queue.
+        total_sessions = max(1, len(self.proxies) * self.sessions_per_proxy)
+        self.max_clients_per_session = max(4, math.ceil(max_concurrency / total_sessions) * 2)
+
+        self._sessions = {proxy: [] for proxy in self.proxies}
+        self._retired_sessions = [] # Sessions of removed proxies, possibly still in use
+        self._host_affinity = OrderedDict() # netloc -> PooledSession
+        self._closed = False
+
+        # Run-wide counters (reported on close)
+        self.sessions_created = 0
+        self.total_borrows = 0
+        self.affinity_hits = 0
+
+    def add_proxies(self, proxies):
+        """Adds SocksPorts to a running pool; their sessions are created on first use."""
+        for proxy in proxies:
+            if proxy in self._sessions:
+                continue
+            self.proxies.append(proxy)
+            self._sessions[proxy] = []
+            self.scheduler.add_proxy(proxy)
+
+    def remove_proxies(self, proxies):
+        """
+        Takes SocksPorts out of a running pool (e.g. their Tor instance died).
+        `self.proxies` is changed in place, so holders of the list (HostProber)
+        stop using them too. Requests already in flight finish on their
+        sessions, which are closed with the pool.
+        """
+        for proxy in proxies:
+            if proxy not in self._sessions:
+                continue
+            self.proxies.remove(proxy)
+            for pooled in self._sessions.pop(proxy):
+                pooled.retired = True
+                self._retired_sessions.append(pooled)
+            self.scheduler.remove_proxy(proxy)
+
+    def _get_sessions_for_proxy(self, proxy):
+        """Lazily creates the sessions for a proxy (must run inside the loop)."""
+        sessions = self._sessions.setdefault(proxy, [])
+        while len(sessions) < self.sessions_per_proxy:
+            sessions.append(PooledSession(proxy, self.max_clients_per_session, self.curl_options))
+            self.sessions_created += 1
+        return sessions
+
+    def _remember_host(self, host, pooled):
+        if not host or pooled.retired:
+            return
+        self._host_affinity[host] = pooled
+        self._host_affinity.move_to_end(host)
+        if len(self._host_affinity) > MAX_HOST_AFFINITY_ENTRIES:
+            self._host_affinity.popitem(last=False)
+
+    def _pick(self, host, proxy=None):
+        """Chooses a session: host affinity first, then least-loaded on a proxy."""
+        pooled = self._host_affinity.get(host) if host else None
+        if (pooled is not None and pooled.has_capacity and not pooled.retired
+                and (proxy is None or pooled.proxy == proxy)
+                and self.scheduler.is_available(pooled.proxy)):
+            self.affinity_hits += 1
+            return pooled
+
+        if proxy is None or proxy not in self._sessions:
+            proxy = self.scheduler.choose()
+        sessions = self._get_sessions_for_proxy(proxy)
+        return min(sessions, key=lambda s: s.in_flight)
+
+    @asynccontextmanager
+    async def borrow(self, url, proxy=None, worker_id=None):
+        """
+        Async context manager yielding a SessionLease for `url`.
+        Usage:
+            async with pool.borrow(url, worker_id=worker_id) as lease:
+                await lease.session.get(url, proxy=lease.request_proxy, ...)
+        An exception escaping the block counts as a failure of the proxy.
+        """
+        if self._closed:
+            raise RuntimeError("SessionPool is closed.")
+
+        try:
+            host = urlparse(url).netloc
+        except Exception:
+            host = None
+
+        pooled = self._pick(host, proxy)
+        pooled.in_flight += 1
+        self.total_borrows += 1
+        self.scheduler.on_start(pooled.proxy)
+        request_proxy = self.isolation.proxy_for(pooled.proxy, worker_id, host) if self.isolation else None
+        lease = SessionLease(pooled, request_proxy)
+        ok = None # None = cancelled, not held against the proxy
+        try:
+            yield lease
+            ok = True
+        except Exception:
+            ok = False
+            raise
+        finally:
+            pooled.in_flight -= 1
+            pooled.requests_served += 1
+            self._remember_host(host, pooled)
+            finished_at = lease.response_at or time.monotonic()
+            if ok is None:
+                self.scheduler.on_cancel(pooled.proxy)
+            else:
+                self.scheduler.on_finish(pooled.proxy, finished_at - lease.started_at, ok)
+            if self.latency_tracker is not None and host and ok and lease.response_at is not None:
+                self.latency_tracker.record(host, ttfb=lease.response_at - lease.started_at,
+                                            connect=lease.connect_time, total=time.monotonic() - lease.started_at)
+
+    async def close(self):
+        """Closes every session. Safe to call more than once."""
+        if self._closed:
+            return
+        self._closed = True
+
+        all_sessions = [s for sessions in self._sessions.values() for s in sessions] + self._retired_sessions
+        results = await asyncio.gather(*[s.session.close() for s in all_sessions], return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logging.debug(f"Error closing pooled session: {result}")
+
+        self._sessions.clear()
+        self._retired_sessions.clear()
+        self._host_affinity.clear()
+        logging.info(f"[INFO] Session pool closed. {self.total_borrows} requests served by "
+                     f"{self.sessions_created} sessions ({self.affinity_hits} host-affinity reuses).")
@@ -0,0 +1,34 @@
+"""
+Throttled publishing of run-wide stats to the Network Activity viewer.
+
+The scheduler, hedging and transfer accounting objects update their numbers
+on every request but copy a snapshot into the shared stats dict at most once
+per PUBLISH_INTERVAL_SECONDS, so the GUI sees fresh numbers without the
+workers taking the stats lock on every response.
+"""
+
+import time
+
+PUBLISH_INTERVAL_SECONDS = 1.0
+
+
+class StatsPublisher:
+    """
+    Mixin: subclasses set `stats_key`, implement snapshot() and assign
+    stats_dict / stats_lock (both None when no viewer is attached).
+    """
+    stats_key = None
+    stats_dict = None
+    stats_lock = None
+    _last_publish = 0.0
+
+    def _publish(self, force=False):
+        if self.stats_dict is None or self.stats_lock is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_publish < PUBLISH_INTERVAL_SECONDS:
+            return
+        self._last_publish = now
+        snapshot = self.snapshot()
+        with self.stats_lock:
+            self.stats_dict[self.stats_key] = snapshot
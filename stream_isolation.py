@@ -0,0 +1,166 @@
+"""
+Tor stream isolation through SOCKS credentials.
+
+Tor's SocksPorts have IsolateSOCKSAuth on by default: streams that present
+different SOCKS username/password pairs never share a circuit. Without
+credentials every request on a SocksPort can end up multiplexed onto the
+same few circuits, so one slow circuit holds up many workers. SocksIsolation
+adds credentials to the proxy URL according to a policy:
+
+    none      - no credentials (Tor decides, as before)
+    worker    - one credential per worker
+    host      - one credential per target host
+    requests  - a new credential every N requests on each SocksPort
+
+The circuit monitor polls Tor's control port for the number of built
+circuits so the effect of a policy can be seen in the Network Activity
+window and the log.
+"""
+
+import asyncio
+import binascii
+import hashlib
+import logging
+import secrets
+from urllib.parse import urlsplit, urlunsplit
+
+from utils import get_tor_auth_cookie_path
+
+ISOLATION_NONE = 'none'
+ISOLATION_WORKER = 'worker'
+ISOLATION_HOST = 'host'
+ISOLATION_REQUESTS = 'requests'
+ISOLATION_POLICIES = (ISOLATION_NONE, ISOLATION_WORKER, ISOLATION_HOST, ISOLATION_REQUESTS)
+
+DEFAULT_REQUESTS_PER_CREDENTIAL = 50
+CIRCUIT_POLL_SECONDS = 10
+CIRCUIT_LOG_EVERY_POLLS = 6 # Log a summary about once a minute
+DEFAULT_CONTROL_PORTS = (9051,)
+
+
+class SocksIsolation:
+    """Builds the proxy URL (with or without credentials) for each request."""
+    def __init__(self, policy=ISOLATION_NONE, requests_per_credential=DEFAULT_REQUESTS_PER_CREDENTIAL):
+        if policy not in ISOLATION_POLICIES:
+            logging.warning(f"[ISOLATION] Unknown policy '{policy}'. Using '{ISOLATION_NONE}'.")
+            policy = ISOLATION_NONE
+        self.policy = policy
+        self.requests_per_credential = max(1, int(requests_per_credential))
+        # Fresh per run, so a new run never reuses the previous run's circuits
+        self.run_token = secrets.token_hex(4)
+        self._request_counts = {} # proxy -> requests (for the 'requests' policy)
+        self._groups = set()
+
+    @property
+    def enabled(self):
+        return self.policy != ISOLATION_NONE
+
+    def _isolation_key(self, proxy, worker_id, host):
+        if self.policy == ISOLATION_WORKER:
+            return f"w-{worker_id}"
+        if self.policy == ISOLATION_HOST:
+            # Hashed so arbitrary hostnames are safe inside a URL
+            return "h-" + hashlib.blake2b((host or "").encode('utf-8'), digest_size=8).hexdigest()
+        count = self._request_counts.get(proxy, 0)
+        self._request_counts[proxy] = count + 1
+        return f"n-{urlsplit(proxy).port}-{count // self.requests_per_credential}"
+
+    def proxy_for(self, proxy, worker_id=None, host=None):
+        """Returns `proxy` with isolation credentials added (unchanged for 'none')."""
+        if not self.enabled:
+            return proxy
+        key = self._isolation_key(proxy, worker_id, host)
+        self._groups.add(key)
+        parts = urlsplit(proxy)
+        netloc = f"{key}:{self.run_token}@{parts.hostname}:{parts.port}"
+        return urlunsplit((parts.scheme, netloc, parts.path, parts.query, parts.fragment))
+
+    def snapshot(self):
+        return {"policy": self.policy, "groups": len(self._groups)}
+
+
+async def _read_reply(reader):
+    """Reads one control-port reply (up to the final '250 ' / error line)."""
+    lines = []
+    while True:
+        line = (await reader.readline()).decode('utf-8', errors='replace').rstrip('\r\n')
+        if not line:
+            raise ConnectionError("Tor control connection closed.")
+        lines.append(line)
+        if len(line) >= 4 and line[:3].isdigit() and line[3] == ' ':
+            return lines
+
+async def query_circuit_status(control_port=9051, cookie_path=None, timeout=5.0):
+    """
+    Returns {'built': n, 'rendezvous': n, 'isolated': n} for one Tor instance,
+    where 'isolated' counts built circuits carrying a SOCKS username.
+    """
+    reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', control_port), timeout)
+    try:
+        auth_command = b'AUTHENTICATE ""\r\n'
+        cookie_path = cookie_path or get_tor_auth_cookie_path()
+        if cookie_path.exists():
+            auth_command = b'AUTHENTICATE ' + binascii.hexlify(cookie_path.read_bytes()) + b'\r\n'
+        writer.write(auth_command)
+        await writer.drain()
+        reply = await asyncio.wait_for(_read_reply(reader), timeout)
+        if not reply[-1].startswith('250'):
+            raise ConnectionError(f"Tor authentication failed: {reply[-1]}")
+
+        writer.write(b'GETINFO circuit-status\r\n')
+        await writer.drain()
+        reply = await asyncio.wait_for(_read_reply(reader), timeout)
+
+        counts = {"built": 0, "rendezvous": 0, "isolated": 0}
+        for line in reply:
+            fields = line.split()
+            if len(fields) < 2 or fields[1] != 'BUILT':
+                continue
+            counts["built"] += 1
+            if 'PURPOSE=HS_CLIENT_REND' in fields:
+                counts["rendezvous"] += 1
+            if any(field.startswith('SOCKS_USERNAME=') for field in fields):
+                counts["isolated"] += 1
+        return counts
+    finally:
+        writer.close()
+
+async def circuit_monitor(isolation, stats_dict, stats_lock, stop_event, control_ports=DEFAULT_CONTROL_PORTS,
+                          tor_pool=None):
+    """
+    Runs for the whole scraper run: every CIRCUIT_POLL_SECONDS, counts the
+    built circuits on every Tor instance and publishes them with the
+    isolation policy into stats_dict['circuits']. With a TorPool, the
+    instances are re-read on every poll; otherwise `control_ports` is used.
+    """
+    polls = 0
+    try:
+        while not stop_event.is_set():
+            totals = {"built": 0, "rendezvous": 0, "isolated": 0}
+            reachable = 0
+            if tor_pool is not None:
+                controllers = tor_pool.running_controllers()
+            else:
+                controllers = [(port, None) for port in control_ports]
+            for port, cookie_path in controllers:
+                try:
+                    counts = await query_circuit_status(port, cookie_path)
+                except Exception as e:
+                    logging.debug(f"[CIRCUITS] Could not query control port {port}: {e}")
+                    continue
+                reachable += 1
+                for key in totals:
+                    totals[key] += counts[key]
+
+            if reachable:
+                snapshot = {**totals, **isolation.snapshot()}
+                with stats_lock:
+                    stats_dict['circuits'] = snapshot
+                polls += 1
+                if polls % CIRCUIT_LOG_EVERY_POLLS == 1:
+                    logging.info(f"[CIRCUITS] {totals['built']} built ({totals['rendezvous']} onion rendezvous, "
+                                 f"{totals['isolated']} isolated) | isolation '{isolation.policy}': "
+                                 f"{snapshot['groups']} credential groups used")
+            await asyncio.sleep(CIRCUIT_POLL_SECONDS)
+    except asyncio.CancelledError:
+        logging.info("Circuit monitor task was cancelled.")
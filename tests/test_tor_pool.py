@@ -0,0 +1,131 @@
+"""
+TorPool supervision and follow_tor_pool against a stand-in tor executable.
+
+The stand-in reads its torrc, serves a control port that accepts any
+AUTHENTICATE and reports a finished bootstrap, and exits with code 1 once a
+file named `exit` appears in its DataDirectory.
+"""
+
+import asyncio
+import socket
+import stat
+import sys
+import time
+
+import pytest
+
+import tor_pool
+from tor_pool import STATE_FAILED, STATE_READY, TorPool, follow_tor_pool
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="the stand-in tor is a script with a shebang")
+
+FAKE_TOR = '''#!{python}
+import pathlib, socket, sys
+conf = {{}}
+for line in pathlib.Path(sys.argv[2]).read_text().splitlines():
+    key, _, value = line.partition(" ")
+    conf.setdefault(key, value)
+exit_file = pathlib.Path(conf["DataDirectory"]) / "exit"
+server = socket.create_server(("127.0.0.1", int(conf["ControlPort"])))
+server.settimeout(0.1)
+while not exit_file.exists():
+    try:
+        conn, _ = server.accept()
+    except socket.timeout:
+        continue
+    with conn:
+        conn.recv(1024)
+        conn.sendall(b"250 OK\\r\\n")
+        conn.recv(1024)
+        conn.sendall(b'250-status/bootstrap-phase=NOTICE BOOTSTRAP PROGRESS=100 TAG=done SUMMARY="Done"\\r\\n250 OK\\r\\n')
+sys.exit(1)
+'''
+
+
+def _free_port_pair():
+    """A port p with p and p + 1 both free (control ports of two instances)."""
+    for _ in range(50):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        try:
+            with socket.socket() as s:
+                s.bind(("127.0.0.1", port + 1))
+        except OSError:
+            continue
+        return port
+    pytest.skip("no two adjacent free ports")
+
+
+def _wait_for(condition, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    monkeypatch.setattr(tor_pool, "CONTROL_PORT_BASE", _free_port_pair())
+    monkeypatch.setattr(tor_pool, "MAX_INSTANCE_RESTARTS", 0)
+    tor_dir = tmp_path / "tor"
+    (tor_dir / "Data").mkdir(parents=True)
+    (tor_dir / "Data" / "geoip").write_text("")
+    (tor_dir / "Data" / "geoip6").write_text("")
+    tor_exe = tor_dir / "tor.exe"
+    tor_exe.write_text(FAKE_TOR.format(python=sys.executable))
+    tor_exe.chmod(tor_exe.stat().st_mode | stat.S_IXUSR)
+
+    pool = TorPool(tmp_path, instance_count=2, socks_ports_per_instance=3)
+    assert pool.write_torrc_files()
+    yield pool
+    pool.terminate()
+
+
+def _launch(pool):
+    pool.launch()
+    assert _wait_for(lambda: len(pool.running_instances()) == 2), "stand-in tor instances did not bootstrap"
+
+
+def test_instance_that_dies_is_given_up_on(pool):
+    _launch(pool)
+    dead = pool.instances[1]
+    (dead.data_dir / "exit").write_text("")
+
+    assert _wait_for(lambda: dead.state == STATE_FAILED)
+    assert pool.instances[0].state == STATE_READY
+    assert pool.running_proxies() == pool.instances[0].proxies
+    assert dead.process is None
+
+
+def test_follow_tor_pool_drops_ports_of_dead_instance(pool):
+    session_pool = pytest.importorskip("session_pool")
+    host_probe = pytest.importorskip("host_probe")
+    host_state = pytest.importorskip("host_state")
+
+    _launch(pool)
+    sessions = session_pool.SessionPool(pool.running_proxies())
+    prober = host_probe.HostProber(host_state.HostCircuitBreaker(), sessions.proxies)
+    dead = pool.instances[1]
+
+    async def run():
+        stop_event = asyncio.Event()
+        follower = asyncio.create_task(follow_tor_pool(pool, sessions, stop_event, poll_seconds=0.1))
+        (dead.data_dir / "exit").write_text("")
+        for _ in range(150):
+            if not set(dead.proxies) & set(sessions.proxies):
+                break
+            await asyncio.sleep(0.1)
+        stop_event.set()
+        await follower
+        await sessions.close()
+
+    asyncio.run(run())
+
+    live = pool.instances[0].proxies
+    assert sessions.proxies == live
+    assert set(sessions.scheduler.stats) == set(live)
+    assert {sessions.scheduler.choose() for _ in range(50)} <= set(live)
+    assert {prober._next_proxy()[1] for _ in range(10)} == set(pool.instances[0].socks_ports)
@@ -0,0 +1,351 @@
+"""
+A pool of tor processes, each with its own DataDirectory, ControlPort and
+block of SocksPorts.
+
+One tor process does its relay crypto on essentially one core, which caps
+how much traffic a single instance can carry. TorPool launches N instances
+from generated torrc files and supervises each one's bootstrap on its own
+thread (restarting it if it dies), so a slow or broken instance never holds
+up the others. The scraper takes its proxy list from the instances that are
+running, and `follow_tor_pool` keeps it in step during a run: instances
+that finish bootstrapping join it, instances that die leave it.
+
+Port layout for instance i (ports_per_instance = P):
+    ControlPort  9051 + i
+    SocksPort    9100 + i*P ... 9100 + i*P + P - 1
+Instance 0 keeps the original `tor/torrc` and `tor/tor_data`, so the
+single-instance default is unchanged.
+"""
+
+import asyncio
+import binascii
+import logging
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+# --- Layout ---
+CONTROL_PORT_BASE = 9051
+SOCKS_PORT_BASE = 9100
+DEFAULT_TOR_INSTANCES = 1
+DEFAULT_SOCKS_PORTS_PER_INSTANCE = 7
+MAX_TOR_INSTANCES = 16 # Keeps control ports (9051-9066) below the SocksPort range
+MAX_SOCKS_PORTS_PER_INSTANCE = 32
+
+# --- Supervision ---
+BOOTSTRAP_TIMEOUT_SECONDS = 120
+MAX_INSTANCE_RESTARTS = 2
+FOLLOW_POLL_SECONDS = 5
+
+STATE_STOPPED = 'stopped'
+STATE_BOOTSTRAPPING = 'bootstrapping'
+STATE_READY = 'ready'
+STATE_FAILED = 'failed'
+
+
+class TorControlError(Exception):
+    """The control port answered, but refused a command (e.g. authentication)."""
+
+
+def proxy_url(port):
+    return f'socks5h://127.0.0.1:{port}'
+
+
+class TorInstance:
+    """One tor process of the pool: its ports, paths and supervision state."""
+    def __init__(self, index, tor_dir, socks_ports_per_instance):
+        self.index = index
+        self.tor_dir = tor_dir
+        self.control_port = CONTROL_PORT_BASE + index
+        first_port = SOCKS_PORT_BASE + index * socks_ports_per_instance
+        self.socks_ports = list(range(first_port, first_port + socks_ports_per_instance))
+        suffix = "" if index == 0 else f"_{index}"
+        self.data_dir = tor_dir / f"tor_data{suffix}"
+        self.torrc_path = tor_dir / f"torrc{suffix}"
+        self.process = None
+        self.state = STATE_STOPPED
+        self.restarts = 0
+
+    @property
+    def name(self):
+        return f"tor#{self.index}"
+
+    @property
+    def cookie_path(self):
+        return self.data_dir / "control_auth_cookie"
+
+    @property
+    def proxies(self):
+        return [proxy_url(port) for port in self.socks_ports]
+
+    def torrc_content(self, geoip_path, geoip6_path):
+        def as_posix(path):
+            return str(path.resolve()).replace('\\', '/')
+
+        lines = [
+            f"DataDirectory {as_posix(self.data_dir)}",
+            f"GeoIPFile {as_posix(geoip_path)}",
+            f"GeoIPv6File {as_posix(geoip6_path)}",
+        ]
+        lines += [f"SocksPort {port}" for port in self.socks_ports]
+        lines += [
+            f"ControlPort {self.control_port}",
+            "CookieAuthentication 1",
+            f"Log info file {as_posix(self.data_dir / 'tor_log.txt')}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def authenticate(self, sock):
+        """Sends AUTHENTICATE (cookie if present) and returns Tor's reply."""
+        auth_command = b'AUTHENTICATE ""\r\n'
+        if self.cookie_path.exists():
+            try:
+                auth_command = b'AUTHENTICATE ' + binascii.hexlify(self.cookie_path.read_bytes()) + b'\r\n'
+            except Exception as e:
+                logging.warning(f"[TOR] Could not read auth cookie for {self.name}: {e}. Falling back.")
+        sock.sendall(auth_command)
+        return sock.recv(1024)
+
+    def send_command(self, command, timeout=10):
+        """Authenticates on the control port, sends one command and returns the reply text."""
+        with socket.create_connection(("127.0.0.1", self.control_port), timeout=timeout) as s:
+            auth_reply = self.authenticate(s)
+            if b"250 OK" not in auth_reply:
+                raise TorControlError(f"Tor authentication failed: {auth_reply.decode(errors='replace').strip()}")
+            s.sendall(command.encode('ascii') + b'\r\n')
+            return s.recv(1024).decode(errors='replace')
+
+
+class TorPool:
+    """Launches and supervises every tor instance. Thread-safe."""
+    def __init__(self, script_dir, instance_count=DEFAULT_TOR_INSTANCES,
+                 socks_ports_per_instance=DEFAULT_SOCKS_PORTS_PER_INSTANCE):
+        self.tor_dir = script_dir / "tor"
+        instance_count = min(MAX_TOR_INSTANCES, max(1, int(instance_count)))
+        socks_ports_per_instance = min(MAX_SOCKS_PORTS_PER_INSTANCE, max(1, int(socks_ports_per_instance)))
+        self.instances = [TorInstance(i, self.tor_dir, socks_ports_per_instance) for i in range(instance_count)]
+        self.first_ready = threading.Event()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._on_first_ready = None
+
+    @property
+    def tor_exe_path(self):
+        return self.tor_dir / "tor.exe"
+
+    # --- Configuration ---
+
+    def write_torrc_files(self, overwrite_auto=False):
+        """
+        Writes one torrc per instance. Instance 0's torrc is only rewritten if
+        it is missing or `overwrite_auto` is set (as before); the extra
+        instances' files are generated and always rewritten.
+        Returns True on success, False on failure.
+        """
+        geoip_path = self.tor_dir / "Data" / "geoip"
+        geoip6_path = self.tor_dir / "Data" / "geoip6"
+        try:
+            for instance in self.instances:
+                instance.data_dir.mkdir(parents=True, exist_ok=True)
+                if instance.index == 0 and not overwrite_auto and instance.torrc_path.exists():
+                    logging.info(f"Using existing torrc file at: {instance.torrc_path}")
+                    existing = instance.torrc_path.read_text(errors='replace')
+                    missing = [p for p in instance.socks_ports if f"SocksPort {p}" not in existing]
+                    if missing:
+                        logging.warning(f"[TOR] {instance.torrc_path} has no SocksPort for {missing}. "
+                                        f"Delete it (or enable torrc overwrite) after changing socks_ports_per_instance.")
+                    continue
+                instance.torrc_path.write_text(instance.torrc_content(geoip_path, geoip6_path))
+                logging.info(f"[SUCCESS] Configured torrc file at: {instance.torrc_path}")
+        except Exception as e:
+            logging.critical(f"[FATAL] Failed to write torrc file: {e}. Check permissions.")
+            return False
+
+        if not geoip_path.exists() or not geoip6_path.exists():
+            logging.critical(f"[FATAL] Tor GeoIP files not found in {self.tor_dir / 'Data'}")
+            return False
+        return True
+
+    # --- Supervision ---
+
+    def launch(self, on_first_ready=None):
+        """Starts one supervisor thread per instance. `on_first_ready()` runs once, on the first bootstrap."""
+        if not self.tor_exe_path.exists():
+            logging.critical(f"[FATAL] 'tor.exe' not found at expected path: {self.tor_exe_path}")
+            return
+        self._on_first_ready = on_first_ready
+        self._stopping.clear()
+        logging.info(f"[TOR] Launching {len(self.instances)} Tor instance(s) from: {self.tor_exe_path}")
+        for instance in self.instances:
+            threading.Thread(target=self._supervise, args=(instance,), daemon=True,
+                             name=f"TorSupervisor-{instance.index}").start()
+
+    def _start_process(self, instance):
+        if not instance.torrc_path.exists():
+            raise FileNotFoundError(f"'torrc' not found at: {instance.torrc_path}")
+        process = subprocess.Popen(
+            [str(self.tor_exe_path), "-f", str(instance.torrc_path)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding='utf-8',
+            creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
+        )
+        instance.process = process
+        logging.info(f"[TOR] {instance.name} launched (PID: {process.pid}, control port "
+                     f"{instance.control_port}, SocksPorts {instance.socks_ports[0]}-{instance.socks_ports[-1]}).")
+        return process
+
+    def _wait_for_bootstrap(self, instance, process):
+        """Polls the instance's control port once a second. Returns True once it reports PROGRESS=100."""
+        for i in range(BOOTSTRAP_TIMEOUT_SECONDS):
+            time.sleep(1)
+            if self._stopping.is_set():
+                return False
+            if process.poll() is not None:
+                logging.warning(f"[TOR] {instance.name} exited during bootstrap (code {process.returncode}).")
+                return False
+            try:
+                status_reply = instance.send_command('GETINFO status/bootstrap-phase', timeout=1)
+            except TorControlError as e:
+                logging.warning(f"[TOR] {instance.name}: {e}. Retrying...")
+                continue
+            except OSError:
+                if i % 10 == 0:
+                    logging.info(f"Waiting for {instance.name} control port {instance.control_port} to open...")
+                continue
+
+            if "PROGRESS=100" in status_reply:
+                return True
+            progress_line = [line for line in status_reply.split('\n') if "BOOTSTRAP PROGRESS=" in line]
+            if progress_line:
+                progress = progress_line[0].split('SUMMARY=')[-1].strip().replace('"', '')
+                logging.info(f"[Tor Bootstrap] {instance.name}: {progress}")
+
+        logging.warning(f"[TOR] Timed out after {BOOTSTRAP_TIMEOUT_SECONDS}s waiting for {instance.name} to bootstrap.")
+        return False
+
+    def _supervise(self, instance):
+        """Runs one instance: launch, wait for bootstrap, watch for exit, restart a limited number of times."""
+        while not self._stopping.is_set():
+            try:
+                instance.state = STATE_BOOTSTRAPPING
+                process = self._start_process(instance)
+                if self._wait_for_bootstrap(instance, process):
+                    with self._lock:
+                        instance.state = STATE_READY
+                    logging.info(f"[SUCCESS] {instance.name} has fully bootstrapped.")
+                    self._notify_ready()
+                    process.wait()
+                    if self._stopping.is_set():
+                        break
+                    logging.warning(f"[TOR] {instance.name} exited (code {process.returncode}).")
+            except Exception as e:
+                logging.error(f"[ERROR] Error running {instance.name}: {e}")
+                logging.error(traceback.format_exc())
+
+            with self._lock:
+                instance.state = STATE_FAILED
+            self._stop_process(instance)
+            if self._stopping.is_set():
+                break
+            if instance.restarts >= MAX_INSTANCE_RESTARTS:
+                logging.error(f"[TOR] Giving up on {instance.name} after {instance.restarts} restarts.")
+                return
+            instance.restarts += 1
+            logging.info(f"[TOR] Restarting {instance.name} (restart {instance.restarts}/{MAX_INSTANCE_RESTARTS}).")
+
+        with self._lock:
+            instance.state = STATE_STOPPED
+
+    def _notify_ready(self):
+        with self._lock:
+            if self.first_ready.is_set():
+                return
+            self.first_ready.set()
+        if self._on_first_ready:
+            self._on_first_ready()
+
+    # --- Queries (safe from any thread) ---
+
+    def running_instances(self):
+        with self._lock:
+            return [instance for instance in self.instances if instance.state == STATE_READY]
+
+    def running_proxies(self):
+        """SocksPort URLs of every bootstrapped instance."""
+        return [proxy for instance in self.running_instances() for proxy in instance.proxies]
+
+    def running_controllers(self):
+        """(control_port, cookie_path) of every bootstrapped instance."""
+        return [(instance.control_port, instance.cookie_path) for instance in self.running_instances()]
+
+    def first_process(self):
+        """The Popen of the lowest-numbered running instance, or None."""
+        for instance in self.instances:
+            if instance.process is not None and instance.process.poll() is None:
+                return instance.process
+        return None
+
+    # --- Control ---
+
+    def request_new_identity(self):
+        """Sends SIGNAL NEWNYM to every running instance."""
+        instances = self.running_instances()
+        if not instances:
+            logging.error("Could not request a new identity: no Tor instance is running.")
+            return
+        logging.info(f"Requesting new Tor identity (SIGNAL NEWNYM) on {len(instances)} instance(s)...")
+        for instance in instances:
+            try:
+                reply = instance.send_command('SIGNAL NEWNYM')
+                if "250 OK" in reply:
+                    logging.info(f"[SUCCESS] New Tor identity acquired on {instance.name}.")
+                else:
+                    logging.warning(f"NEWNYM signal failed on {instance.name}: {reply.strip()}")
+            except Exception as e:
+                logging.error(f"Could not connect to Tor control port ({instance.control_port}): {e}")
+
+    def _stop_process(self, instance):
+        process, instance.process = instance.process, None
+        if process is not None and process.poll() is None:
+            process.terminate()
+
+    def terminate(self):
+        """Stops every instance and its supervisor."""
+        self._stopping.set()
+        for instance in self.instances:
+            if instance.process is not None:
+                logging.info(f"[INFO] Terminating {instance.name}...")
+            self._stop_process(instance)
+            with self._lock:
+                instance.state = STATE_STOPPED
+
+
+async def follow_tor_pool(tor_pool, session_pool, stop_event, poll_seconds=FOLLOW_POLL_SECONDS):
+    """
+    Runs for the whole scraper run: adds the SocksPorts of Tor instances that
+    finish bootstrapping after the run started to the session pool, and
+    removes those of instances that died (restarting or given up on). While
+    no instance is running the pool is left as it is, so it never runs empty.
+    """
+    try:
+        while not stop_event.is_set():
+            running = tor_pool.running_proxies()
+            if running:
+                dead_proxies = [p for p in session_pool.proxies if p not in running]
+                if dead_proxies:
+                    session_pool.remove_proxies(dead_proxies)
+                    logging.warning(f"[TOR] {len(dead_proxies)} SocksPorts left the run, their Tor instance is down "
+                                    f"({len(session_pool.proxies)} in use).")
+                new_proxies = [p for p in running if p not in session_pool.proxies]
+                if new_proxies:
+                    session_pool.add_proxies(new_proxies)
+                    logging.info(f"[TOR] {len(new_proxies)} SocksPorts joined the run "
+                                 f"({len(session_pool.proxies)} in use).")
+            await asyncio.sleep(poll_seconds)
+    except asyncio.CancelledError:
+        logging.info("Tor pool follower task was cancelled.")
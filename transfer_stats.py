@@ -0,0 +1,90 @@
+"""
+Compression negotiation and on-the-wire byte accounting.
+
+Bandwidth through Tor is the scarce resource, so every page request asks
+for a compressed response (gzip, deflate, br, and zstd when the bundled
+libcurl supports it) and curl decodes it on the fly. TransferStats adds up
+the bytes that actually came through Tor ("wire") and the decoded bytes
+handed to the parser, so the Network Activity window and the end-of-run
+log show how much bandwidth compression saved.
+"""
+
+import functools
+import logging
+
+from stats_publisher import StatsPublisher
+
+BASE_ACCEPT_ENCODING = ("gzip", "deflate", "br")
+
+
+@functools.lru_cache(maxsize=1)
+def negotiated_accept_encoding():
+    """The Accept-Encoding value to send: the base set, plus zstd if libcurl was built with it."""
+    encodings = list(BASE_ACCEPT_ENCODING)
+    try:
+        from curl_cffi import Curl
+        curl = Curl()
+        try:
+            version = curl.version().decode('ascii', errors='replace').lower()
+        finally:
+            curl.close()
+        if "zstd/" in version:
+            encodings.append("zstd")
+    except Exception as e:
+        logging.debug(f"[TRANSFER] Could not read the libcurl version: {e}")
+    return ", ".join(encodings)
+
+
+class TransferStats(StatsPublisher):
+    """Run-wide totals of wire vs. decoded page bytes. Runs on the scraper's event loop thread."""
+    stats_key = 'transfer'
+
+    def __init__(self, stats_dict=None, stats_lock=None):
+        self.stats_dict = stats_dict
+        self.stats_lock = stats_lock
+
+        self.responses = 0
+        self.compressed_responses = 0
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+        self.by_encoding = {} # Content-Encoding -> responses
+
+    def record(self, wire_bytes, decoded_bytes, content_encoding=None):
+        """Adds one response. `wire_bytes` falls back to the decoded size if curl could not report it."""
+        if wire_bytes is None:
+            wire_bytes = decoded_bytes
+        self.responses += 1
+        self.wire_bytes += wire_bytes
+        self.decoded_bytes += decoded_bytes
+        encoding = (content_encoding or "identity").strip().lower()
+        if encoding != "identity":
+            self.compressed_responses += 1
+        self.by_encoding[encoding] = self.by_encoding.get(encoding, 0) + 1
+        self._publish()
+
+    @property
+    def saved_ratio(self):
+        if not self.decoded_bytes:
+            return 0.0
+        return max(0.0, 1.0 - self.wire_bytes / self.decoded_bytes)
+
+    def snapshot(self):
+        return {
+            "responses": self.responses,
+            "compressed_responses": self.compressed_responses,
+            "wire_bytes": self.wire_bytes,
+            "decoded_bytes": self.decoded_bytes,
+            "saved_ratio": self.saved_ratio,
+        }
+
+    def summary(self):
+        encodings = ", ".join(f"{name}: {count}" for name, count in
+                              sorted(self.by_encoding.items(), key=lambda item: -item[1]))
+        return (f"{self.wire_bytes:,} B on the wire for {self.decoded_bytes:,} B of pages "
+                f"({self.saved_ratio:.0%} saved) | {self.compressed_responses}/{self.responses} "
+                f"responses compressed ({encodings or 'none'})")
+
+    def close(self):
+        self._publish(force=True)
+        if self.responses:
+            logging.info(f"[TRANSFER] {self.summary()}.")
@@ -15,6 +15,7 @@ import json
 import logging
 import sqlite3
 import binascii
+import functools
 import re2 as re # <-- MODIFIED: Using re2
 import shutil
 import importlib.util # <-- ADDED for robust package checking
@@ -64,14 +65,18 @@ SCRIPT_DIR = get_script_dir()
 JUNK_URL_REGEX = re.compile(r'(.)\1{7,}')
 # --- END FIX ---
 
+@functools.lru_cache(maxsize=65536)
+def is_junk_netloc(netloc):
+    """Checks a domain (netloc) for the repetitive pattern. Cached: link farms repeat their hosts."""
+    return JUNK_URL_REGEX.search(netloc) is not None
+
 def is_junk_url(url):
     """Checks if a URL is likely junk based on repetitive characters in the domain."""
     if not url:
         return False
     try:
         # We only check the domain part (netloc) for the repetitive pattern
-        netloc = urlparse(url).netloc
-        if JUNK_URL_REGEX.search(netloc):
+        if is_junk_netloc(urlparse(url).netloc):
             return True
     except Exception:
         return False # Fail-safe on malformed URLs
@@ -109,6 +114,8 @@ MODE_PULL_KEYWORDS = 2
 # --- END MODE Constants ---
 
 # --- Scraper Constants ---
+# SocksPorts of a single default Tor instance. A running TorPool (tor_pool.py)
+# supplies the real list; this is the fallback when there is none.
 PROXIES = [
     'socks5h://127.0.0.1:9100', 'socks5h://127.0.0.1:9101', 'socks5h://127.0.0.1:9102',
     'socks5h://127.0.0.1:9103', 'socks5h://127.0.0.1:9104', 'socks5h://127.0.0.1:9105',